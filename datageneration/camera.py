@@ -0,0 +1,56 @@
+import numpy as np
+
+# NumPy version of the camera set up in init_scene of main_part1 and of the
+# projection of get_bone_locs, written with the computer vision camera
+# matrices of misc/3Dto2D (K * [R|t] reproduces the saved joints2D).
+
+# rotation part of cam_ob.matrix_world set in init_scene
+cam_rot = np.array(((0., 0., 1.),
+                    (0., -1., 0.),
+                    (-1., 0., 0.)))
+cam_lens = 60          # cam_ob.data.lens
+cam_sensor_width = 32  # cam_ob.data.sensor_width
+
+# Blender camera (looking along -z, y up) to computer vision camera
+R_bcam2cv = np.array(((1., 0., 0.),
+                      (0., -1., 0.),
+                      (0., 0., -1.)))
+
+
+# intrinsic camera matrix (3, 3), as getIntrinsicBlender.m
+# render_size: (resolution_x, resolution_y) in pixels, i.e. (resy, resx) in config
+def intrinsic(render_size, lens=cam_lens, sensor_width=cam_sensor_width):
+    res_x_px, res_y_px = render_size
+    # sensor_fit AUTO: the sensor width spans the largest image dimension
+    f_px = float(lens) * max(res_x_px, res_y_px) / sensor_width
+    return(np.array(((f_px, 0., res_x_px / 2.),
+                     (0., f_px, res_y_px / 2.),
+                     (0., 0., 1.))))
+
+
+# extrinsic camera matrices (..., 3, 4) for camera locations (..., 3), as getExtrinsicBlender.m
+def extrinsic(cam_loc, rot=cam_rot):
+    cam_loc = np.asarray(cam_loc, dtype=np.float64)
+    R_world2bcam = rot.T
+    T_world2bcam = -cam_loc.dot(R_world2bcam.T)
+    R_world2cv = R_bcam2cv.dot(R_world2bcam)
+    T_world2cv = T_world2bcam.dot(R_bcam2cv.T)
+    RT = np.empty(cam_loc.shape[:-1] + (3, 4))
+    RT[..., :3] = R_world2cv
+    RT[..., 3] = T_world2cv
+    return(RT)
+
+
+# pixel coordinates of points (..., 3) in world coordinates seen from a camera
+# at cam_loc, rounded as in get_bone_locs -> (..., 2)
+def project(points, cam_loc, render_size, lens=cam_lens, sensor_width=cam_sensor_width):
+    RT = extrinsic(cam_loc)
+    K = intrinsic(render_size, lens, sensor_width)
+    points = np.asarray(points, dtype=np.float64)
+    if RT.ndim == 2:
+        co_cam = points.dot(RT[:, :3].T) + RT[:, 3]
+    else:
+        # one camera per leading index of points[..., k, :], e.g. per frame
+        co_cam = np.einsum('...ij,...kj->...ki', RT[..., :3], points) + RT[..., None, :, 3]
+    co_2d = co_cam.dot(K.T)
+    return(np.round(co_2d[..., :2] / co_2d[..., 2:]))
@@ -0,0 +1,73 @@
+import bpy
+import numpy as np
+
+# Clip-level keyframing: instead of one keyframe_insert per channel and per
+# frame, every F-curve of the clip is created once and filled in bulk with
+# keyframe_points.add + foreach_set. The curves hold the same keys as the
+# per-frame keyframe_insert calls of apply_trans_pose_shape.
+
+
+def new_action(id_data, name):
+    id_data.animation_data_clear()
+    id_data.animation_data_create()
+    action = bpy.data.actions.new(name)
+    id_data.animation_data.action = action
+    return(action)
+
+
+# write one key per frame into the F-curves of data_path
+# values: (nframes, nchannels), one F-curve per channel (array index)
+def keyframe_bulk(action, data_path, frames, values, group=''):
+    values = np.asarray(values, dtype=np.float32).reshape(len(frames), -1)
+    co = np.empty(2*len(frames), dtype=np.float32)
+    co[0::2] = frames
+    for index in range(values.shape[1]):
+        fcu = action.fcurves.new(data_path, index=index, action_group=group)
+        fcu.keyframe_points.add(len(frames))
+        co[1::2] = values[:, index]
+        fcu.keyframe_points.foreach_set('co', co)
+        fcu.keyframe_points.foreach_set('handle_left', co)
+        fcu.keyframe_points.foreach_set('handle_right', co)
+        # sort the keys and compute the auto-clamped handles, as keyframe_insert
+        fcu.update()
+
+
+# animate the armature and the shape keys for a whole clip
+# frames: (N,) frame numbers
+# trans: (N, 3) pelvis translations
+# quats: (N, 24, 4) bone rotations (as given by batch_rodrigues2bshapes)
+# pose_bshapes: (N, 207) pose blendshape weights
+# shapes: (N, n_sh_bshapes) shape blendshape weights
+# root_quat: (4,) rotation of the root bone (the z-rotation of the clip)
+def build_clip_animation(ob, arm_ob, obname, part_match, frames, trans, quats,
+                         pose_bshapes, shapes, root_quat):
+    nframes = len(frames)
+    arm_action = new_action(arm_ob, '%s_clip' % arm_ob.name)
+
+    # root: constant location and z-rotation on every frame
+    root = arm_ob.pose.bones[obname+'_root']
+    keyframe_bulk(arm_action, root.path_from_id('location'), frames,
+                  np.tile(np.asarray(root.location), (nframes, 1)), root.name)
+    keyframe_bulk(arm_action, root.path_from_id('rotation_quaternion'), frames,
+                  np.tile(np.asarray(root_quat), (nframes, 1)), root.name)
+
+    # bones: rotation from the pose, location set to trans for the pelvis only
+    for ibone in range(24):
+        bone = arm_ob.pose.bones[obname+'_'+part_match['bone_%02d' % ibone]]
+        keyframe_bulk(arm_action, bone.path_from_id('rotation_quaternion'), frames,
+                      quats[:, ibone], bone.name)
+        if ibone == 0:
+            locations = trans
+        else:
+            locations = np.tile(np.asarray(bone.location), (nframes, 1))
+        keyframe_bulk(arm_action, bone.path_from_id('location'), frames, locations, bone.name)
+
+    # pose and shape blendshapes
+    key = ob.data.shape_keys
+    key_action = new_action(key, '%s_clip' % key.name)
+    for ibshape in range(pose_bshapes.shape[1]):
+        keyframe_bulk(key_action, key.key_blocks['Pose%03d' % ibshape].path_from_id('value'),
+                      frames, pose_bshapes[:, ibshape])
+    for ibshape in range(shapes.shape[1]):
+        keyframe_bulk(key_action, key.key_blocks['Shape%03d' % ibshape].path_from_id('value'),
+                      frames, shapes[:, ibshape])
@@ -0,0 +1,186 @@
+import os
+import re
+from os.path import exists
+import numpy as np
+from pass_codecs import pass_codecs, encode, decode
+
+# Output of the passes decoded by main_part2 (normal, gtflow, depth, segm),
+# selected with output_backend in config:
+#   'mat'  : <clip>_normal.mat, <clip>_gtflow.mat, ... with one normal_%d, ...
+#            variable per frame (1-indexed), written at the end of the clip
+#   'hdf5' : <clip>.h5 with one dataset per pass of shape (N, H, W[, C]),
+#            compressed and chunked per frame, written frame by frame
+# where <clip> is e.g. <output_path>/run0/02_01/02_01_c0001.
+# With pass_encoding = 'compact' (see pass_codecs.py), the .mat files hold the
+# encoded normals of each frame (normal_%d_mask, normal_%d_values) with the
+# codec and frame shape in normal_encoding and normal_shape, and the .h5 stores
+# them as float16; the other passes are stored as with 'dense'.
+# ClipReader reads one frame of a pass from either layout:
+#
+#   reader = ClipReader('/home/local/data/cmc/synthetic/run0/02_01/02_01_c0001')
+#   depth = reader.frame('depth', 16) # depth_17 of the .mat file
+
+output_backends = ('mat', 'hdf5')
+pass_encodings = ('dense', 'compact')
+exr_passes = ('normal', 'gtflow', 'depth', 'segm')
+
+
+def mat_path(clip_prefix, k):
+    return('%s_%s.mat' % (clip_prefix, k))
+
+
+def hdf5_path(clip_prefix):
+    return('%s.h5' % clip_prefix)
+
+
+# legacy layout: the frames are kept until close() writes the four .mat files
+# concurrently (zlib releases the GIL)
+class MatClipWriter(object):
+    def __init__(self, clip_prefix, nframes, encoding='dense'):
+        self.clip_prefix = clip_prefix
+        self.encoding = encoding
+        self.dicts = {k: {} for k in exr_passes}
+
+    def write_frame(self, iframe, mats):
+        for k, mat in mats.items():
+            var_name = '%s_%d' % (k, iframe + 1) # +1 for the 1-indexing
+            if self.encoding == 'compact' and k in pass_codecs:
+                if len(self.dicts[k]) == 0:
+                    self.dicts[k]['%s_encoding' % k] = pass_codecs[k]
+                    self.dicts[k]['%s_shape' % k] = np.array(mat.shape, dtype=np.uint32)
+                for field, arr in encode(k, mat).items():
+                    self.dicts[k]['%s_%s' % (var_name, field)] = arr
+            else:
+                self.dicts[k][var_name] = mat
+
+    def close(self):
+        import scipy.io
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(len(exr_passes))
+        pool.map(lambda k: scipy.io.savemat(mat_path(self.clip_prefix, k), self.dicts[k], do_compression=True),
+                 exr_passes)
+        pool.close()
+        pool.join()
+
+
+# one dataset per pass, created with the shape and dtype of its first frame;
+# each frame is compressed into its own chunk as soon as it is written
+class Hdf5ClipWriter(object):
+    def __init__(self, clip_prefix, nframes, encoding='dense', compression_opts=4):
+        import h5py
+        self.nframes = nframes
+        self.encoding = encoding
+        self.compression_opts = compression_opts
+        self.tmp_path = hdf5_path(clip_prefix) + '.tmp'
+        self.path = hdf5_path(clip_prefix)
+        self.h5 = h5py.File(self.tmp_path, 'w')
+
+    def write_frame(self, iframe, mats):
+        for k, mat in mats.items():
+            if self.encoding == 'compact' and k == 'normal':
+                mat = mat.astype(np.float16)
+            if k not in self.h5:
+                self.h5.create_dataset(k, shape=(self.nframes,) + mat.shape, dtype=mat.dtype,
+                                       chunks=(1,) + mat.shape, compression='gzip',
+                                       compression_opts=self.compression_opts, shuffle=True)
+            self.h5[k][iframe] = mat
+
+    # the .h5 only appears once complete
+    def close(self):
+        self.h5.attrs['nframes'] = self.nframes
+        self.h5.close()
+        os.rename(self.tmp_path, self.path)
+
+
+def clip_writer(backend, clip_prefix, nframes, encoding='dense'):
+    if encoding not in pass_encodings:
+        raise ValueError('unknown pass encoding %r, expected one of %s' % (encoding, pass_encodings))
+    if backend == 'mat':
+        return(MatClipWriter(clip_prefix, nframes, encoding))
+    elif backend == 'hdf5':
+        return(Hdf5ClipWriter(clip_prefix, nframes, encoding))
+    raise ValueError('unknown output backend %r, expected one of %s' % (backend, output_backends))
+
+
+# float16 normals of a compact .h5 are read as float32, as from the .mat files
+def as_float32(arr):
+    return(arr.astype(np.float32) if arr.dtype == np.float16 else arr)
+
+
+# random access to the frames of a clip, iframe is 0-indexed (frame iframe + 1
+# of the .mat files); the .h5 is used if present, the .mat files otherwise
+class ClipReader(object):
+    def __init__(self, clip_prefix):
+        self.clip_prefix = clip_prefix
+        self.h5 = None
+        if exists(hdf5_path(clip_prefix)):
+            import h5py
+            self.h5 = h5py.File(hdf5_path(clip_prefix), 'r')
+        self._mat_names = {}
+        self._mat_codecs = {}
+
+    # variable names of a .mat file, from the variable headers only
+    def mat_names(self, k):
+        if k not in self._mat_names:
+            import scipy.io
+            path = mat_path(self.clip_prefix, k)
+            names = [var[0] for var in scipy.io.whosmat(path)] if exists(path) else []
+            self._mat_names[k] = set(names)
+        return(self._mat_names[k])
+
+    # (codec, frame shape) of a compact .mat file, None for a dense one
+    def mat_codec(self, k):
+        if k not in self._mat_codecs:
+            self._mat_codecs[k] = None
+            if '%s_encoding' % k in self.mat_names(k):
+                import scipy.io
+                mat = scipy.io.loadmat(mat_path(self.clip_prefix, k), variable_names=['%s_encoding' % k, '%s_shape' % k])
+                self._mat_codecs[k] = (str(mat['%s_encoding' % k][0]), mat['%s_shape' % k].ravel())
+        return(self._mat_codecs[k])
+
+    def passes(self):
+        if self.h5 is not None:
+            return([k for k in exr_passes if k in self.h5])
+        return([k for k in exr_passes if len(self.mat_names(k)) > 0])
+
+    def nframes(self, k):
+        if self.h5 is not None:
+            return(self.h5[k].shape[0] if k in self.h5 else 0)
+        return(len(set(m.group(1) for m in (re.match(r'^%s_(\d+)(_[a-z]+)?$' % k, n) for n in self.mat_names(k)) if m)))
+
+    # .mat variables of a frame: normal_%d, or its encoded fields normal_%d_mask, ...
+    def frame_var_names(self, k, iframe):
+        var_name = '%s_%d' % (k, iframe + 1)
+        if self.mat_codec(k) is None:
+            return([var_name])
+        return(sorted(n for n in self.mat_names(k) if n.startswith(var_name + '_')))
+
+    def mat_frame(self, mat, k, iframe):
+        var_names = self.frame_var_names(k, iframe)
+        if len(var_names) == 0 or var_names[0] not in mat:
+            raise KeyError('frame %d of %s is not in %s' % (iframe, k, mat_path(self.clip_prefix, k)))
+        codec = self.mat_codec(k)
+        if codec is None:
+            return(mat[var_names[0]])
+        prefix_len = len('%s_%d_' % (k, iframe + 1))
+        return(decode(codec[0], {n[prefix_len:]: mat[n] for n in var_names}, codec[1]))
+
+    def frame(self, k, iframe):
+        if self.h5 is not None:
+            return(as_float32(self.h5[k][iframe]))
+        import scipy.io
+        mat = scipy.io.loadmat(mat_path(self.clip_prefix, k), variable_names=self.frame_var_names(k, iframe))
+        return(self.mat_frame(mat, k, iframe))
+
+    # all the frames of a pass, (N, H, W[, C])
+    def frames(self, k):
+        if self.h5 is not None:
+            return(as_float32(self.h5[k][:]))
+        import scipy.io
+        mat = scipy.io.loadmat(mat_path(self.clip_prefix, k))
+        return(np.stack([self.mat_frame(mat, k, iframe) for iframe in range(self.nframes(k))]))
+
+    def close(self):
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
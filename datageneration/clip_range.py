@@ -0,0 +1,59 @@
+# Frames of the sequences used by the clips, shared by main_part1 and
+# main_part2. clip_nframes gives the length of a clip from the nb_frames of
+# idx_info, so that main_part2 does not have to open the smpl data for it.
+# job_dirname gives the output folder of the clips of a job: run<k>/<name>, or
+# run<k>/<name>_f and run<k>/<name>_b with direction_folders = True in config.
+
+# frames kept in the gait sequences, as slices of their poses (inappropriate frames are cut)
+sequence_cuts = {'05_01': (None, -80),
+                 '10_04': (60, None),
+                 '39_01': (None, -20),
+                 '45_01': (None, 180),
+                 'ung_47_01': (None, 240),
+                 'ung_77_28': (240, 840),
+                 'ung_82_11': (240, None),
+                 'ung_91_57': (250, -250),
+                 'ung_104_02': (None, -240),
+                 'ung_113_25': (None, -120),
+                 'ung_120_20': (240, 1200),
+                 'ung_132_18': (120, None),
+                 'ung_136_21': (60, -60),
+                 'ung_139_28': (240, 960)}
+
+
+# output (and tmp) folder name of the clips of a sequence in a direction: <name>_f or
+# <name>_b, the names the run_gait*.sh scripts gave them; <name> without direction
+def sequence_dirname(name, direction=None):
+    dirname = name.replace(" ", "")
+    if direction is not None:
+        dirname += '_' + direction[0]
+    return(dirname)
+
+
+# folder name of the clips of a job, per direction only if the config asks for it
+def job_dirname(name, direction, params):
+    return(sequence_dirname(name, direction if params.get('direction_folders', False) else None))
+
+
+# Cut gaits to remove inappropriate frames
+def cut_sequence(name, data):
+    if name in sequence_cuts:
+        cut = slice(*sequence_cuts[name])
+        data['poses'] = data['poses'][cut]
+        data['trans'] = data['trans'][cut]
+    return data
+
+
+# frames fbegin:fend:stepsize of the cut sequence are rendered in the clip ishape
+# overlap determined by stride (# subsampled frames to skip)
+def clip_range(nb_frames, ishape, stepsize, stride, clipsize):
+    fbegin = ishape*stepsize*stride
+    fend = min(ishape*stepsize*stride + stepsize*clipsize, nb_frames)
+    return(fbegin, fend)
+
+
+# number of frames of the clip ishape of a sequence of nb_frames frames (before the cut)
+def clip_nframes(name, nb_frames, ishape, stepsize, stride, clipsize):
+    ncut = len(range(int(nb_frames))[slice(*sequence_cuts.get(name, (None, None)))])
+    fbegin, fend = clip_range(ncut, ishape, stepsize, stride, clipsize)
+    return(len(range(ncut)[fbegin:fend:stepsize]))
@@ -0,0 +1,149 @@
+import sys
+import json
+import heapq
+import numpy as np
+
+from clip_range import clip_nframes
+from job_plan import job_args
+
+# Cost model of the jobs, fitted on the wall times that scheduler.py appends to
+# <log_dir>/timings.jsonl (one line per finished process):
+#   {"job": "--idx 0 ...", "phase": "render", "attempt": 1, "code": 0, "seconds": 812.4,
+#    "features": {"frames": 55, "passes": 4, "pixels": 57600}, "predicted": 790.1}
+# The time of a phase is modelled as
+#   seconds = intercept + slope * work,   work = frames * passes * pixels / 1e6
+# (passes: rgb and the output_types of config), fitted by least squares on the
+# successful processes of each phase. Within one config, passes and pixels are the
+# same for all the jobs, so the fit is in effect intercept + slope * frames; they
+# are kept in the features so that timings of runs with other output_types or
+# resolutions still fall on the same line. Without timings of a phase, the model
+# is work itself (intercept 0, slope 1), which still orders the jobs. The scheduler
+# uses the predictions to start the longest jobs first (--order longest) and
+# job_plan.shard_jobs to balance the shards of the nodes (--balance cost).
+# To inspect a model and its predictions:
+#
+#   python cost_model.py scheduler_logs/timings.jsonl --jobs misc/job_list.txt --top 20
+
+min_timings = 2
+
+
+def job_features(line, idx_info, params):
+    args = job_args(line)
+    idx = int(args['--idx']) % len(idx_info)
+    info = idx_info[idx]
+    for dic in idx_info:
+        if dic['name'] == args.get('--name'):
+            info = dic
+            break
+    frames = clip_nframes(info['name'], info['nb_frames'], int(args.get('--ishape', 0)), params['stepsize'],
+                          int(args.get('--stride', 50)), params['clipsize'])
+    passes = 1 + sum(1 for k, enabled in params['output_types'].items() if enabled)
+    return({'frames': frames, 'passes': passes, 'pixels': params['resx'] * params['resy']})
+
+
+def job_work(features):
+    return(features['frames'] * features['passes'] * features['pixels'] / 1e6)
+
+
+def read_timings(path):
+    timings = []
+    with open(path) as f:
+        for line in f:
+            try:
+                timings.append(json.loads(line))
+            except ValueError:
+                continue
+    return(timings)
+
+
+class CostModel(object):
+    def __init__(self, coefs=None, ntimings=None):
+        self.coefs = coefs if coefs is not None else {} # {phase: (intercept, slope)}
+        self.ntimings = ntimings if ntimings is not None else {}
+
+    # successful processes only, and not the clips skipped as complete (see manifest.py)
+    @classmethod
+    def fit(cls, timings):
+        model = cls()
+        phases = set(t['phase'] for t in timings)
+        for phase in phases:
+            samples = [(job_work(t['features']), t['seconds']) for t in timings if t['phase'] == phase
+                       and t['code'] == 0 and not t.get('skipped', False) and t.get('features') is not None]
+            model.ntimings[phase] = len(samples)
+            if len(samples) < min_timings or len(set(work for work, seconds in samples)) < 2:
+                continue
+            work, seconds = np.array(samples, dtype=np.float64).T
+            A = np.column_stack((np.ones_like(work), work))
+            intercept, slope = np.linalg.lstsq(A, seconds, rcond=-1)[0]
+            if slope <= 0:
+                # no dependence on the work: the mean time, proportional to the work for the order
+                intercept, slope = seconds.mean(), 1e-6
+            model.coefs[phase] = (max(float(intercept), 0.), float(slope))
+        return(model)
+
+    def predict(self, features, phase):
+        intercept, slope = self.coefs.get(phase, (0., 1.))
+        return(intercept + slope * job_work(features))
+
+    # predicted time of all the phases of a job
+    def predict_job(self, features, phases):
+        return(sum(self.predict(features, phase) for phase in phases))
+
+    def describe(self):
+        lines = []
+        for phase in sorted(set(self.coefs) | set(self.ntimings)):
+            if phase in self.coefs:
+                lines.append('%s: %.1f s + %.4g s per Mpixel-pass-frame (%d timings)'
+                             % ((phase,) + self.coefs[phase] + (self.ntimings.get(phase, 0),)))
+            else:
+                lines.append('%s: not fitted (%d timings), cost = work' % (phase, self.ntimings.get(phase, 0)))
+        return('\n'.join(lines) if len(lines) > 0 else 'no timings, cost = work')
+
+
+# wall time of the jobs (predicted costs) started in this order on workers >= 1
+def makespan(costs, workers):
+    if workers < 1:
+        raise ValueError('makespan on %d workers, expected at least 1' % workers)
+    loads = [0.] * workers
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return(max(loads))
+
+
+if __name__ == '__main__':
+    import argparse
+    from pickle import load
+    import config
+    from scheduler import read_jobs
+
+    parser = argparse.ArgumentParser(description='Fit the cost model of the jobs on the timings of the scheduler.')
+    parser.add_argument('timings', type=str, nargs='+', help='timings.jsonl of scheduler.py')
+    parser.add_argument('--jobs', type=str, help='job list to predict')
+    parser.add_argument('--top', type=int, default=10, help='longest jobs to list')
+    parser.add_argument('--workers', type=int, default=1, help='workers of the makespan estimate')
+    args = parser.parse_args()
+
+    timings = []
+    for path in args.timings:
+        timings += read_timings(path)
+    model = CostModel.fit(timings)
+    print(model.describe())
+
+    # error of the fit on its own timings
+    for phase in sorted(model.coefs):
+        errors = [model.predict(t['features'], phase) - t['seconds'] for t in timings if t['phase'] == phase
+                  and t['code'] == 0 and not t.get('skipped', False) and t.get('features') is not None]
+        print('%s: mean absolute error %.1f s' % (phase, np.mean(np.abs(errors))))
+
+    if args.jobs is not None:
+        params = config.load_file('config', 'SYNTH_DATA')
+        idx_info = load(open("pkl/idx_info.pickle", 'rb'))
+        lines = read_jobs(args.jobs)
+        phases = sorted(model.coefs) if len(model.coefs) > 0 else ['render']
+        costs = [model.predict_job(job_features(line, idx_info, params), phases) for line in lines]
+        order = np.argsort(costs)[::-1]
+        for i in order[:args.top]:
+            sys.stdout.write('%10.1f s  %s\n' % (costs[i], lines[i]))
+        print('%d jobs, %.1f h in total, makespan on %d workers: %.1f h in order, %.1f h longest first'
+              % (len(lines), sum(costs) / 3600., args.workers, makespan(costs, args.workers) / 3600.,
+                 makespan([costs[i] for i in order], args.workers) / 3600.))
@@ -0,0 +1,59 @@
+import sys
+import bpy
+import numpy as np
+from os.path import join
+
+sys.path.insert(0, ".")
+
+# Export the armature and the shape blendshapes needed by smpl_fk.py, once per
+# gender, so that joints can be computed without Blender.
+#
+#   blender -b -P export_rig.py --- --gender female
+
+
+# rig of the imported SMPL model (see smpl_fk.py for the fields)
+# bone_names: [root, bone_00, ..., bone_23]
+def get_rig(ob, arm_ob, bone_names, reg_ivs):
+    bones = [arm_ob.data.bones[name] for name in bone_names]
+    rig = {}
+    rig['parents'] = np.array([bone_names.index(b.parent.name) if b.parent is not None else -1
+                               for b in bones])
+    rig['rest_rot'] = np.array([np.array(b.matrix_local.to_3x3()) for b in bones])
+    rig['rest_heads'] = np.array([np.array(b.matrix_local.translation) for b in bones])
+    rig['locations'] = np.array([np.array(arm_ob.pose.bones[name].location) for name in bone_names])
+    rig['matrix_world'] = np.array(arm_ob.matrix_world)
+
+    key_blocks = ob.data.shape_keys.key_blocks
+    basis = ob.data.shape_keys.reference_key
+    shape_names = sorted(k for k in key_blocks.keys() if k.startswith('Shape'))
+    rig['v_template'] = np.array([np.array(basis.data[iv].co) for iv in reg_ivs])
+    rig['shapedirs'] = np.stack([np.array([np.array(key_blocks[k].data[iv].co) for iv in reg_ivs])
+                                 - rig['v_template'] for k in shape_names], axis=-1)
+    return(rig)
+
+
+def main():
+    import argparse
+    import config
+    from main_part1 import init_scene, part_match
+    from smpl_store import open_smpl_data
+
+    parser = argparse.ArgumentParser(description='Export the SMPL rig used by smpl_fk.py.')
+    parser.add_argument('--gender', type=str, default='female', choices=['female', 'male'])
+    args = parser.parse_args(sys.argv[sys.argv.index("---") + 1:])
+
+    params = config.load_file('config', 'SYNTH_DATA')
+    params['camera_distance'] = 11.0
+    scene = bpy.data.scenes['Scene']
+    ob, obname, arm_ob, cam_ob = init_scene(scene, params, args.gender)
+
+    bone_names = [obname+'_root'] + [obname+'_'+part_match['bone_%02d' % ibone] for ibone in range(24)]
+    reg_ivs = open_smpl_data(params)['regression_verts']
+    rig = get_rig(ob, arm_ob, bone_names, reg_ivs)
+
+    rig_path = join(params['smpl_data_folder'], 'rig_%s.npz' % args.gender)
+    np.savez(rig_path, **rig)
+    print("saved %s" % rig_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import sys
+import threading
+from os.path import join
+import numpy as np
+
+# Reading of the EXR passes saved by the compositor of main_part1: the
+# channels are decoded straight into NumPy with np.frombuffer instead of
+# going through array.array(...).tolist() and nested Python lists.
+# The arrays have the shapes and dtypes of the _normal/_gtflow/_depth/_segm .mat files.
+
+# channels read for each pass
+pass_channels = {'normal': ('R', 'G', 'B'),
+                 'gtflow': ('R', 'G'),
+                 'depth': ('R',),
+                 'segm': ('R',)}
+
+
+# (height, width, nchannels) float32 array from the raw FLOAT channels of an EXR file
+# out: optional preallocated buffer to decode into
+def decode_channels(channel_data, size, out=None):
+    if out is None:
+        out = np.empty(tuple(size) + (len(channel_data),), dtype=np.float32)
+    for ichan, data in enumerate(channel_data):
+        out[:, :, ichan] = np.frombuffer(data, dtype=np.float32).reshape(size)
+    return(out)
+
+
+# one frame of a pass from its decoded channels: normal (H, W, 3) and
+# gtflow (H, W, 2) float32, depth (H, W) float32, segm (H, W) uint8
+def pass_array(mat, k):
+    if k == 'depth':
+        return(mat[:, :, 0])
+    elif k == 'segm':
+        return(mat[:, :, 0].astype(np.uint8))
+    return(mat)
+
+
+# channels of an EXR loaded by Blender, for main_part1 with post_mode = 'fused'
+# when its python has no OpenEXR: the image is a bottom-up RGBA float buffer
+# (main thread only, bpy is not thread-safe)
+def read_channels_bpy(path, channels, out=None):
+    if threading.current_thread().name != 'MainThread':
+        raise RuntimeError('%s: EXRs can only be loaded with bpy from the main thread, install OpenEXR' % path)
+    import bpy
+    img = bpy.data.images.load(path)
+    width, height = img.size
+    pixels = np.array(img.pixels[:], dtype=np.float32).reshape(height, width, img.channels)[::-1]
+    bpy.data.images.remove(img)
+    if out is None:
+        out = np.empty((height, width, len(channels)), dtype=np.float32)
+    for ichan, chan in enumerate(channels):
+        out[:, :, ichan] = pixels[:, :, 'RGBA'.index(chan)]
+    return(out)
+
+
+def read_channels(path, channels, out=None):
+    try:
+        import OpenEXR
+    except ImportError:
+        if 'bpy' in sys.modules:
+            return(read_channels_bpy(path, channels, out))
+        raise
+    import Imath
+    FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
+
+    exr_file = OpenEXR.InputFile(path)
+    dw = exr_file.header()['dataWindow']
+    size = (dw.max.y - dw.min.y + 1, dw.max.x - dw.min.x + 1)
+    out = decode_channels(exr_file.channels(list(channels), FLOAT), size, out)
+    exr_file.close()
+    return(out)
+
+
+def read_pass(path, k):
+    return(pass_array(read_channels(path, pass_channels[k]), k))
+
+
+# passes of one frame, task = ({pass: folder of the compositor output}, frame)
+# returns {pass: array}; a module-level function so that a Pool can run it
+def read_frame(task):
+    pass_paths, frame = task
+    return({k: read_pass(join(folder, 'Image%04d.exr' % frame), k) for k, folder in pass_paths.items()})
@@ -0,0 +1,325 @@
+import sys
+import os
+import shutil
+import threading
+import traceback
+import subprocess
+from os.path import join, exists, relpath, realpath, dirname
+from glob import glob
+from pickle import load, dump
+import numpy as np
+
+# Last step of a clip once its frames are rendered: videos, tarball of the
+# frames and _info.mat. main_part1 runs it at the end of a job. For a clip
+# rendered in shards (main_part1 --frame_range BEGIN END), run it here after
+# all the shards are done, with the arguments of the job:
+#
+#   python finalize.py --- --idx 0 --name 02_01 --ishape 0 --stride 50 --subject_id 0 --direction forward
+#
+# With post_mode = 'fused' or 'capture' in config it also converts the EXR passes, as
+# main_part2.py would. It also runs the finalize jobs that the renderers hand over
+# when finalizer_python is set in config (python finalize.py --- --job <job>).
+
+shard_info_filename = 'shard_info.pickle'
+
+
+def print_message(message):
+    print(message)
+
+
+def mkdir_safe(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not exists(directory):
+            raise
+
+
+# tmp folder of the shard of a clip rendering frames begin <= frame < end
+def shard_tmp_path(tmp_path, frame_range):
+    return('%s_f%04d-%04d' % (tmp_path, frame_range[0], frame_range[1]))
+
+
+def save_shard_info(tmp_path, frame_range, dict_info):
+    with open(join(tmp_path, shard_info_filename), 'wb') as f:
+        dump({'frame_range': tuple(frame_range), 'dict_info': dict_info}, f, protocol=2)
+
+
+# output folders of the compositor, as in create_composite_nodes of main_part1
+def clip_res_paths(tmp_path, idx, output_types):
+    return({k: join(tmp_path, '%05d_%s' % (idx, k)) for k in output_types if output_types[k]})
+
+
+# move the frames rendered by the shards of a clip into the tmp folder of the
+# clip and merge their joints (the other fields are the same in all shards)
+def merge_shards(tmp_path, log=print_message):
+    shards = []
+    for shard_dir in glob(tmp_path + '_f[0-9]*-[0-9]*'):
+        with open(join(shard_dir, shard_info_filename), 'rb') as f:
+            shards.append((shard_dir, load(f)))
+    if len(shards) == 0:
+        raise ValueError('no shard found for %s' % tmp_path)
+    shards.sort(key=lambda shard: shard[1]['frame_range'])
+
+    dict_info = shards[0][1]['dict_info']
+    rendered = np.zeros(dict_info['joints2D'].shape[-1], dtype=bool)
+    for shard_dir, shard in shards:
+        begin, end = shard['frame_range']
+        if rendered[begin:end].any():
+            raise ValueError('overlapping shard %s' % shard_dir)
+        rendered[begin:end] = True
+    if not rendered.all():
+        raise ValueError('frames %s of %s are not rendered by any shard' % (np.flatnonzero(~rendered), tmp_path))
+
+    # clean up the tmp folder of a previous run of the clip, as main_part1 does
+    if exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    mkdir_safe(tmp_path)
+    for shard_dir, shard in shards:
+        begin, end = shard['frame_range']
+        dict_info['joints2D'][:, :, begin:end] = shard['dict_info']['joints2D'][:, :, begin:end]
+        dict_info['joints3D'][:, :, begin:end] = shard['dict_info']['joints3D'][:, :, begin:end]
+        for root, dirnames, filenames in os.walk(shard_dir):
+            dst_dir = join(tmp_path, relpath(root, shard_dir))
+            mkdir_safe(dst_dir)
+            for filename in filenames:
+                if filename != shard_info_filename:
+                    shutil.move(join(root, filename), join(dst_dir, filename))
+        shutil.rmtree(shard_dir)
+        log("Merged frames %d to %d from %s" % (begin, end - 1, shard_dir))
+    return(dict_info)
+
+
+# shell command as run by os.system before, returns its exit code
+def run_command(cmd):
+    return(subprocess.call(cmd, shell=True))
+
+
+# tasks run by a pool of threads as soon as the tasks they come after are done
+# a task returns its exit code (None for 0), an exception counts as -1
+class TaskGroup(object):
+    def __init__(self, workers=1, log=print_message):
+        self.workers = max(1, workers)
+        self.log = log
+        self.tasks = []
+
+    # deps: names of tasks added before, which must be done before this one starts
+    def add(self, name, fn, deps=()):
+        names = [task[0] for task in self.tasks]
+        for dep in deps:
+            if dep not in names:
+                raise ValueError('task %s comes after %s, which is not in the group' % (name, dep))
+        self.tasks.append((name, fn, tuple(deps)))
+
+    def run_task(self, name, fn, codes):
+        try:
+            code = fn()
+            codes[name] = 0 if code is None else code
+        except Exception:
+            traceback.print_exc()
+            codes[name] = -1
+        if codes[name] != 0:
+            self.log("WARNING: %s failed with exit code %d" % (name, codes[name]))
+
+    # one worker: the tasks run in the calling thread, in the order they were added
+    def run(self):
+        codes = {}
+        if self.workers == 1:
+            for name, fn, deps in self.tasks:
+                self.run_task(name, fn, codes)
+        else:
+            done = {name: threading.Event() for name, fn, deps in self.tasks}
+            slots = threading.Semaphore(self.workers)
+
+            def run_thread(name, fn, deps):
+                for dep in deps:
+                    done[dep].wait()
+                slots.acquire()
+                try:
+                    self.run_task(name, fn, codes)
+                finally:
+                    slots.release()
+                    done[name].set()
+
+            threads = [threading.Thread(target=run_thread, args=task, name=task[0]) for task in self.tasks]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.log("Finalize: %s" % ', '.join('%s %d' % (name, codes[name]) for name, fn, deps in self.tasks))
+        return(codes)
+
+
+# videos, tarball of the rgb frames and _info.mat of a clip, as a group of tasks on
+# workers threads (the ffmpeg, tar and zlib work runs outside the GIL); returns their exit codes
+# streams: the videos streamed during the rendering (video_stream.py), only closed here
+#          ({}: already closed)
+# archive_format, archive_async: archive of the rgb frames, see frame_archive.py
+# extra_tasks: (name, fn, deps) of the caller run in the same group (e.g. the EXR passes)
+# on_complete: called once every task succeeded and the archive is written (e.g. manifest.record_clip)
+def finalize_clip(output_path, tmp_path, name, ishape, res_paths, output_types, dict_info, log=print_message, streams=None,
+                  archive_format='tar.gz', archive_async=False, workers=1, extra_tasks=(), on_complete=None):
+    rgb_dirname = name.replace(" ", "") + '_c%04d.mp4' % (ishape + 1)
+    rgb_path = join(tmp_path, rgb_dirname)
+    matfile_info = join(output_path, name.replace(" ", "") + "_c%04d_info.mat" % (ishape+1))
+    group = TaskGroup(workers, log)
+
+    if streams is not None:
+        if len(streams) > 0:
+            from video_stream import close_clip_streams
+            log("Closing the video streams")
+            group.add('videos', lambda: max(close_clip_streams(streams).values()))
+    else:
+        # save RGB data with ffmpeg (if you don't have h264 codec, you can replace with another one and control the quality with something like -q:v 3)
+        cmd_ffmpeg = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 ''%s_c%04d.mp4''' % (join(rgb_path, 'Image%04d.png'), join(output_path, name.replace(' ', '')), (ishape + 1))
+        log("Generating RGB video (%s)" % cmd_ffmpeg)
+        group.add('rgb video', lambda: run_command(cmd_ffmpeg))
+
+        if(output_types['vblur']):
+            cmd_ffmpeg_vblur = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 -vf "scale=trunc(iw/2)*2:trunc(ih/2)*2" ''%s_c%04d.mp4''' % (join(res_paths['vblur'], 'Image%04d.png'), join(output_path, name.replace(' ', '')+'_vblur'), (ishape + 1))
+            log("Generating vblur video (%s)" % cmd_ffmpeg_vblur)
+            group.add('vblur video', lambda: run_command(cmd_ffmpeg_vblur))
+
+        if(output_types['fg']):
+            cmd_ffmpeg_fg = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 ''%s_c%04d.mp4''' % (join(res_paths['fg'], 'Image%04d.png'), join(output_path, name.replace(' ', '')+'_fg'), (ishape + 1))
+            log("Generating fg video (%s)" % cmd_ffmpeg_fg)
+            group.add('fg video', lambda: run_command(cmd_ffmpeg_fg))
+
+    # the asynchronous archive moves the frames away, after the videos that read them
+    from frame_archive import archive_path, archive_frames, archive_frames_async, after_archive
+    archiving = []
+    if archive_async and archive_format != 'none':
+        videos = [task[0] for task in group.tasks]
+        group.add('archive', lambda: archiving.append(archive_frames_async(rgb_path, archive_path(output_path, rgb_dirname, archive_format),
+                                                                           archive_format, tmp_path, log)), deps=videos)
+    else:
+        group.add('archive', lambda: archive_frames(rgb_path, archive_path(output_path, rgb_dirname, archive_format),
+                                                    archive_format, log))
+
+    # save annotation excluding png/exr data to _info.mat file
+    import scipy.io
+    group.add('info', lambda: scipy.io.savemat(matfile_info, dict_info, do_compression=True))
+
+    for task in extra_tasks:
+        group.add(*task)
+    codes = group.run()
+
+    if on_complete is not None and all(code == 0 for code in codes.values()):
+        if len(archiving) > 0:
+            after_archive(archiving[0], on_complete)
+        else:
+            on_complete()
+    return(codes)
+
+
+# hand the finalize stage of a clip to a detached `python finalize.py --- --job`, so
+# that the renderer can start its next clip; job holds the arguments of finalize_clip
+# ('finalize') and convert_clip ('convert', or None), whether to remove the tmp
+# folder afterwards ('cleanup') and the arguments of manifest.record_clip ('manifest',
+# or None), pickled next to the tmp folder
+def detach_finalize(python, tmp_path, job, log=print_message):
+    job_path = tmp_path.rstrip('/') + '.finalize.pickle'
+    with open(job_path, 'wb') as f:
+        dump(job, f, protocol=2)
+    # the PYTHONPATH of Blender's bundled python would break another interpreter
+    env = dict(os.environ)
+    env.pop('PYTHONPATH', None)
+    log_path = tmp_path.rstrip('/') + '.finalize.log'
+    with open(log_path, 'w') as log_file:
+        proc = subprocess.Popen([python, realpath(__file__), '---', '--job', job_path],
+                                cwd=dirname(realpath(__file__)), env=env, stdin=open(os.devnull),
+                                stdout=log_file, stderr=subprocess.STDOUT, close_fds=True, preexec_fn=os.setsid)
+    log("Finalizing in process %d (log %s)" % (proc.pid, log_path))
+    return(proc.pid)
+
+
+# run a job of detach_finalize; the tmp folder and the job are only removed if
+# every task succeeded, so that a failed job can be run again
+def run_finalize_job(job_path, log=print_message):
+    with open(job_path, 'rb') as f:
+        job = load(f)
+    for exr_path in job.get('openexr_py2_path', '').split(':'):
+        sys.path.insert(1, exr_path)
+
+    extra_tasks = []
+    if job['convert'] is not None:
+        from main_part2 import convert_clip
+        extra_tasks.append(('passes', lambda: convert_clip(log=log, **job['convert']), ()))
+    on_complete = None
+    if job.get('manifest') is not None:
+        from manifest import record_clip
+        on_complete = lambda: record_clip(**job['manifest'])
+    codes = finalize_clip(log=log, extra_tasks=extra_tasks, on_complete=on_complete, **job['finalize'])
+
+    from frame_archive import wait_archives
+    wait_archives(log)
+    if all(code == 0 for code in codes.values()):
+        if job.get('cleanup', False):
+            shutil.rmtree(job['finalize']['tmp_path'])
+        os.remove(job_path)
+    return(codes)
+
+
+if __name__ == '__main__':
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Assemble the shards of a clip and finalize it.')
+    parser.add_argument('--job', type=str,
+                        help='finalize job handed over by a renderer (finalizer_python in config)')
+    parser.add_argument('--idx', type=int,
+                        help='idx of the requested sequence')
+    parser.add_argument('--name', type=str,
+                        help='name of the requested sequence')
+    parser.add_argument('--ishape', type=int,
+                        help='requested cut, according to the stride')
+    parser.add_argument('--stride', type=int,
+                        help='stride amount, default 50')
+    parser.add_argument('--direction', type=str,
+                        help='subject direction, default forward')
+    parser.add_argument('--subject_id', type=int,
+                        help='local subject id, default 0')
+    args = parser.parse_args(sys.argv[sys.argv.index("---") + 1:])
+
+    if args.job is not None:
+        codes = run_finalize_job(args.job)
+        exit(0 if all(code == 0 for code in codes.values()) else 1)
+
+    params = config.load_file('config', 'SYNTH_DATA')
+    idx_info = load(open("pkl/idx_info.pickle", 'rb'))
+    (runpass, idx) = divmod(args.idx, len(idx_info))
+    for dic in idx_info:
+        if dic['name'] == args.name:
+            name = dic['name']
+            break
+    else:
+        name = idx_info[idx]['name']
+
+    ishape = args.ishape
+    from clip_range import job_dirname
+    output_path = join(params['output_path'], 'run%d' % runpass, job_dirname(name, args.direction, params))
+    tmp_path = join(params['tmp_path'], 'run%d_%s_c%04d' % (runpass, job_dirname(name, args.direction, params), (ishape + 1)))
+
+    dict_info = merge_shards(tmp_path)
+    mkdir_safe(output_path)
+
+    extra_tasks = []
+    on_complete = None
+    clip_prefix = join(output_path, name.replace(" ", "") + "_c%04d" % (ishape + 1))
+    is_converted = params.get('post_mode', 'part2') in ('fused', 'capture')
+    if is_converted:
+        from main_part2 import convert_clip
+        from manifest import manifest_path, record_clip
+        on_complete = lambda: record_clip(manifest_path(params['output_path']), clip_prefix,
+                                          {'stride': args.stride, 'direction': args.direction, 'subject_id': args.subject_id}, params)
+        extra_tasks.append(('passes', lambda: convert_clip(tmp_path, clip_prefix, idx, dict_info['joints2D'].shape[-1], params,
+                                                           workers=params.get('post_workers', 1)), ()))
+    codes = finalize_clip(output_path, tmp_path, name, ishape, clip_res_paths(tmp_path, idx, params['output_types']),
+                          params['output_types'], dict_info, archive_format=params.get('archive_format', 'tar.gz'),
+                          archive_async=params.get('archive_async', False), workers=params.get('finalize_workers', 1),
+                          extra_tasks=extra_tasks, on_complete=on_complete)
+
+    from frame_archive import wait_archives
+    wait_archives()
+    if is_converted and all(code == 0 for code in codes.values()):
+        shutil.rmtree(tmp_path)
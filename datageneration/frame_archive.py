@@ -0,0 +1,154 @@
+import os
+import shutil
+import tarfile
+import zipfile
+import threading
+from os.path import join, exists, basename, dirname
+
+# Archive of the rgb frames of a clip (the Image%04d.png of <clip>_c0001.mp4/),
+# written by finalize_clip with archive_format in config:
+#   'tar.gz'  : tar -czf, as before (PNGs hardly compress, single-threaded)
+#   'zip'     : zip without compression, indexed by its central directory
+#   'tar'     : tar without compression, with a <archive>.index of the offset
+#               and size of every member
+#   'tar.zst' : tar compressed with multi-threaded zstd (not indexed)
+#   'none'    : no archive, the mp4 is kept only
+# With archive_async = True the frames are moved out of the tmp folder of the
+# clip and archived by a background thread, wait_archives() joins them.
+# read_frame reads one frame of a 'zip' or 'tar' archive without unpacking it:
+#
+#   png = read_frame('/home/local/data/cmc/synthetic/run0/02_01/02_01_c0001.mp4.zip', 17)
+
+archive_formats = ('tar.gz', 'zip', 'tar', 'tar.zst', 'none')
+pending_archives = []
+
+
+def print_message(message):
+    print(message)
+
+
+def archive_path(output_path, rgb_dirname, archive_format):
+    return(join(output_path, '%s.%s' % (rgb_dirname, archive_format)))
+
+
+def index_path(path):
+    return(path + '.index')
+
+
+# members in frame order, named <rgb_dirname>/Image%04d.png as in the tarball
+def frame_members(src_dir):
+    return([(join(src_dir, filename), join(basename(src_dir), filename)) for filename in sorted(os.listdir(src_dir))])
+
+
+def write_zip(src_dir, path):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for filepath, arcname in frame_members(src_dir):
+            zf.write(filepath, arcname)
+
+
+def write_tar(src_dir, path):
+    with tarfile.open(path, 'w') as tf:
+        tf.add(src_dir, arcname=basename(src_dir), recursive=False)
+        for filepath, arcname in frame_members(src_dir):
+            tf.add(filepath, arcname=arcname)
+    with tarfile.open(path, 'r') as tf:
+        with open(index_path(path), 'w') as f:
+            f.write('# name\toffset\tsize\n')
+            for member in tf.getmembers():
+                if member.isfile():
+                    f.write('%s\t%d\t%d\n' % (member.name, member.offset_data, member.size))
+
+
+# returns the exit code of the command (0 for the archives written by python)
+def archive_frames(src_dir, path, archive_format, log=print_message):
+    if archive_format == 'none':
+        return(0)
+    if archive_format == 'tar.gz':
+        cmd = 'tar -czf %s -C %s %s' % (path, dirname(src_dir), basename(src_dir))
+    elif archive_format == 'tar.zst':
+        cmd = 'tar -I "zstd -T0" -cf %s -C %s %s' % (path, dirname(src_dir), basename(src_dir))
+    elif archive_format in ('zip', 'tar'):
+        log("Archiving the images (%s, %s)" % (archive_format, path))
+        # the archive (and its index) only appear once complete
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        if archive_format == 'zip':
+            write_zip(src_dir, tmp_path)
+        else:
+            write_tar(src_dir, tmp_path)
+            os.rename(index_path(tmp_path), index_path(path))
+        os.rename(tmp_path, path)
+        return(0)
+    else:
+        raise ValueError('unknown archive format %r, expected one of %s' % (archive_format, archive_formats))
+    log("Archiving the images (%s)" % cmd)
+    returncode = os.system(cmd)
+    if returncode != 0:
+        log("WARNING: archiving %s exited with %d" % (path, returncode))
+    return(returncode)
+
+
+# move the frames to <tmp_path>_archive so that the tmp folder of the clip can be
+# cleaned up (or reused) right away, and archive them in a thread
+def archive_frames_async(src_dir, path, archive_format, tmp_path, log=print_message):
+    staging_dir = join(tmp_path.rstrip('/') + '_archive', basename(src_dir))
+    if exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    if not exists(dirname(staging_dir)):
+        os.makedirs(dirname(staging_dir))
+    os.rename(src_dir, staging_dir)
+
+    def run():
+        try:
+            thread.returncode = archive_frames(staging_dir, path, archive_format, log)
+        finally:
+            shutil.rmtree(dirname(staging_dir))
+
+    thread = threading.Thread(target=run, name='archive %s' % basename(path))
+    thread.returncode = None
+    thread.start()
+    pending_archives.append(thread)
+    return(thread)
+
+
+# call fn once the archive of archive_frames_async is written, if it succeeded
+def after_archive(thread, fn):
+    def run():
+        thread.join()
+        if thread.returncode == 0:
+            fn()
+
+    follower = threading.Thread(target=run, name=thread.name)
+    follower.start()
+    pending_archives.append(follower)
+    return(follower)
+
+
+def wait_archives(log=print_message):
+    while len(pending_archives) > 0:
+        thread = pending_archives.pop(0)
+        if thread.is_alive():
+            log("Waiting for %s" % thread.name)
+        thread.join()
+
+
+# PNG bytes of one frame of a 'zip' or 'tar' archive (frame as in Image%04d.png)
+def read_frame(path, frame):
+    filename = 'Image%04d.png' % frame
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if basename(name) == filename:
+                    return(zf.read(name))
+    elif path.endswith('.tar'):
+        with open(index_path(path)) as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                name, offset, size = line.rstrip('\n').split('\t')
+                if basename(name) == filename:
+                    with open(path, 'rb') as tf:
+                        tf.seek(int(offset))
+                        return(tf.read(int(size)))
+    else:
+        raise ValueError('%s is not an indexed archive (zip or tar)' % path)
+    raise KeyError('%s is not in %s' % (filename, path))
@@ -0,0 +1,91 @@
+import math
+import heapq
+from collections import namedtuple
+from fnmatch import fnmatch
+
+from clip_range import clip_nframes
+
+# Jobs of a generation run, generated from idx_info instead of read from a job
+# list: one job per stride, sequence, clip (ishape) and direction, in that order.
+# idx is the index of the sequence plus stride number * len(idx_info) (the
+# runpass of main_part1), the subject id is 2 * the index of the sequence plus 0
+# forward, 1 backward (alternating with the directions as in run_gait_workers.sh),
+# so a job does not depend on the filters (directions included) or the sharding.
+# Every node can compute its share of the run from idx_info alone:
+#
+#   jobs = shard_jobs(plan_jobs(idx_info, (50,), ('forward', 'backward'), stepsize, clipsize), 3, 8)
+#
+# With a cost function (e.g. job_frames, the number of frames rendered by the
+# job), the shards are balanced greedily by cost (longest job to the least loaded
+# shard) instead of round-robin; ties are broken by job order, so all the nodes
+# agree on the partition.
+
+ClipJob = namedtuple('ClipJob', ['idx', 'name', 'ishape', 'stride', 'direction', 'subject_id', 'nb_frames'])
+
+all_directions = ('forward', 'backward')
+
+
+# arguments of main_part1.py, main_part2.py and finalize.py (one line of a job list)
+def job_line(job):
+    return('--idx %d --name %s --ishape %d --stride %d --subject_id %d --direction %s'
+           % (job.idx, job.name, job.ishape, job.stride, job.subject_id, job.direction))
+
+
+# arguments of a job line as a dict {'--idx': '0', ...}
+def job_args(line):
+    tokens = line.split()
+    return(dict(zip(tokens[::2], tokens[1::2])))
+
+
+# number of clips of a sequence, as computed (and asserted) by main_part1
+def sequence_nb_ishape(nb_frames, stride, clipsize):
+    return(max(1, int(math.ceil((nb_frames - (clipsize - stride)) / float(stride)))))
+
+
+# names: sequence names or fnmatch patterns (e.g. 'ung_*'), splits: use_split of
+# idx_info (built with misc/create_idx_info.py --split subject), None for all
+def plan_jobs(idx_info, strides, directions, stepsize, clipsize, names=None, splits=None, first_clip=False):
+    for irun, stride in enumerate(strides):
+        for iseq, info in enumerate(idx_info):
+            if names is not None and not any(fnmatch(info['name'], pattern) for pattern in names):
+                continue
+            if splits is not None and info.get('use_split') not in splits:
+                continue
+            nb_ishape = 1 if first_clip else sequence_nb_ishape(info['nb_frames'], stride, clipsize)
+            for ishape in range(nb_ishape):
+                nb_frames = clip_nframes(info['name'], info['nb_frames'], ishape, stepsize, stride, clipsize)
+                # nb_ishape counts clips stride frames apart, but they start stepsize*stride
+                # frames apart: the last ones are past the end of the (cut) sequence
+                if nb_frames == 0:
+                    continue
+                for direction in directions:
+                    yield ClipJob(iseq + irun*len(idx_info), info['name'], ishape, stride, direction,
+                                  len(all_directions)*iseq + all_directions.index(direction), nb_frames)
+
+
+def job_frames(job):
+    return(job.nb_frames)
+
+
+# 'k/N' -> (k, N), with 0 <= k < N
+def parse_shard(shard):
+    k, n = [int(x) for x in shard.split('/')]
+    if not 0 <= k < n:
+        raise ValueError('shard %s: expected k/N with 0 <= k < N' % shard)
+    return(k, n)
+
+
+# jobs of the shard k of n, in plan order; round-robin (lazy) without cost
+def shard_jobs(jobs, k, n, cost=None):
+    if cost is None:
+        return((job for i, job in enumerate(jobs) if i % n == k))
+    jobs = list(jobs)
+    order = sorted(range(len(jobs)), key=lambda i: (-cost(jobs[i]), i))
+    loads = [(0., 0, ishard) for ishard in range(n)]
+    mine = []
+    for i in order:
+        load, njobs, ishard = heapq.heappop(loads)
+        if ishard == k:
+            mine.append(i)
+        heapq.heappush(loads, (load + cost(jobs[i]), njobs + 1, ishard))
+    return([jobs[i] for i in sorted(mine)])
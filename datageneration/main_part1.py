@@ -18,8 +18,24 @@ from math import sin, cos
 
 is_visualization = False #True
 is_arbitrary_shape = True
+is_bulk_keyframing = True # False: keyframe_insert per channel and frame
+is_fk_joints = False # True: joints2D/joints3D from the NumPy forward kinematics (smpl_fk.py) instead of the posed bones
+segmented_materials = True #True: 0-24, False: expected to have 0-1 bg/fg
+is_check_segmentation = False # True: compare the polygon materials of create_segmentation with the edit mode operators
+is_animation_render = False # True: render the whole clip in one animation render instead of one render per frame
 
 sys.path.insert(0, ".")
+from smpl_store import open_smpl_data, load_sequence
+from smpl_math import rodrigues2bshapes, batch_rodrigues2bshapes
+from segmentation import polygon_material_indices
+from clip_animation import build_clip_animation
+from smpl_fk import clip_joints
+from export_rig import get_rig
+from scene_template import is_template_current, open_template, sh_path
+from finalize import finalize_clip, shard_tmp_path, save_shard_info, detach_finalize
+from frame_archive import wait_archives
+from clip_range import cut_sequence, job_dirname
+from manifest import manifest_path, is_clip_complete, start_clip, record_clip
 
 def mkdir_safe(directory):
     try:
@@ -59,17 +75,40 @@ def create_segmentation(ob, params):
         vs = vsegm[part]
         vgroups[part] = ob.vertex_groups.new(part)
         vgroups[part].add(vs, 1.0, 'ADD')
-        bpy.ops.object.vertex_group_set_active(group=part)
         materials[part] = bpy.data.materials['Material'].copy()
         materials[part].pass_index = part2num[part]
-        bpy.ops.object.material_slot_add()
-        ob.material_slots[-1].material = materials[part]
+        ob.data.materials.append(materials[part])
+
+    # assign the polygons of all the parts in one call, without switching to edit mode
+    me = ob.data
+    loop_starts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get('loop_start', loop_starts)
+    loop_verts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get('vertex_index', loop_verts)
+    indices = polygon_material_indices(loop_starts, loop_verts, len(me.vertices), vsegm, parts)
+    me.polygons.foreach_set('material_index', indices)
+    me.update()
+    if is_check_segmentation:
+        check_segmentation(ob, parts, indices)
+    return(materials)
+
+# assign the materials again with the edit mode operators and compare with the
+# polygon indices of create_segmentation (same indices, hence same IndexMA pass)
+def check_segmentation(ob, parts, indices):
+    me = ob.data
+    me.polygons.foreach_set('material_index', np.zeros(len(me.polygons), dtype=np.int32))
+    for islot, part in enumerate(parts):
+        bpy.ops.object.vertex_group_set_active(group=part)
+        ob.active_material_index = islot
         bpy.ops.object.mode_set(mode='EDIT')
         bpy.ops.mesh.select_all(action='DESELECT')
         bpy.ops.object.vertex_group_select()
         bpy.ops.object.material_slot_assign()
         bpy.ops.object.mode_set(mode='OBJECT')
-    return(materials)
+    op_indices = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get('material_index', op_indices)
+    log_message("Segmentation check: %d of %d polygons differ" % ((op_indices != indices).sum(), len(indices)))
+    assert((op_indices == indices).all())
 
 # create the different passes that we render
 def create_composite_nodes(tree, params, img=None, idx=0):
@@ -97,6 +136,7 @@ def create_composite_nodes(tree, params, img=None, idx=0):
 
         # create node for saving output of vector blurred image 
         vblur_out = tree.nodes.new('CompositorNodeOutputFile')
+        vblur_out.name = 'vblur_out'
         vblur_out.format.file_format = 'PNG'
         vblur_out.base_path = res_paths['vblur']
         vblur_out.location = 460, 460
@@ -113,6 +153,7 @@ def create_composite_nodes(tree, params, img=None, idx=0):
     # create node for saving depth
     if(params['output_types']['depth']):
         depth_out = tree.nodes.new('CompositorNodeOutputFile')
+        depth_out.name = 'depth_out'
         depth_out.location = 40, 700
         depth_out.format.file_format = 'OPEN_EXR'
         depth_out.base_path = res_paths['depth']
@@ -120,6 +161,7 @@ def create_composite_nodes(tree, params, img=None, idx=0):
     # create node for saving normals
     if(params['output_types']['normal']):
         normal_out = tree.nodes.new('CompositorNodeOutputFile')
+        normal_out.name = 'normal_out'
         normal_out.location = 40, 600
         normal_out.format.file_format = 'OPEN_EXR'
         normal_out.base_path = res_paths['normal']
@@ -127,6 +169,7 @@ def create_composite_nodes(tree, params, img=None, idx=0):
     # create node for saving foreground image
     if(params['output_types']['fg']):
         fg_out = tree.nodes.new('CompositorNodeOutputFile')
+        fg_out.name = 'fg_out'
         fg_out.location = 170, 600
         fg_out.format.file_format = 'PNG'
         fg_out.base_path = res_paths['fg']
@@ -134,6 +177,7 @@ def create_composite_nodes(tree, params, img=None, idx=0):
     # create node for saving ground truth flow 
     if(params['output_types']['gtflow']):
         gtflow_out = tree.nodes.new('CompositorNodeOutputFile')
+        gtflow_out.name = 'gtflow_out'
         gtflow_out.location = 40, 500
         gtflow_out.format.file_format = 'OPEN_EXR'
         gtflow_out.base_path = res_paths['gtflow']
@@ -141,9 +185,19 @@ def create_composite_nodes(tree, params, img=None, idx=0):
     # create node for saving segmentation
     if(params['output_types']['segm']):
         segm_out = tree.nodes.new('CompositorNodeOutputFile')
+        segm_out.name = 'segm_out'
         segm_out.location = 40, 400
         segm_out.format.file_format = 'OPEN_EXR'
         segm_out.base_path = res_paths['segm']
+
+    # compact passes: the part indices are exact in half float and RLE is lossless,
+    # the normals are stored as float16 by main_part2 anyway
+    if params.get('pass_encoding') == 'compact':
+        if(params['output_types']['segm']):
+            segm_out.format.color_depth = '16'
+            segm_out.format.exr_codec = 'RLE'
+        if(params['output_types']['normal']):
+            normal_out.format.color_depth = '16'
     
     # merge fg and bg images
     tree.links.new(bg_im.outputs[0], mix.inputs[1])
@@ -169,11 +223,39 @@ def create_composite_nodes(tree, params, img=None, idx=0):
 
     return(res_paths)
 
-# creation of the spherical harmonics material, using an OSL script
-def create_sh_material(tree, sh_path, img=None):
-    # clear default nodes
-    for n in tree.nodes:
-        tree.nodes.remove(n)
+# point the compositor graph of a scene template to the outputs of a job
+def update_composite_nodes(tree, params, img=None, idx=0):
+    res_paths = {k:join(params['tmp_path'], '%05d_%s'%(idx, k)) for k in params['output_types'] if params['output_types'][k]}
+
+    if img is not None:
+        tree.nodes['Image'].image = img
+    if(params['output_types']['vblur']):
+        tree.nodes['Vector Blur'].factor = params['vblur_factor']
+    for k in res_paths:
+        tree.nodes['%s_out' % k].base_path = res_paths[k]
+    return(res_paths)
+
+# post_mode = 'capture': the EXR passes are written to capture_dir (tmpfs) instead of
+# the tmp folder of the clip, and read back right after each frame
+def capture_pass_paths(tree, res_paths, capture_dir):
+    from clip_io import exr_passes
+    pass_paths = {k: join(capture_dir, os.path.basename(res_paths[k])) for k in res_paths if k in exr_passes}
+    for k in pass_paths:
+        tree.nodes['%s_out' % k].base_path = pass_paths[k]
+    return(pass_paths)
+
+# decode the passes of a rendered frame into the clip writer and delete their EXRs
+def capture_frame(writer, iframe, pass_paths, frame):
+    from exr_io import read_frame
+    writer.write_frame(iframe, read_frame((pass_paths, frame)))
+    for folder in pass_paths.values():
+        remove(join(folder, 'Image%04d.exr' % frame))
+
+# node group of the spherical harmonics shader, shared by the materials of all the parts:
+# one OSL script (compiled once, embedded in the .blend) and one set of SH coefficients
+def create_sh_group(img=None):
+    tree = bpy.data.node_groups.new('SphericalHarmonics', 'ShaderNodeTree')
+    tree.outputs.new('NodeSocketShader', 'Shader')
 
     uv = tree.nodes.new('ShaderNodeTexCoord')
     uv.location = -800, 400
@@ -191,33 +273,41 @@ def create_sh_material(tree, sh_path, img=None):
     rgb = tree.nodes.new('ShaderNodeRGB')
     rgb.location = -400, 200
 
+    # internal script: no copy of sh.osl per job (using the same file from multiple jobs causes white texture)
     script = tree.nodes.new('ShaderNodeScript')
     script.location = -230, 400
-    script.mode = 'EXTERNAL'
-    script.filepath = sh_path #'spher_harm/sh.osl' #using the same file from multiple jobs causes white texture
+    script.mode = 'INTERNAL'
+    script.script = bpy.data.texts.load(sh_path)
     script.update()
 
     # the emission node makes it independent of the scene lighting
     emission = tree.nodes.new('ShaderNodeEmission')
     emission.location = -60, 400
 
-    mat_out = tree.nodes.new('ShaderNodeOutputMaterial')
-    mat_out.location = 110, 400
+    group_out = tree.nodes.new('NodeGroupOutput')
+    group_out.location = 110, 400
     
     tree.links.new(uv.outputs[2], uv_im.inputs[0])
     tree.links.new(uv_im.outputs[0], script.inputs[0])
     tree.links.new(script.outputs[0], emission.inputs[0])
-    tree.links.new(emission.outputs[0], mat_out.inputs[0])
-
-# computes rotation matrix through Rodrigues formula as in cv2.Rodrigues
-def Rodrigues(rotvec):
-    theta = np.linalg.norm(rotvec)
-    r = (rotvec/theta).reshape(3, 1) if theta > 0. else rotvec
-    cost = np.cos(theta)
-    mat = np.asarray([[0, -r[2], r[1]],
-                      [r[2], 0, -r[0]],
-                      [-r[1], r[0], 0]])
-    return(cost*np.eye(3) + (1-cost)*r.dot(r.T) + np.sin(theta)*mat)
+    tree.links.new(emission.outputs[0], group_out.inputs[0])
+    return(tree)
+
+# creation of the spherical harmonics material, using the shared node group
+# (the materials of the parts are copies that only differ by their pass_index)
+def create_sh_material(tree, sh_group):
+    # clear default nodes
+    for n in tree.nodes:
+        tree.nodes.remove(n)
+
+    sh = tree.nodes.new('ShaderNodeGroup')
+    sh.location = -60, 400
+    sh.node_tree = sh_group
+
+    mat_out = tree.nodes.new('ShaderNodeOutputMaterial')
+    mat_out.location = 110, 400
+
+    tree.links.new(sh.outputs[0], mat_out.inputs[0])
 
 def init_scene(scene, params, gender='female'):
     # load fbx model
@@ -272,16 +362,6 @@ def init_scene(scene, params, gender='female'):
 
     return(ob, obname, arm_ob, cam_ob)
 
-# transformation between pose and blendshapes
-def rodrigues2bshapes(pose):
-    rod_rots = np.asarray(pose).reshape(24, 3)
-    mat_rots = [Rodrigues(rod_rot) for rod_rot in rod_rots]
-
-    bshapes = np.concatenate([(mat_rot - np.eye(3)).ravel()
-                              for mat_rot in mat_rots[1:]])
-    return(mat_rots, bshapes)
-
-
 # apply trans pose and shape to character
 def apply_trans_pose_shape(trans, pose, shape, ob, arm_ob, obname, scene, cam_ob, frame=None):
     # transform pose into rotation matrices (for pose) and pose blendshapes
@@ -313,6 +393,25 @@ def apply_trans_pose_shape(trans, pose, shape, ob, arm_ob, obname, scene, cam_ob
             ob.data.shape_keys.key_blocks['Shape%03d' % ibshape].keyframe_insert('value', index=-1, frame=frame)
 
 
+# render with the output of Blender sent to /dev/null
+def render_quiet(**kwargs):
+    # disable render output
+    logfile = '/dev/null'
+    open(logfile, 'a').close()
+    old = os.dup(1)
+    sys.stdout.flush()
+    os.close(1)
+    os.open(logfile, os.O_WRONLY)
+
+    try:
+        bpy.ops.render.render(**kwargs)
+    finally:
+        # disable output redirection
+        os.close(1)
+        os.dup(old)
+        os.close(old)
+
+
 def get_bone_locs(obname, arm_ob, scene, cam_ob):
     n_bones = 24
     render_scale = scene.render.resolution_percentage / 100
@@ -367,11 +466,7 @@ def reset_joint_positions(orig_trans, shape, ob, arm_ob, obname, scene, cam_ob,
 # load poses and shapes
 def load_body_data(smpl_data, ob, obname, name, gender='female'):
     # load MoSHed data from CMU Mocap (only the given idx is loaded)
-    cmu_parms = {}
-    for seq in smpl_data.files:
-        if seq == ('pose_' + name):
-            cmu_parms[seq.replace('pose_', '')] = {'poses':smpl_data[seq],
-                                                   'trans':smpl_data[seq.replace('pose_','trans_')]}
+    cmu_parms = {name: load_sequence(smpl_data, name)}
     print("nframes: %d" % len(cmu_parms[name]['poses']))
 
     # compute the number of shape blendshapes in the model
@@ -411,52 +506,6 @@ def get_zrot(name, direction):
     return zrot 
 
 
-# Cut gaits to remove inappropriate frames 
-def cut_sequence(name, data):
-    if name == '05_01':
-        data['poses'] = data['poses'][:-80]
-        data['trans'] = data['trans'][:-80]
-    elif name == '10_04':
-        data['poses'] = data['poses'][60:]
-        data['trans'] = data['trans'][60:]
-    elif name == '39_01':
-        data['poses'] = data['poses'][:-20]
-        data['trans'] = data['trans'][:-20]
-    elif name == '45_01':
-        data['poses'] = data['poses'][:180]
-        data['trans'] = data['trans'][:180]
-    elif name == 'ung_47_01':
-        data['poses'] = data['poses'][:240]
-        data['trans'] = data['trans'][:240]
-    elif name == 'ung_77_28':
-        data['poses'] = data['poses'][240:840]
-        data['trans'] = data['trans'][240:840]
-    elif name == 'ung_82_11':
-        data['poses'] = data['poses'][240:]
-        data['trans'] = data['trans'][240:]
-    elif name == 'ung_91_57':
-        data['poses'] = data['poses'][250:-250]
-        data['trans'] = data['trans'][250:-250]
-    elif name == 'ung_104_02':
-        data['poses'] = data['poses'][:-240]
-        data['trans'] = data['trans'][:-240]
-    elif name == 'ung_113_25':
-        data['poses'] = data['poses'][:-120]
-        data['trans'] = data['trans'][:-120]
-    elif name == 'ung_120_20':
-        data['poses'] = data['poses'][240:1200]
-        data['trans'] = data['trans'][240:1200]
-    elif name == 'ung_132_18':
-        data['poses'] = data['poses'][120:]
-        data['trans'] = data['trans'][120:]
-    elif name == 'ung_136_21':
-        data['poses'] = data['poses'][60:-60]
-        data['trans'] = data['trans'][60:-60]
-    elif name == 'ung_139_28':
-        data['poses'] = data['poses'][240:960]
-        data['trans'] = data['trans'][240:960]
-    return data
-
 # Draw 2d keypoints
 def draw_skeleton(img_path, joints):
     left_leg = [1, 4, 7, 10]
@@ -492,15 +541,16 @@ def draw_skeleton(img_path, joints):
     cv2.imwrite(img_path, image)
 
 
-def main():
-    # time logging
-    global start_time
-    start_time = time.time()
+genders = {0: 'male', 1: 'female'}
+
+# gender of the subject of a job
+def job_gender(subject_id):
+    return genders[sum(divmod(subject_id, 2))%2] #genders[subject_id % 2]#choice(genders)
 
+
+# command line arguments of a job (the same arguments are used in a queue file, one job per line)
+def parse_job_args(argv):
     import argparse
-    
-    # parse commandline arguments
-    log_message(sys.argv)
     parser = argparse.ArgumentParser(description='Generate synth dataset images.')
     parser.add_argument('--idx', type=int,
                         help='idx of the requested sequence')
@@ -514,9 +564,137 @@ def main():
                             help='subject direction, default forward')
     parser.add_argument('--subject_id', type=int,
                                 help='local subject id, default 0')
+    parser.add_argument('--frame_range', type=int, nargs=2, metavar=('BEGIN', 'END'),
+                        help='shard: render only the frames BEGIN <= frame < END of the clip, assembled by finalize.py')
+    parser.add_argument('--queue', type=str,
+                        help='worker mode: render the jobs listed in this file, one line of job arguments per job')
+    parser.add_argument('--gender', type=str, choices=['female', 'male'],
+                        help='worker mode: gender of the Blender session, jobs of the other gender are left to other workers')
+    return(parser.parse_args(argv))
 
-    args = parser.parse_args(sys.argv[sys.argv.index("---") + 1:])
     
+# build the scene of a gender: imported model, segmentation materials with the
+# spherical harmonics script, camera and render passes (saved as template by prepare_templates.py)
+def build_scene(params, gender):
+    scene = bpy.data.scenes['Scene']
+    scene.render.engine = 'CYCLES'
+    bpy.data.materials['Material'].use_nodes = True
+    scene.cycles.shading_system = True
+    scene.use_nodes = True
+
+    log_message("Building materials tree")
+    sh_group = create_sh_group()
+    mat_tree = bpy.data.materials['Material'].node_tree
+    create_sh_material(mat_tree, sh_group)
+
+    log_message("Initializing scene")
+    ob, obname, arm_ob, cam_ob = init_scene(scene, params, gender)
+
+    setState0()
+    ob.select = True
+    bpy.context.scene.objects.active = ob
+
+    log_message("Creating materials segmentation")
+    # create material segmentation
+    if segmented_materials:
+        materials = create_segmentation(ob, params)
+    else:
+        materials = {'FullBody': bpy.data.materials['Material']}
+
+    # unblocking both the pose and the blendshape limits
+    for k in ob.data.shape_keys.key_blocks.keys():
+        bpy.data.shape_keys["Key"].key_blocks[k].slider_min = -10
+        bpy.data.shape_keys["Key"].key_blocks[k].slider_max = 10
+
+    scene.objects.active = arm_ob
+    return(scene, ob, obname, arm_ob, cam_ob, materials)
+
+
+# Blender state shared by all the jobs of one gender: the imported model, the
+# segmentation materials with the compiled spherical harmonics script and the smpl data,
+# opened from the scene template of the gender if it is up to date
+def init_session(params, gender):
+    camera_distance = 11.0#np.random.normal(8.0, 1)
+    params['camera_distance'] = camera_distance
+
+    is_template = is_template_current(params, gender)
+    if is_template:
+        log_message("Opening scene template")
+        open_template(params, gender)
+        scene = bpy.data.scenes['Scene']
+        obname = '%s_avg' % gender[0]
+        ob = bpy.data.objects[obname]
+        arm_ob = bpy.data.objects['Armature']
+        cam_ob = bpy.data.objects['Camera']
+        if segmented_materials:
+            materials = {sorted_parts[slot.material.pass_index - 1]: slot.material for slot in ob.material_slots}
+        else:
+            materials = {'FullBody': bpy.data.materials['Material']}
+    else:
+        log_message("No up to date scene template, building the scene")
+        scene, ob, obname, arm_ob, cam_ob, materials = build_scene(params, gender)
+
+    if segmented_materials:
+        prob_dressed = {'leftLeg':.5, 'leftArm':.9, 'leftHandIndex1':.01,
+                        'rightShoulder':.8, 'rightHand':.01, 'neck':.01,
+                        'rightToeBase':.9, 'leftShoulder':.8, 'leftToeBase':.9,
+                        'rightForeArm':.5, 'leftHand':.01, 'spine':.9,
+                        'leftFoot':.9, 'leftUpLeg':.9, 'rightUpLeg':.9,
+                        'rightFoot':.9, 'head':.01, 'leftForeArm':.5,
+                        'rightArm':.5, 'spine1':.9, 'hips':.9,
+                        'rightHandIndex1':.01, 'spine2':.9, 'rightLeg':.5}
+    else:
+        prob_dressed = {'FullBody': .6}
+
+    log_message("Loading parts segmentation")
+    beta_stds = np.load(join(params['smpl_data_folder'], ('%s_beta_stds.npy' % gender)))
+
+    log_message("Loading smpl data")
+    smpl_data = open_smpl_data(params)
+
+    # pelvis and camera locations of the imported model, the jobs place the camera relative to them
+    pelvis_head = arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()
+    orig_cam_loc = cam_ob.location.copy()
+    print ("CAM LOC:", orig_cam_loc, type(orig_cam_loc))
+
+    orig_trans = np.asarray(arm_ob.pose.bones[obname+'_Pelvis'].location).copy()
+    sh_group = bpy.data.node_groups['SphericalHarmonics']
+
+    return({'gender': gender, 'scene': scene, 'ob': ob, 'obname': obname, 'arm_ob': arm_ob, 'cam_ob': cam_ob,
+            'materials': materials, 'prob_dressed': prob_dressed, 'sh_group': sh_group, 'smpl_data': smpl_data,
+            'beta_stds': beta_stds, 'camera_distance': camera_distance, 'pelvis_head': pelvis_head,
+            'orig_cam_loc': orig_cam_loc, 'orig_trans': orig_trans, 'frame': scene.frame_current,
+            'images': [], 'njobs': 0, 'template': is_template})
+
+
+# undo what a job changed in the session: animations, pose, camera and images
+# (the rest skeleton is set again by reset_joint_positions in the next job)
+def reset_session(session):
+    scene = session['scene']
+    ob, arm_ob, cam_ob, obname = session['ob'], session['arm_ob'], session['cam_ob'], session['obname']
+
+    ob.data.shape_keys.animation_data_clear()
+    arm_ob.animation_data_clear()
+    cam_ob.animation_data_clear()
+    for action in list(bpy.data.actions):
+        if action.users == 0:
+            bpy.data.actions.remove(action)
+    for img in session['images']:
+        bpy.data.images.remove(img)
+    session['images'] = []
+
+    if arm_ob.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    scene.objects.active = arm_ob
+    for pose_bone in arm_ob.pose.bones:
+        pose_bone.rotation_quaternion = Quaternion((1, 0, 0, 0))
+    arm_ob.pose.bones[obname+'_Pelvis'].location = session['orig_trans']
+    cam_ob.location = session['orig_cam_loc'].copy()
+    scene.frame_set(session['frame'])
+
+
+# render one job; session is None for a single-job run (the session is then created for this job)
+def run_job(session, args, idx_info, params):
     idx = args.idx
     name = args.name
     ishape = args.ishape
@@ -540,8 +718,6 @@ def main():
         log_message("WARNING: stride not specified, using default value 50")
         stride = 50
     
-    # import idx info (name, split)
-    idx_info = load(open("pkl/idx_info.pickle", 'rb'))
     # get runpass
     (runpass, idx) = divmod(idx, len(idx_info))
     
@@ -558,11 +734,6 @@ def main():
     log_message("sequence: %s" % idx_info['name'])
     log_message("nb_frames: %f" % idx_info['nb_frames'])
     #log_message("use_split: %s" % idx_info['use_split'])
-
-    # import configuration
-    log_message("Importing configuration")
-    import config
-    params = config.load_file('config', 'SYNTH_DATA')
    
     smpl_data_folder = params['smpl_data_folder']
     smpl_data_filename = params['smpl_data_filename']
@@ -576,6 +747,7 @@ def main():
     stepsize = params['stepsize']
     clipsize = params['clipsize']
     openexr_py2_path = params['openexr_py2_path']
+    manifest_file = manifest_path(output_path)
 
     # compute number of cuts
     nb_ishape = max(1, int(np.ceil((idx_info['nb_frames'] - (clipsize - stride))/stride)))
@@ -588,12 +760,23 @@ def main():
     
     # name is set given idx
     name = idx_info['name']
-    output_path = join(output_path, 'run%d' % runpass, name.replace(" ", ""))
+    # with direction_folders, each direction has its own output and tmp folders (<name>_f, <name>_b)
+    output_path = join(output_path, 'run%d' % runpass, job_dirname(name, direction, params))
     params['output_path'] = output_path
-    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, name.replace(" ", ""), (ishape + 1)))
+    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, job_dirname(name, direction, params), (ishape + 1)))
+    if args.frame_range is not None:
+        # each shard of the clip renders into its own tmp folder
+        tmp_path = shard_tmp_path(tmp_path, args.frame_range)
     params['tmp_path'] = tmp_path
     
-    # check if already computed
+    # check if already computed (see manifest.py)
+    clip_prefix = join(output_path, name.replace(" ", "") + "_c%04d" % (ishape + 1))
+    clip_job = {'stride': stride, 'direction': direction, 'subject_id': subject_id}
+    if params.get('resume', True) and is_clip_complete(manifest_file, clip_prefix, clip_job, params):
+        log_message("Clip %s is complete in %s, skipping" % (clip_prefix, manifest_file))
+        return
+    start_clip(manifest_file, clip_prefix, clip_job)
+
     #  + clean up existing tmp folders if any
     if exists(tmp_path) and tmp_path != "" and tmp_path != "/":
         os.system('rm -rf %s' % tmp_path)
@@ -619,22 +802,22 @@ def main():
     
     log_message("Setup Blender")
 
-    # create copy-spher.harm. directory if not exists
-    sh_dir = join(tmp_path, 'spher_harm')
-    if not exists(sh_dir):
-        mkdir_safe(sh_dir)
-    sh_dst = join(sh_dir, 'sh_%02d_%05d.osl' % (runpass, idx))
-    os.system('cp spher_harm/sh.osl %s' % sh_dst)
-
-    genders = {0: 'male', 1: 'female'}
     # pick random gender
-    gender = genders[sum(divmod(subject_id, 2))%2] #genders[subject_id % 2]#choice(genders)
+    gender = job_gender(subject_id)
 
-    scene = bpy.data.scenes['Scene']
-    scene.render.engine = 'CYCLES'
-    bpy.data.materials['Material'].use_nodes = True
-    scene.cycles.shading_system = True
-    scene.use_nodes = True
+    if session is None:
+        session = init_session(params, gender)
+    else:
+        assert(session['gender'] == gender)
+        reset_session(session)
+    session['njobs'] += 1
+
+    scene = session['scene']
+    ob, obname, arm_ob, cam_ob = session['ob'], session['obname'], session['arm_ob'], session['cam_ob']
+    materials = session['materials']
+    sh_group = session['sh_group']
+    smpl_data = session['smpl_data']
+    camera_distance = session['camera_distance']
 
     log_message("Listing background images")
     #bg_names = join(bg_path, '%s_img.txt' % idx_info['use_split'])
@@ -663,58 +846,29 @@ def main():
     # random background
     bg_img_name = choice(nh_txt_paths)[:-1]
     bg_img = bpy.data.images.load(bg_img_name)
+    session['images'] += [cloth_img, bg_img]
 
-    log_message("Loading parts segmentation")
-    beta_stds = np.load(join(smpl_data_folder, ('%s_beta_stds.npy' % gender)))
-    
-    log_message("Building materials tree")
-    mat_tree = bpy.data.materials['Material'].node_tree
-    create_sh_material(mat_tree, sh_dst, cloth_img)
-    res_paths = create_composite_nodes(scene.node_tree, params, img=bg_img, idx=idx)
-
-    log_message("Loading smpl data")
-    smpl_data = np.load(join(smpl_data_folder, smpl_data_filename))
-    
-    log_message("Initializing scene")
-    camera_distance = 11.0#np.random.normal(8.0, 1)
-    params['camera_distance'] = camera_distance
-    ob, obname, arm_ob, cam_ob = init_scene(scene, params, gender)
-
-    setState0()
-    ob.select = True
-    bpy.context.scene.objects.active = ob
-    segmented_materials = True #True: 0-24, False: expected to have 0-1 bg/fg
-    
-    log_message("Creating materials segmentation")
-    # create material segmentation
-    if segmented_materials:
-        materials = create_segmentation(ob, params)
-        prob_dressed = {'leftLeg':.5, 'leftArm':.9, 'leftHandIndex1':.01,
-                        'rightShoulder':.8, 'rightHand':.01, 'neck':.01,
-                        'rightToeBase':.9, 'leftShoulder':.8, 'leftToeBase':.9,
-                        'rightForeArm':.5, 'leftHand':.01, 'spine':.9,
-                        'leftFoot':.9, 'leftUpLeg':.9, 'rightUpLeg':.9,
-                        'rightFoot':.9, 'head':.01, 'leftForeArm':.5,
-                        'rightArm':.5, 'spine1':.9, 'hips':.9,
-                        'rightHandIndex1':.01, 'spine2':.9, 'rightLeg':.5}
+    sh_group.nodes['Image Texture'].image = cloth_img
+    if session['template']:
+        res_paths = update_composite_nodes(scene.node_tree, params, img=bg_img, idx=idx)
     else:
-        materials = {'FullBody': bpy.data.materials['Material']}
-        prob_dressed = {'FullBody': .6}
+        res_paths = create_composite_nodes(scene.node_tree, params, img=bg_img, idx=idx)
+    # shards keep their EXRs in their tmp folders, finalize.py converts them
+    is_capture = params.get('post_mode', 'part2') == 'capture' and args.frame_range is None
+    if is_capture:
+        capture_dir = join(params.get('capture_path', '/dev/shm'), os.path.basename(tmp_path))
+        if exists(capture_dir):
+            os.system('rm -rf %s' % capture_dir)
+        pass_paths = capture_pass_paths(scene.node_tree, res_paths, capture_dir)
 
     orig_pelvis_loc = None
     random_zrot = get_zrot(name, direction)
     if direction == 'forward':
-        orig_pelvis_loc = (arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()) - Vector((-1., 0.75, -1.3))
+        orig_pelvis_loc = session['pelvis_head'].copy() - Vector((-1., 0.75, -1.3))
     elif direction == 'backward':
-        orig_pelvis_loc = (arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()) - Vector((-1., 0.75, 3.1))
+        orig_pelvis_loc = session['pelvis_head'].copy() - Vector((-1., 0.75, 3.1))
     
-    orig_cam_loc = cam_ob.location.copy()
-    print ("CAM LOC:", orig_cam_loc, type(orig_cam_loc))
-
-    # unblocking both the pose and the blendshape limits
-    for k in ob.data.shape_keys.key_blocks.keys():
-        bpy.data.shape_keys["Key"].key_blocks[k].slider_min = -10
-        bpy.data.shape_keys["Key"].key_blocks[k].slider_max = 10
+    orig_cam_loc = session['orig_cam_loc'].copy()
 
     log_message("Loading body data")
     cmu_parms, fshapes, name = load_body_data(smpl_data, ob, obname, name, gender=gender)
@@ -733,20 +887,12 @@ def main():
     
     ndofs = 10
 
-    scene.objects.active = arm_ob
-    orig_trans = np.asarray(arm_ob.pose.bones[obname+'_Pelvis'].location).copy()
+    orig_trans = session['orig_trans'].copy()
 	
     # create output directory
     if not exists(output_path):
         mkdir_safe(output_path)
 
-    # spherical harmonics material needs a script to be loaded and compiled
-    scs = []
-    for mname, material in materials.items():
-        scs.append(material.node_tree.nodes['Script'])
-        scs[-1].filepath = sh_dst
-        scs[-1].update()
-
     rgb_dirname = name.replace(" ", "") + '_c%04d.mp4' % (ishape + 1)
     rgb_path = join(tmp_path, rgb_dirname)
 
@@ -801,43 +947,94 @@ def main():
     arm_ob.animation_data_clear()
     cam_ob.animation_data_clear()
 
+    clip_poses = data['poses'][fbegin:fend:stepsize]
+    clip_trans = data['trans'][fbegin:fend:stepsize]
+    frames = [get_real_frame(seq_frame) for seq_frame in range(N)]
+    # all the frames are animated with the same random draws, only those of the shard are rendered
+    if args.frame_range is not None:
+        render_frames = frames[args.frame_range[0]:args.frame_range[1]]
+        log_message("Rendering frames %d to %d of the clip" % (args.frame_range[0], args.frame_range[1] - 1))
+    else:
+        render_frames = frames
+    # shape of the rest skeleton and pelvis translations, to recompute the joints without Blender (smpl_fk.py)
+    if is_fk_joints or params.get('info_fk_fields', False):
+        dict_info['restShape'] = np.array(curr_shape[:ndofs], dtype='float32')
+        dict_info['trans'] = np.array(clip_trans, dtype='float32').T
+
     # create a keyframe animation with pose, translation, blendshapes and camera motion
-    # LOOP TO CREATE 3D ANIMATION
-    for seq_frame, (pose, trans) in enumerate(zip(data['poses'][fbegin:fend:stepsize], data['trans'][fbegin:fend:stepsize])):
-        iframe = seq_frame
-        scene.frame_set(get_real_frame(seq_frame))
-
-        # Change shape
-        if is_arbitrary_shape and iframe % 2 == 0:
-            shape = choice(fshapes)
-            shape += np.random.normal(0, .1, shape.shape)
-
-        # apply the translation, pose and shape to the character
-        apply_trans_pose_shape(Vector(trans), pose, shape, ob, arm_ob, obname, scene, cam_ob, get_real_frame(seq_frame))
-        dict_info['shape'][:, iframe] = shape[:ndofs]
-        dict_info['pose'][:, iframe] = pose
-        dict_info['gender'][iframe] = list(genders)[list(genders.values()).index(gender)]
+    if is_bulk_keyframing:
+        # draw the shapes with the same random calls, in the same order, as the loop below
+        clip_shapes = np.empty((N, len(shape)))
+        for iframe in range(N):
+            if is_arbitrary_shape and iframe % 2 == 0:
+                shape = choice(fshapes)
+                shape += np.random.normal(0, .1, shape.shape)
+            clip_shapes[iframe] = shape
+
+        mat_rots, quats, pose_bshapes = batch_rodrigues2bshapes(clip_poses)
+        root_quat = Quaternion(Euler((0, 0, random_zrot), 'XYZ'))
+        build_clip_animation(ob, arm_ob, obname, part_match, frames, clip_trans, quats,
+                             pose_bshapes, clip_shapes, root_quat)
+
+        dict_info['shape'][:, :] = clip_shapes[:, :ndofs].T
+        dict_info['pose'][:, :] = clip_poses.T
+        dict_info['gender'][:] = list(genders)[list(genders.values()).index(gender)]
         if(output_types['vblur']):
-            dict_info['vblur_factor'][iframe] = vblur_factor
-
-        arm_ob.pose.bones[obname+'_root'].rotation_quaternion = Quaternion(Euler((0, 0, random_zrot), 'XYZ'))
-        arm_ob.pose.bones[obname+'_root'].keyframe_insert('rotation_quaternion', frame=get_real_frame(seq_frame))
-        dict_info['zrot'][iframe] = random_zrot
+            dict_info['vblur_factor'][:] = vblur_factor
+        dict_info['zrot'][:] = random_zrot
 
+        # bodies centered on the first frame of the clip
+        scene.frame_set(frames[0])
         scene.update()
-
-        # Bodies centered only in each minibatch of clipsize frames
-        if seq_frame == 0 or reset_loc: 
-            reset_loc = False
-            new_pelvis_loc = arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()
-            cam_ob.location = orig_cam_loc.copy() + (new_pelvis_loc.copy() - orig_pelvis_loc.copy())
-            cam_ob.keyframe_insert('location', frame=get_real_frame(seq_frame))
-            dict_info['camLoc'] = np.array(cam_ob.location)
+        new_pelvis_loc = arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()
+        cam_ob.location = orig_cam_loc.copy() + (new_pelvis_loc.copy() - orig_pelvis_loc.copy())
+        cam_ob.keyframe_insert('location', frame=frames[0])
+        dict_info['camLoc'] = np.array(cam_ob.location)
+    else:
+        # LOOP TO CREATE 3D ANIMATION
+        for seq_frame, (pose, trans) in enumerate(zip(data['poses'][fbegin:fend:stepsize], data['trans'][fbegin:fend:stepsize])):
+            iframe = seq_frame
+            scene.frame_set(get_real_frame(seq_frame))
+
+            # Change shape
+            if is_arbitrary_shape and iframe % 2 == 0:
+                shape = choice(fshapes)
+                shape += np.random.normal(0, .1, shape.shape)
+
+            # apply the translation, pose and shape to the character
+            apply_trans_pose_shape(Vector(trans), pose, shape, ob, arm_ob, obname, scene, cam_ob, get_real_frame(seq_frame))
+            dict_info['shape'][:, iframe] = shape[:ndofs]
+            dict_info['pose'][:, iframe] = pose
+            dict_info['gender'][iframe] = list(genders)[list(genders.values()).index(gender)]
+            if(output_types['vblur']):
+                dict_info['vblur_factor'][iframe] = vblur_factor
+
+            arm_ob.pose.bones[obname+'_root'].rotation_quaternion = Quaternion(Euler((0, 0, random_zrot), 'XYZ'))
+            arm_ob.pose.bones[obname+'_root'].keyframe_insert('rotation_quaternion', frame=get_real_frame(seq_frame))
+            dict_info['zrot'][iframe] = random_zrot
+
+            scene.update()
+
+            # Bodies centered only in each minibatch of clipsize frames
+            if seq_frame == 0 or reset_loc: 
+                reset_loc = False
+                new_pelvis_loc = arm_ob.matrix_world.copy() * arm_ob.pose.bones[obname+'_Pelvis'].head.copy()
+                cam_ob.location = orig_cam_loc.copy() + (new_pelvis_loc.copy() - orig_pelvis_loc.copy())
+                cam_ob.keyframe_insert('location', frame=get_real_frame(seq_frame))
+                dict_info['camLoc'] = np.array(cam_ob.location)
+
+    if is_fk_joints:
+        # joints of the whole clip from the rest skeleton set by reset_joint_positions
+        bone_names = [obname+'_root'] + [obname+'_'+part_match['bone_%02d' % ibone] for ibone in range(24)]
+        rig = get_rig(ob, arm_ob, bone_names, smpl_data['regression_verts'])
+        joints2d, joints3d = clip_joints(rig, rig['rest_heads'][1:], clip_poses, clip_trans, random_zrot,
+                                         dict_info['camLoc'], (params['resy'], params['resx']))
+        dict_info['joints2D'][:, :, :] = joints2d.transpose(2, 1, 0)
+        dict_info['joints3D'][:, :, :] = joints3d.transpose(2, 1, 0)
 
     scene.node_tree.nodes['Image'].image = bg_img
 
-    for part, material in materials.items():
-        material.node_tree.nodes['Vector Math'].inputs[1].default_value[:2] = (0, 0)
+    sh_group.nodes['Vector Math'].inputs[1].default_value[:2] = (0, 0)
 
     # random light
     sh_coeffs = .7 * (2 * np.random.rand(9) - 1)
@@ -845,78 +1042,262 @@ def main():
     sh_coeffs[1] = -.7 * np.random.rand()
 
     for ish, coeff in enumerate(sh_coeffs):
-        for sc in scs:
-            sc.inputs[ish+1].default_value = coeff
+        sh_group.nodes['Script'].inputs[ish+1].default_value = coeff
+
+    if is_capture:
+        from clip_io import clip_writer
+        writer = clip_writer(params.get('output_backend', 'mat'), join(output_path, name.replace(" ", "") + "_c%04d" % (ishape + 1)),
+                             N, params.get('pass_encoding', 'dense'))
+    # shards are encoded by finalize.py once merged
+    streams = None
+    if params.get('stream_videos', False) and args.frame_range is None:
+        from video_stream import open_clip_streams, write_clip_frame, close_clip_streams
+        streams = open_clip_streams(output_path, name, ishape, output_types, log=log_message)
+        frame_dirs = dict(res_paths, rgb=rgb_path)
+
+    # outputs of a frame once it is written: captured passes and video frames
+    def frame_written(iframe, frame):
+        if is_capture:
+            capture_frame(writer, iframe, pass_paths, frame)
+        if streams is not None:
+            write_clip_frame(streams, frame_dirs, frame)
+
+    if is_animation_render:
+        # RENDER THE WHOLE CLIP: one animation render over the frames of the clip,
+        # Cycles keeps its scene data from one frame to the next
+        for iframe, frame in enumerate(frames):
+            dict_info['bg'][iframe] = bg_img_name
+            dict_info['cloth'][iframe] = cloth_img_name
+            dict_info['light'][:, iframe] = sh_coeffs
+
+        # bone locations are saved on each frame change of the render, once the bones are updated
+        def store_bone_locs(scene):
+            if scene.frame_current in frames:
+                iframe = frames.index(scene.frame_current)
+                bone_locs_2D, bone_locs_3D = get_bone_locs(obname, arm_ob, scene, cam_ob)
+                dict_info['joints2D'][:, :, iframe] = np.transpose(bone_locs_2D)
+                dict_info['joints3D'][:, :, iframe] = np.transpose(bone_locs_3D)
+
+        # the passes of a frame are written by the compositor before its render_write
+        def store_frame(scene):
+            frame_written(frames.index(scene.frame_current), scene.frame_current)
+
+        scene.frame_start = render_frames[0]
+        scene.frame_end = render_frames[-1]
+        scene.frame_step = 1
+        scene.render.use_antialiasing = False
+        scene.render.use_persistent_data = True
+        # the frame number is appended as in Image%04d.png
+        scene.render.filepath = join(rgb_path, 'Image')
+
+        log_message("Rendering frames %d to %d" % (render_frames[0], render_frames[-1]))
+        if not is_fk_joints:
+            bpy.app.handlers.frame_change_post.append(store_bone_locs)
+        bpy.app.handlers.render_write.append(store_frame)
+        try:
+            render_quiet(animation=True)
+        finally:
+            if not is_fk_joints:
+                bpy.app.handlers.frame_change_post.remove(store_bone_locs)
+            bpy.app.handlers.render_write.remove(store_frame)
 
-    # iterate over the keyframes and render
-    # LOOP TO RENDER
-    for seq_frame, (pose, trans) in enumerate(zip(data['poses'][fbegin:fend:stepsize], data['trans'][fbegin:fend:stepsize])):
-        scene.frame_set(get_real_frame(seq_frame))
-        iframe = seq_frame
+        #Draw skeleton
+        if is_visualization:
+            for iframe, frame in enumerate(frames):
+                if frame in render_frames:
+                    draw_skeleton(join(rgb_path, 'Image%04d.png' % frame), dict_info['joints2D'][:, :, iframe])
+    else:
+        # iterate over the keyframes and render
+        # LOOP TO RENDER
+        for seq_frame, (pose, trans) in enumerate(zip(data['poses'][fbegin:fend:stepsize], data['trans'][fbegin:fend:stepsize])):
+            scene.frame_set(get_real_frame(seq_frame))
+            iframe = seq_frame
+        
+            dict_info['bg'][iframe] = bg_img_name
+            dict_info['cloth'][iframe] = cloth_img_name
+            dict_info['light'][:, iframe] = sh_coeffs
+            if get_real_frame(seq_frame) not in render_frames:
+                continue
 
-        dict_info['bg'][iframe] = bg_img_name
-        dict_info['cloth'][iframe] = cloth_img_name
-        dict_info['light'][:, iframe] = sh_coeffs
+            img_path = join(rgb_path, 'Image%04d.png' % get_real_frame(seq_frame))
+            scene.render.use_antialiasing = False
+            scene.render.filepath = img_path
 
-        img_path = join(rgb_path, 'Image%04d.png' % get_real_frame(seq_frame))
-        scene.render.use_antialiasing = False
-        scene.render.filepath = img_path
+            log_message("Rendering frame %d" % seq_frame)
 
-        log_message("Rendering frame %d" % seq_frame)
-        
-        # disable render output
-        logfile = '/dev/null'
-        open(logfile, 'a').close()
-        old = os.dup(1)
-        sys.stdout.flush()
-        os.close(1)
-        os.open(logfile, os.O_WRONLY)
+            # Render
+            render_quiet(write_still=True)
 
-        # Render
-        bpy.ops.render.render(write_still=True)
+            # bone locations should be saved after rendering so that the bones are updated
+            if is_fk_joints:
+                bone_locs_2D = np.transpose(dict_info['joints2D'][:, :, iframe])
+            else:
+                bone_locs_2D, bone_locs_3D = get_bone_locs(obname, arm_ob, scene, cam_ob)
+                dict_info['joints2D'][:, :, iframe] = np.transpose(bone_locs_2D)
+                dict_info['joints3D'][:, :, iframe] = np.transpose(bone_locs_3D)
 
-        # disable output redirection
-        os.close(1)
-        os.dup(old)
-        os.close(old)
-        
-        # bone locations should be saved after rendering so that the bones are updated
-        bone_locs_2D, bone_locs_3D = get_bone_locs(obname, arm_ob, scene, cam_ob)
-        dict_info['joints2D'][:, :, iframe] = np.transpose(bone_locs_2D)
-        dict_info['joints3D'][:, :, iframe] = np.transpose(bone_locs_3D)
+            #Draw skeleton
+            if is_visualization:
+                draw_skeleton(img_path, dict_info['joints2D'][:, :, iframe])
+            frame_written(iframe, get_real_frame(seq_frame))
 
-        #Draw skeleton
-        if is_visualization:
-            draw_skeleton(img_path, dict_info['joints2D'][:, :, iframe])
-        
-        reset_loc = (bone_locs_2D.max(axis=-1) > 256).any() or (bone_locs_2D.min(axis=0) < 0).any()
-        arm_ob.pose.bones[obname+'_root'].rotation_quaternion = Quaternion((1, 0, 0, 0))
+            reset_loc = (bone_locs_2D.max(axis=-1) > 256).any() or (bone_locs_2D.min(axis=0) < 0).any()
+            arm_ob.pose.bones[obname+'_root'].rotation_quaternion = Quaternion((1, 0, 0, 0))
 
     # save a .blend file for debugging:
     # bpy.ops.wm.save_as_mainfile(filepath=join(tmp_path, 'pre.blend'))
     
-    # save RGB data with ffmpeg (if you don't have h264 codec, you can replace with another one and control the quality with something like -q:v 3)
-    cmd_ffmpeg = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 ''%s_c%04d.mp4''' % (join(rgb_path, 'Image%04d.png'), join(output_path, name.replace(' ', '')), (ishape + 1))
-    log_message("Generating RGB video (%s)" % cmd_ffmpeg)
-    os.system(cmd_ffmpeg)
+    if args.frame_range is not None:
+        save_shard_info(tmp_path, args.frame_range, dict_info)
+        log_message("Shard done, the clip is assembled by finalize.py once all its shards are rendered")
+        return
     
-    if(output_types['vblur']):
-        cmd_ffmpeg_vblur = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 -vf "scale=trunc(iw/2)*2:trunc(ih/2)*2" ''%s_c%04d.mp4''' % (join(res_paths['vblur'], 'Image%04d.png'), join(output_path, name.replace(' ', '')+'_vblur'), (ishape + 1))
-        log_message("Generating vblur video (%s)" % cmd_ffmpeg_vblur)
-        os.system(cmd_ffmpeg_vblur)
-   
-    if(output_types['fg']):
-        cmd_ffmpeg_fg = 'ffmpeg -y -r 25 -i ''%s'' -c:v h264 -pix_fmt yuv420p -crf 23 ''%s_c%04d.mp4''' % (join(res_paths['fg'], 'Image%04d.png'), join(output_path, name.replace(' ', '')+'_fg'), (ishape + 1))
-        log_message("Generating fg video (%s)" % cmd_ffmpeg_fg)
-        os.system(cmd_ffmpeg_fg)
-   
-    cmd_tar = 'tar -czvf %s/%s.tar.gz -C %s %s' % (output_path, rgb_dirname, tmp_path, rgb_dirname)
-    log_message("Tarballing the images (%s)" % cmd_tar)
-    os.system(cmd_tar)
-    
-    # save annotation excluding png/exr data to _info.mat file
-    import scipy.io
-    scipy.io.savemat(matfile_info, dict_info, do_compression=True)
+    post_mode = params.get('post_mode', 'part2')
+    finalize_args = {'output_path': output_path, 'tmp_path': tmp_path, 'name': name, 'ishape': ishape,
+                     'res_paths': res_paths, 'output_types': output_types, 'dict_info': dict_info,
+                     'archive_format': params.get('archive_format', 'tar.gz'),
+                     'archive_async': params.get('archive_async', False),
+                     'workers': params.get('finalize_workers', 1)}
+    # the clip is recorded complete by main_part2.py with post_mode 'part2'
+    manifest_args = None
+    if post_mode != 'part2':
+        manifest_args = {'path': manifest_file, 'clip_prefix': clip_prefix, 'job': clip_job, 'params': params}
+    # EXR passes converted here instead of by main_part2.py
+    convert_args = None
+    if post_mode == 'fused':
+        convert_args = {'tmp_path': tmp_path, 'clip_prefix': clip_prefix,
+                        'idx': idx, 'nclip_frames': N, 'params': params}
+
+    # detached finalizer: the video streams and the captured passes are closed here, the
+    # rest runs in another process while this one renders the next clip (with post_mode
+    # 'part2', main_part2.py would read the tmp folder while it is finalized)
+    if params.get('finalizer_python', '') != '' and post_mode != 'part2':
+        if streams is not None:
+            close_clip_streams(streams)
+            finalize_args['streams'] = {}
+        if is_capture:
+            log_message("Saving %s output" % params.get('output_backend', 'mat'))
+            writer.close()
+            os.system('rm -rf %s' % capture_dir)
+        if convert_args is not None:
+            convert_args['workers'] = params.get('post_workers', 1)
+        detach_finalize(params['finalizer_python'], tmp_path,
+                        {'finalize': finalize_args, 'convert': convert_args, 'cleanup': True, 'manifest': manifest_args,
+                         'openexr_py2_path': params.get('openexr_py2_path', '')}, log=log_message)
+        return
+
+    # the EXR passes are decoded on this thread, before the threads of finalize_clip:
+    # without OpenEXR they are loaded with bpy, which is not thread-safe
+    codes = {}
+    if convert_args is not None:
+        from main_part2 import convert_clip
+        try:
+            convert_clip(log=log_message, **convert_args)
+            codes['passes'] = 0
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            codes['passes'] = -1
+            log_message("WARNING: passes failed")
+
+    extra_tasks = []
+    if is_capture:
+        extra_tasks.append(('passes', writer.close, ()))
+    on_complete = None
+    if manifest_args is not None and all(code == 0 for code in codes.values()):
+        on_complete = lambda: record_clip(**manifest_args)
+    codes.update(finalize_clip(log=log_message, streams=streams, extra_tasks=extra_tasks, on_complete=on_complete, **finalize_args))
+
+    if is_capture:
+        os.system('rm -rf %s' % capture_dir)
+    # the tmp folder is left to main_part2.py with post_mode 'part2'
+    if post_mode != 'part2' and all(code == 0 for code in codes.values()):
+        if tmp_path != "" and tmp_path != "/":
+            log_message("Cleaning up tmp")
+            os.system('rm -rf %s' % tmp_path)
+
+# claim the next job of the given gender in a queue file
+# a job is claimed by creating <queue>.claims/<line number> exclusively, so several workers
+# (one per gender or more) can share a queue; lines can be appended while the workers run
+def claim_next_job(queue_path, gender, skip):
+    claims_dir = queue_path + '.claims'
+    mkdir_safe(claims_dir)
+    with open(queue_path) as f:
+        lines = f.read().splitlines()
+    for iline, line in enumerate(lines):
+        if iline in skip:
+            continue
+        skip.add(iline)
+        if line.strip() == '' or line.startswith('#'):
+            continue
+        args = parse_job_args(line.split())
+        if args.idx == None or args.ishape == None or args.subject_id == None:
+            log_message("WARNING: skipping job without idx, ishape or subject_id (%s)" % line)
+            continue
+        if job_gender(args.subject_id) != gender:
+            continue
+        claim_path = join(claims_dir, '%06d' % iline)
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        os.write(fd, ('%d %s\n' % (os.getpid(), line)).encode('utf-8'))
+        os.close(fd)
+        return(claim_path, args)
+    return(None, None)
+
+
+# persistent worker: one Blender session for all the jobs of a gender in the queue
+def run_worker(queue_path, gender, idx_info, params):
+    import traceback
+    log_message("Worker %d (%s) on queue %s" % (os.getpid(), gender, queue_path))
+
+    session = init_session(dict(params), gender)
+
+    skip = set()
+    while True:
+        claim_path, args = claim_next_job(queue_path, gender, skip)
+        if claim_path is None:
+            break
+        log_message("Starting job %s" % claim_path)
+        try:
+            run_job(session, args, idx_info, dict(params))
+            status = 'done'
+        except Exception:
+            traceback.print_exc()
+            status = 'failed'
+        with open(claim_path, 'a') as f:
+            f.write('%s\n' % status)
+        log_message("Job %s %s" % (claim_path, status))
+    log_message("Queue empty, %d jobs rendered" % session['njobs'])
+
+
+def main():
+    # time logging
+    global start_time
+    start_time = time.time()
+
+    # parse commandline arguments
+    log_message(sys.argv)
+    args = parse_job_args(sys.argv[sys.argv.index("---") + 1:])
+
+    # import idx info (name, split)
+    idx_info = load(open("pkl/idx_info.pickle", 'rb'))
+
+    # import configuration
+    log_message("Importing configuration")
+    import config
+    params = config.load_file('config', 'SYNTH_DATA')
+
+    if args.queue is not None:
+        if args.gender is None:
+            log_message("ERROR: --gender is required with --queue")
+            exit(1)
+        run_worker(args.queue, args.gender, idx_info, params)
+    else:
+        run_job(None, args, idx_info, params)
+    # archives of the rgb frames still written in the background (archive_async)
+    wait_archives(log_message)
 
 if __name__ == '__main__':
     main()
@@ -4,12 +4,12 @@ from os import remove
 from os.path import join, dirname, realpath, exists
 import numpy as np
 
+sys.path.insert(0, ".")
+from smpl_store import open_smpl_data, load_sequence
+from clip_range import cut_sequence, clip_range, clip_nframes, job_dirname
+
 def load_body_data(smpl_data, name, idx=0):
-    cmu_parms = {}
-    for seq in smpl_data.files:
-        if seq == ('pose_' + name):
-            cmu_parms[seq.replace('pose_', '')] = {'poses':smpl_data[seq],
-                                                   'trans':smpl_data[seq.replace('pose_','trans_')]}
+    cmu_parms = {name: load_sequence(smpl_data, name)}
     return(cmu_parms, name)
     
 import time
@@ -19,51 +19,41 @@ def log_message(message):
     print("[%.2f s] %s" % (elapsed_time, message))
 
 
-# Cut gaits to exclude shit frames (as in main_part1)
-def cut_sequence(name, data):
-    if name == '05_01':
-        data['poses'] = data['poses'][:-80]
-        data['trans'] = data['trans'][:-80]
-    elif name == '39_01':
-        data['poses'] = data['poses'][:-20]
-        data['trans'] = data['trans'][:-20]
-    elif name == '10_04':
-        data['poses'] = data['poses'][60:]
-        data['trans'] = data['trans'][60:]
-    elif name == '45_01':
-        data['poses'] = data['poses'][:180]
-        data['trans'] = data['trans'][:180]
-    elif name == 'ung_47_01':
-        data['poses'] = data['poses'][:240]
-        data['trans'] = data['trans'][:240]
-    elif name == 'ung_77_28':
-        data['poses'] = data['poses'][240:840]
-        data['trans'] = data['trans'][240:840]
-    elif name == 'ung_82_11':
-        data['poses'] = data['poses'][240:]
-        data['trans'] = data['trans'][240:]
-    elif name == 'ung_91_57':
-        data['poses'] = data['poses'][250:-250]
-        data['trans'] = data['trans'][250:-250]
-    elif name == 'ung_104_02':
-        data['poses'] = data['poses'][:-240]
-        data['trans'] = data['trans'][:-240]
-    elif name == 'ung_113_25':
-        data['poses'] = data['poses'][:-120]
-        data['trans'] = data['trans'][:-120]
-    elif name == 'ung_120_20':
-        data['poses'] = data['poses'][240:1200]
-        data['trans'] = data['trans'][240:1200]
-    elif name == 'ung_132_18':
-        data['poses'] = data['poses'][120:]
-        data['trans'] = data['trans'][120:]
-    elif name == 'ung_136_21':
-        data['poses'] = data['poses'][60:-60]
-        data['trans'] = data['trans'][60:-60]
-    elif name == 'ung_139_28':                         
-        data['poses'] = data['poses'][240:960]
-        data['trans'] = data['trans'][240:960]  
-    return data
+# decode the EXR passes of a rendered clip from its tmp folder and write them with the
+# output backend of config (see clip_io.py); also called by main_part1 with post_mode = 'fused'
+def convert_clip(tmp_path, clip_prefix, idx, nclip_frames, params, workers=1, log=log_message):
+    from exr_io import read_frame
+    from clip_io import exr_passes, clip_writer
+
+    output_types = params['output_types']
+    res_paths = {k:join(tmp_path, '%05d_%s'%(idx, k)) for k in output_types if output_types[k]}
+    get_real_frame = lambda ifr: ifr
+    pass_paths = {k: folder for k, folder in res_paths.items() if k in exr_passes}
+    tasks = [(pass_paths, get_real_frame(seq_frame)) for seq_frame in range(nclip_frames)]
+
+    # decode the frames in a pool of processes, imap returns them in frame order
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers)
+        frame_mats = pool.imap(read_frame, tasks, chunksize=4)
+    else:
+        pool = None
+        frame_mats = (read_frame(task) for task in tasks)
+
+    # .mat files or .h5 (see clip_io.py)
+    output_backend = params.get('output_backend', 'mat')
+    writer = clip_writer(output_backend, clip_prefix, len(tasks), params.get('pass_encoding', 'dense'))
+
+    # LOOP OVER FRAMES
+    for iframe, mats in enumerate(frame_mats):
+        log("Processing frame %d" % iframe)
+        writer.write_frame(iframe, mats)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    log("Saving %s output" % output_backend)
+    writer.close()
 
 
 if __name__ == '__main__':
@@ -146,74 +136,45 @@ if __name__ == '__main__':
     stepsize = params['stepsize']
     clipsize = params['clipsize']
     openexr_py2_path = params['openexr_py2_path']
+    post_workers = params.get('post_workers', 1)
+
+    if params.get('post_mode', 'part2') != 'part2':
+        log_message("post_mode is %s, the EXR passes were converted by main_part1" % params['post_mode'])
+        exit(0)
     
     # check whether openexr_py2_path is loaded from configuration file
     if 'openexr_py2_path' in locals() or 'openexr_py2_path' in globals():
         for exr_path in openexr_py2_path.split(':'):
             sys.path.insert(1, exr_path)
 
-    # to read exr imgs
-    import OpenEXR 
-    import array
-    import Imath
-    
-    log_message("Loading SMPL data")
-    smpl_data = np.load(join(smpl_data_folder, smpl_data_filename))
-    cmu_parms, name = load_body_data(smpl_data, name, idx)
-
-    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, name.replace(" ", ""), (ishape + 1)))
-    res_paths = {k:join(tmp_path, '%05d_%s'%(idx, k)) for k in output_types if output_types[k]}
-
-    data = cmu_parms[name]
-    data = cut_sequence(name, data)
-    
-    nframes = len(data['poses'][::stepsize])
-    output_path = join(output_path, 'run%d' % runpass, name.replace(" ", ""))
-    
-    # .mat files
-    matfile_normal = join(output_path, name.replace(" ", "") + "_c%04d_normal.mat" % (ishape + 1))
-    matfile_gtflow = join(output_path, name.replace(" ", "") + "_c%04d_gtflow.mat" % (ishape + 1))
-    matfile_depth = join(output_path, name.replace(" ", "") + "_c%04d_depth.mat" % (ishape + 1))
-    matfile_segm = join(output_path, name.replace(" ", "") + "_c%04d_segm.mat" % (ishape + 1))
-    dict_normal = {}
-    dict_gtflow = {}
-    dict_depth = {}
-    dict_segm = {}
-    get_real_frame = lambda ifr: ifr
-    FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
-
-    # overlap determined by stride (# subsampled frames to skip)
-    fbegin = ishape*stepsize*stride
-    fend = min(ishape*stepsize*stride + stepsize*clipsize, len(data['poses']))
-    # LOOP OVER FRAMES
-    for seq_frame, (pose, trans) in enumerate(zip(data['poses'][fbegin:fend:stepsize], data['trans'][fbegin:fend:stepsize])):
-        iframe = seq_frame
-        
-        log_message("Processing frame %d" % iframe)
-        
-        for k, folder in res_paths.items():
-            if not k== 'vblur' and not k=='fg':
-                path = join(folder, 'Image%04d.exr' % get_real_frame(seq_frame))
-                exr_file = OpenEXR.InputFile(path)
-                if k == 'normal':
-                    mat = np.transpose(np.reshape([array.array('f', exr_file.channel(Chan, FLOAT)).tolist() for Chan in ("R", "G", "B")], (3, resx, resy)), (1, 2, 0))
-                    dict_normal['normal_%d' % (iframe + 1)] = mat.astype(np.float32, copy=False) # +1 for the 1-indexing
-                elif k == 'gtflow':
-                    mat = np.transpose(np.reshape([array.array('f', exr_file.channel(Chan, FLOAT)).tolist() for Chan in ("R", "G")], (2, resx, resy)), (1, 2, 0))
-                    dict_gtflow['gtflow_%d' % (iframe + 1)] = mat.astype(np.float32, copy=False)
-                elif k == 'depth':
-                    mat = np.reshape([array.array('f', exr_file.channel(Chan, FLOAT)).tolist() for Chan in ("R")], (resx, resy))
-                    dict_depth['depth_%d' % (iframe + 1)] = mat.astype(np.float32, copy=False)
-                elif k == 'segm':
-                    mat = np.reshape([array.array('f', exr_file.channel(Chan, FLOAT)).tolist() for Chan in ("R")], (resx, resy))
-                    dict_segm['segm_%d' % (iframe + 1)] = mat.astype(np.uint8, copy=False)
-                #remove(path)
-
-    import scipy.io
-    scipy.io.savemat(matfile_normal, dict_normal, do_compression=True)
-    scipy.io.savemat(matfile_gtflow, dict_gtflow, do_compression=True)
-    scipy.io.savemat(matfile_depth, dict_depth, do_compression=True)
-    scipy.io.savemat(matfile_segm, dict_segm, do_compression=True)
+    # clip length from idx_info, the smpl data is only opened for sequences missing from it
+    for dic in idx_info:
+        if dic['name'] == name:
+            nclip_frames = clip_nframes(name, dic['nb_frames'], ishape, stepsize, stride, clipsize)
+            break
+    else:
+        log_message("Loading SMPL data")
+        smpl_data = open_smpl_data(params)
+        cmu_parms, name = load_body_data(smpl_data, name, idx)
+        data = cut_sequence(name, cmu_parms[name])
+        fbegin, fend = clip_range(len(data['poses']), ishape, stepsize, stride, clipsize)
+        nclip_frames = len(data['poses'][fbegin:fend:stepsize])
+    log_message("Clip of %d frames" % nclip_frames)
+
+    from manifest import manifest_path, is_clip_complete, record_clip
+    manifest_file = manifest_path(output_path)
+    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, job_dirname(name, direction, params), (ishape + 1)))
+    output_path = join(output_path, 'run%d' % runpass, job_dirname(name, direction, params))
+    clip_prefix = join(output_path, name.replace(" ", "") + "_c%04d" % (ishape + 1))
+
+    # skipped by main_part1 (see manifest.py)
+    clip_job = {'stride': stride, 'direction': direction, 'subject_id': subject_id}
+    if params.get('resume', True) and is_clip_complete(manifest_file, clip_prefix, clip_job, params):
+        log_message("Clip %s is complete in %s, skipping" % (clip_prefix, manifest_file))
+        exit(0)
+
+    convert_clip(tmp_path, clip_prefix, idx, nclip_frames, params, workers=post_workers)
+    record_clip(manifest_file, clip_prefix, clip_job, params)
 
     # cleaning up tmp
     if tmp_path != "" and tmp_path != "/":
@@ -17,6 +17,9 @@ from bpy_extras.object_utils import world_to_camera_view as world2cam
 from math import sin, cos
 
 sys.path.insert(0, ".")
+from smpl_store import open_smpl_data, load_sequence
+from clip_range import job_dirname
+
 is_visualization = True
 
 def mkdir_safe(directory):
@@ -365,11 +368,7 @@ def reset_joint_positions(orig_trans, shape, ob, arm_ob, obname, scene, cam_ob,
 # load poses and shapes
 def load_body_data(smpl_data, ob, obname, name, gender='female'):
     # load MoSHed data from CMU Mocap (only the given idx is loaded)
-    cmu_parms = {}
-    for seq in smpl_data.files:
-        if seq == ('pose_' + name):
-            cmu_parms[seq.replace('pose_', '')] = {'poses':smpl_data[seq],
-                                                   'trans':smpl_data[seq.replace('pose_','trans_')]}
+    cmu_parms = {name: load_sequence(smpl_data, name)}
     print("nframes: %d" % len(cmu_parms[name]['poses']))
 
     # compute the number of shape blendshapes in the model
@@ -541,9 +540,9 @@ def main():
     
     # name is set given idx
     name = idx_info['name']
-    output_path = join(output_path, 'run%d' % runpass, name.replace(" ", ""))
+    output_path = join(output_path, 'run%d' % runpass, job_dirname(name, direction, params))
     params['output_path'] = output_path
-    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, name.replace(" ", ""), (ishape + 1)))
+    tmp_path = join(tmp_path, 'run%d_%s_c%04d' % (runpass, job_dirname(name, direction, params), (ishape + 1)))
     params['tmp_path'] = tmp_path
     
     # check if already computed
@@ -626,7 +625,7 @@ def main():
     res_paths = create_composite_nodes(scene.node_tree, params, img=bg_img, idx=idx)
 
     log_message("Loading smpl data")
-    smpl_data = np.load(join(smpl_data_folder, smpl_data_filename))
+    smpl_data = open_smpl_data(params)
     
     log_message("Initializing scene")
     camera_distance = 11.#np.random.normal(8.0, 1)
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import zlib
+from os.path import join, exists, getsize, relpath, dirname, isfile
+from glob import glob
+
+# Completion manifest of the clips, <output_path>/manifest.jsonl: one JSON line
+# appended per event, the history of the run.
+#   {"clip": "run0/02_01_f/02_01_c0001", "event": "started", "job": {...}}
+#   {"clip": "run0/02_01_f/02_01_c0001", "event": "done", "job": {...},
+#    "config": <hash>, "outputs": {"02_01_c0001.mp4": [size, crc32], ...}}
+# The last event of each clip is also written to its own small file,
+# <output_path>/manifest_index/<clip>.json (replaced atomically), so that checking
+# a job reads one file, whatever the size of the manifest. A clip is complete if
+# its last event is 'done' for the same job (stride, direction, subject_id) and
+# config hash, and its outputs still have their recorded sizes (and checksums with
+# verify=True). main_part1 skips complete clips and records 'started' before it
+# cleans up the tmp folder, so that a clip that is being regenerated is no longer
+# complete. The clip is recorded 'done' by whichever step writes its last output:
+# main_part2 with post_mode 'part2', finalize_clip otherwise (after the
+# asynchronous archive). If the index is lost, it is rebuilt from the manifest:
+#
+#   python manifest.py /home/local/data/cmc/synthetic --rebuild
+
+manifest_filename = 'manifest.jsonl'
+index_dirname = 'manifest_index'
+
+# config entries that change the outputs of a clip
+config_keys = ('output_types', 'smpl_data_filename', 'bg_path', 'clothing_option', 'resx', 'resy',
+               'stepsize', 'clipsize', 'archive_format', 'output_backend', 'pass_encoding')
+
+
+def manifest_path(output_path):
+    return(join(output_path, manifest_filename))
+
+
+# the same under python 2 (main_part2) and Blender's python 3 (main_part1)
+def config_hash(params):
+    config = json.dumps([[k, params.get(k)] for k in config_keys], sort_keys=True)
+    return('%08x' % (zlib.crc32(config.encode('utf-8')) & 0xffffffff))
+
+
+def file_checksum(path, chunksize=1 << 22):
+    crc = 0
+    with open(path, 'rb') as f:
+        chunk = f.read(chunksize)
+        while chunk:
+            crc = zlib.crc32(chunk, crc)
+            chunk = f.read(chunksize)
+    return('%08x' % (crc & 0xffffffff))
+
+
+# files of a clip in its output folder: <clip_prefix>.mp4, <clip_prefix>_info.mat, ...
+# (the videos of the other outputs are <name>_vblur_c%04d.mp4 and <name>_fg_c%04d.mp4)
+def clip_outputs(clip_prefix):
+    folder, clip = os.path.split(clip_prefix)
+    name, suffix = clip.rsplit('_', 1)
+    paths = glob(clip_prefix + '.*') + glob(clip_prefix + '_*') + \
+        [join(folder, '%s%s_%s.mp4' % (name, video, suffix)) for video in ('_vblur', '_fg')]
+    return(sorted(path for path in set(paths) if isfile(path) and not path.endswith('.tmp')))
+
+
+def mkdir_safe(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not exists(directory):
+            raise
+
+
+def index_path(path, clip):
+    return(join(dirname(path), index_dirname, clip + '.json'))
+
+
+# last event of a clip, None if it has none
+def last_event(path, clip):
+    try:
+        with open(index_path(path, clip)) as f:
+            return(json.load(f))
+    except (IOError, OSError, ValueError):
+        return(None)
+
+
+def write_index(path, entry):
+    filepath = index_path(path, entry['clip'])
+    mkdir_safe(dirname(filepath))
+    tmp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+    with open(tmp_filepath, 'w') as f:
+        json.dump(entry, f, sort_keys=True)
+    os.rename(tmp_filepath, filepath)
+
+
+# one write per line, appended atomically by the concurrent jobs, then the index
+def append_event(path, entry):
+    mkdir_safe(dirname(path))
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8'))
+    finally:
+        os.close(fd)
+    write_index(path, entry)
+
+
+def read_manifest(path):
+    entries = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                continue
+    return(entries)
+
+
+# index of the last event of every clip of the manifest, returns the number of clips
+def rebuild_index(path):
+    last = {}
+    for entry in read_manifest(path):
+        last[entry['clip']] = entry
+    for entry in last.values():
+        write_index(path, entry)
+    return(len(last))
+
+
+def clip_name(path, clip_prefix):
+    return(relpath(clip_prefix, dirname(path)))
+
+
+def is_clip_complete(path, clip_prefix, job, params, verify=False):
+    entry = last_event(path, clip_name(path, clip_prefix))
+    if entry is None or entry['event'] != 'done' or entry['job'] != job or entry['config'] != config_hash(params):
+        return(False)
+    folder = dirname(clip_prefix)
+    for filename, (size, checksum) in entry['outputs'].items():
+        filepath = join(folder, filename)
+        if not exists(filepath) or getsize(filepath) != size:
+            return(False)
+        if verify and file_checksum(filepath) != checksum:
+            return(False)
+    return(True)
+
+
+def start_clip(path, clip_prefix, job):
+    append_event(path, {'clip': clip_name(path, clip_prefix), 'event': 'started', 'job': job,
+                        'time': time.time()})
+
+
+def record_clip(path, clip_prefix, job, params):
+    outputs = {os.path.basename(filepath): [getsize(filepath), file_checksum(filepath)]
+               for filepath in clip_outputs(clip_prefix)}
+    append_event(path, {'clip': clip_name(path, clip_prefix), 'event': 'done', 'job': job,
+                        'config': config_hash(params), 'outputs': outputs, 'time': time.time()})
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Completion manifest of the clips.')
+    parser.add_argument('output_path', type=str, help='output_path of config')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild manifest_index from manifest.jsonl')
+    args = parser.parse_args()
+
+    path = manifest_path(args.output_path)
+    if args.rebuild:
+        print("%d clips indexed" % rebuild_index(path))
+    entries = read_manifest(path)
+    done = set(entry['clip'] for entry in entries if entry['event'] == 'done')
+    print("%d events, %d clips done" % (len(entries), len(done)))
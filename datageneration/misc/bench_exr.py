@@ -0,0 +1,94 @@
+import sys
+import time
+import array
+import argparse
+from os.path import join
+from glob import glob
+import numpy as np
+
+sys.path.insert(0, "..")
+from exr_io import pass_channels, decode_channels, pass_array, read_pass
+
+# Benchmark of the per-frame EXR decoding of main_part2: the previous
+# array.array(...).tolist() + np.reshape conversion against exr_io
+# (np.frombuffer), and check that both give the same arrays.
+#
+# On the passes of a rendered clip (needs OpenEXR), e.g. its tmp folder:
+#   python bench_exr.py --tmp_path /home/local/data/cmc/tmp/run0_02_01_c0001
+# Without OpenEXR, on random channel data of the size of one frame:
+#   python bench_exr.py --size 180 320
+
+
+# conversion of main_part2 before exr_io
+def decode_lists(channel_data, size, k):
+    resx, resy = size
+    if k == 'normal' or k == 'gtflow':
+        mat = np.transpose(np.reshape([array.array('f', data).tolist() for data in channel_data],
+                                      (len(channel_data), resx, resy)), (1, 2, 0))
+        return(mat.astype(np.float32, copy=False))
+    mat = np.reshape([array.array('f', data).tolist() for data in channel_data], (resx, resy))
+    return(mat.astype(np.uint8 if k == 'segm' else np.float32, copy=False))
+
+
+def read_lists(path, k):
+    import OpenEXR
+    import Imath
+    FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
+    exr_file = OpenEXR.InputFile(path)
+    dw = exr_file.header()['dataWindow']
+    size = (dw.max.y - dw.min.y + 1, dw.max.x - dw.min.x + 1)
+    return(decode_lists([exr_file.channel(chan, FLOAT) for chan in pass_channels[k]], size, k))
+
+
+def random_frame(size, rng):
+    frame = {}
+    for k, channels in pass_channels.items():
+        if k == 'segm':
+            values = [rng.randint(0, 25, size).astype(np.float32) for chan in channels]
+        else:
+            values = [rng.normal(0, 1, size).astype(np.float32) for chan in channels]
+        frame[k] = [v.tobytes() for v in values]
+    return(frame)
+
+
+def timeit(fn, args, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.time()
+        res = [fn(*a) for a in args]
+        best = min(best, time.time() - t0)
+    return best, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the EXR decoding of main_part2.')
+    parser.add_argument('--tmp_path', type=str, help='tmp folder of a rendered clip (needs OpenEXR)')
+    parser.add_argument('--size', type=int, nargs=2, default=(180, 320), metavar=('HEIGHT', 'WIDTH'),
+                        help='frame size of the random data (resx resy in config)')
+    parser.add_argument('--nframes', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.tmp_path is not None:
+        # the first frames of every pass found in the tmp folder
+        paths = []
+        for k in pass_channels:
+            for folder in glob(join(args.tmp_path, '*_%s' % k)):
+                paths += [(path, k) for path in sorted(glob(join(folder, 'Image*.exr')))[:args.nframes]]
+        nframes = len(set(path.split('/')[-1] for path, k in paths))
+        t_lists, ref = timeit(read_lists, paths, args.repeat)
+        t_numpy, res = timeit(read_pass, paths, args.repeat)
+    else:
+        rng = np.random.RandomState(0)
+        frames = [random_frame(tuple(args.size), rng) for _ in range(args.nframes)]
+        nframes = args.nframes
+        t_lists, ref = timeit(decode_lists, [(f[k], args.size, k) for f in frames for k in pass_channels], args.repeat)
+        t_numpy, res = timeit(lambda data, size, k: pass_array(decode_channels(data, size), k),
+                              [(f[k], args.size, k) for f in frames for k in pass_channels], args.repeat)
+
+    same = all(r.dtype == m.dtype and r.shape == m.shape and np.array_equal(r, m) for r, m in zip(ref, res))
+    print("frames: %d (%s)" % (nframes, ', '.join(sorted(pass_channels))))
+    print("lists:       %8.2f ms/frame" % (1e3*t_lists/nframes))
+    print("frombuffer:  %8.2f ms/frame" % (1e3*t_numpy/nframes))
+    print("speedup:     %8.1fx" % (t_lists/t_numpy))
+    print("same arrays, shapes and dtypes: %s" % same)
@@ -0,0 +1,78 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, "..")
+from smpl_math import rodrigues2bshapes, batch_rodrigues2bshapes
+
+# Micro-benchmark of the per-frame pose conversion of main_part1
+# (rodrigues2bshapes + Matrix.to_quaternion for each of the 24 bones)
+# against batch_rodrigues2bshapes on a whole clip, and check that both agree.
+#
+#   python bench_rodrigues.py --nframes 220 --repeat 20
+
+
+# scalar port of mat3_to_quat in Blender, used by Matrix.to_quaternion
+def mat3_to_quat(mat):
+    tr = 0.25*(1. + mat[0, 0] + mat[1, 1] + mat[2, 2])
+    if tr > 1e-4:
+        s = np.sqrt(tr)
+        q = [s, (mat[2, 1] - mat[1, 2])/(4*s), (mat[0, 2] - mat[2, 0])/(4*s), (mat[1, 0] - mat[0, 1])/(4*s)]
+    elif mat[0, 0] > mat[1, 1] and mat[0, 0] > mat[2, 2]:
+        s = 2.*np.sqrt(1. + mat[0, 0] - mat[1, 1] - mat[2, 2])
+        q = [(mat[2, 1] - mat[1, 2])/s, .25*s, (mat[0, 1] + mat[1, 0])/s, (mat[0, 2] + mat[2, 0])/s]
+    elif mat[1, 1] > mat[2, 2]:
+        s = 2.*np.sqrt(1. + mat[1, 1] - mat[0, 0] - mat[2, 2])
+        q = [(mat[0, 2] - mat[2, 0])/s, (mat[0, 1] + mat[1, 0])/s, .25*s, (mat[1, 2] + mat[2, 1])/s]
+    else:
+        s = 2.*np.sqrt(1. + mat[2, 2] - mat[0, 0] - mat[1, 1])
+        q = [(mat[1, 0] - mat[0, 1])/s, (mat[0, 2] + mat[2, 0])/s, (mat[1, 2] + mat[2, 1])/s, .25*s]
+    q = np.asarray(q)
+    return q/np.linalg.norm(q)
+
+
+# the current path: one call per frame, one quaternion per bone
+def per_frame(poses):
+    out = []
+    for pose in poses:
+        mrots, bsh = rodrigues2bshapes(pose)
+        quats = [mat3_to_quat(mrot) for mrot in mrots]
+        out.append((mrots, quats, bsh))
+    return out
+
+
+def timeit(fn, arg, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.time()
+        res = fn(arg)
+        best = min(best, time.time() - t0)
+    return best, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched Rodrigues against the per-frame path.')
+    parser.add_argument('--nframes', type=int, default=220, help='frames per clip (clipsize)')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    poses = rng.normal(0, .5, (args.nframes, 72))
+    # exercise the theta == 0 branch and rotations close to pi
+    poses[::7, 3:6] = 0.
+    poses[0] = 0.
+    poses[1::11, 6:9] = [np.pi - 1e-3, 0., 0.]
+
+    t_frame, ref = timeit(per_frame, poses, args.repeat)
+    t_batch, (mrots, quats, bsh) = timeit(batch_rodrigues2bshapes, poses, args.repeat)
+
+    err_rot = max(np.abs(np.asarray(r[0]) - m).max() for r, m in zip(ref, mrots))
+    err_quat = max(np.abs(np.asarray(r[1]) - q).max() for r, q in zip(ref, quats))
+    err_bsh = max(np.abs(r[2] - b).max() for r, b in zip(ref, bsh))
+
+    print("frames: %d" % args.nframes)
+    print("per-frame: %8.2f ms  (%.3f ms/frame)" % (1e3*t_frame, 1e3*t_frame/args.nframes))
+    print("batched:   %8.2f ms  (%.3f ms/frame)" % (1e3*t_batch, 1e3*t_batch/args.nframes))
+    print("speedup:   %8.1fx" % (t_frame/t_batch))
+    print("max abs diff: rot %.2e  quat %.2e  bshapes %.2e" % (err_rot, err_quat, err_bsh))
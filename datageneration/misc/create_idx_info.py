@@ -1,92 +1,120 @@
-import numpy as np
+import sys
 import pickle
+import argparse
+from os.path import exists
 
+sys.path.insert(0, "..")
+from smpl_store import npz_shapes
+
+# Builds ../pkl/idx_info.pickle and idx_info.txt from the array shapes stored
+# in the npy headers of smpl_data.npz, without decompressing any pose data.
+# Shapes are cached per zip member (crc, size), so rebuilding after sequences
+# are added to the archive only reads the headers of the new members.
+#
+#   python create_idx_info.py                  # gait sequences (splits/gait.txt)
+#   python create_idx_info.py --split subject  # all sequences, labelled with
+#                                              # splits/001_{train,test}.txt
 
 # PARAMS
 stepsize = 1 # subsamping 120Hz to 30Hz
-smpl_data = np.load("../smpl_data/smpl_data.npz")
 split_dir = "splits"
 
 split_gait_filename = "gait.txt"
-#split_test_filename = "001_test.txt"
-#split_train_filename = "001_train.txt"
-
-
-print "Parsing cmu keys.."
-cmu_keys = []
-for seq in smpl_data.files:
-	if seq.startswith('pose_'):
-		cmu_keys.append(seq.replace('pose_', ''))
-
-#name = sorted(cmu_keys)[idx % len(cmu_keys)]
-
-cmu_keys.sort()
-
-print "Loading cmu data.."
-cmu_parms = {}
-for seq in smpl_data.files:
-	if seq.startswith('pose_'):
-		cmu_parms[seq.replace('pose_', '')] = {'poses':smpl_data[seq],
-		                                      'trans':smpl_data[seq.replace('pose_','trans_')]}
-
-
-print "Parsing splits.."
-#split_test = []
-#split_train = []
-split_gait = []
-# parse split
-#with open(split_dir + '/' + split_test_filename) as f:
-#	split_test = f.read().splitlines()
-#with open(split_dir + '/' + split_train_filename) as f:
-#	split_train = f.read().splitlines()
-with open(split_dir + '/' + split_gait_filename) as f:
-    split_gait = f.read().splitlines()
-
-print "Create seq_info for every sequence (name, nb_frames, use_split).."
-seq_info = []
-for seq in cmu_keys:
-    nb_frames = len(cmu_parms[seq]['poses'])/float(stepsize)
-	
-	# -- possible seq names:
-	# ung_105_22  -> train/test
-	# 01_02  -> train/test
-	# h36m_S11_Directions 1  -> all
-	
-    # use_split = ''
-	
+split_test_filename = "001_test.txt"
+split_train_filename = "001_train.txt"
+
+
+def read_split(filename):
+    with open(split_dir + '/' + filename) as f:
+        return f.read().splitlines()
+
+
+# -- possible seq names:
+# ung_105_22  -> train/test
+# 01_02  -> train/test
+# h36m_S11_Directions 1  -> all
+def subject_chunk(seq):
     name = seq.split('_')
     firstchunk = name[0]
-   
-    if firstchunk == "h36m":
-        use_split = 'all'
-        print(name)
+    if firstchunk == "ung":
+        firstchunk = name[1]
+    return firstchunk
+
+
+def gait_seq_info(cmu_nb_frames):
+    split_gait = read_split(split_gait_filename)
+    seq_info = []
+    for seq in sorted(cmu_nb_frames):
+        if subject_chunk(seq) in split_gait:
+            seq_info.append({"name": seq, "nb_frames": cmu_nb_frames[seq]})
+    return seq_info
+
+
+def subject_seq_info(cmu_nb_frames):
+    split_test = read_split(split_test_filename)
+    split_train = read_split(split_train_filename)
+    seq_info = []
+    for seq in sorted(cmu_nb_frames):
+        firstchunk = subject_chunk(seq)
+        if firstchunk == "h36m":
+            use_split = 'all'
+        else:
+            # cast as integer to get subject ID
+            subject_ID = "%02d" % int(firstchunk)
+            if subject_ID in split_test:
+                use_split = 'test'
+            elif subject_ID in split_train:
+                use_split = 'train'
+            else:
+                assert False, "subject %s of %s is in no split" % (subject_ID, seq)
+        seq_info.append({"name": seq, "nb_frames": cmu_nb_frames[seq], "use_split": use_split})
+    return seq_info
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create idx_info from the npy headers of smpl_data.npz.')
+    parser.add_argument('--npz', type=str, default="../smpl_data/smpl_data.npz",
+                        help='path to smpl_data.npz')
+    parser.add_argument('--split', type=str, default='gait', choices=['gait', 'subject'],
+                        help='gait: only the subjects of splits/gait.txt, subject: all sequences with train/test labels')
+    parser.add_argument('--cache', type=str, default="../pkl/idx_info_cache.pickle",
+                        help='per-member shape cache used for incremental rebuilds')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='ignore the cache and read every header again')
+    args = parser.parse_args()
+
+    cache = None
+    if exists(args.cache) and not args.rebuild:
+        with open(args.cache, 'rb') as f:
+            cache = pickle.load(f)
+
+    print("Reading npy headers..")
+    shapes = npz_shapes(args.npz, prefix='pose_', cache=cache)
+    with open(args.cache, 'wb') as f:
+        pickle.dump(shapes, f, protocol=2)
+
+    cmu_nb_frames = {}
+    for key, (shape, crc, file_size) in shapes.items():
+        cmu_nb_frames[key.replace('pose_', '', 1)] = shape[0]/float(stepsize)
+
+    print("Create seq_info for every sequence (name, nb_frames, use_split)..")
+    if args.split == 'gait':
+        seq_info = gait_seq_info(cmu_nb_frames)
     else:
-        if firstchunk == "ung":
-            firstchunk = name[1]
-    print(name)		
-    if firstchunk in split_gait: 
-        seq_info.append({"name": seq, "nb_frames": nb_frames})
-		# cast as integer to get subject ID
-	#	subject_ID = "%02d" % int(firstchunk)
-	#	if subject_ID in split_test:
-	#		use_split = 'test'
-	#	elif subject_ID in split_train:
-	#		use_split = 'train'
-	#	else:
-	#		assert False
-	
-	
-	#seq_info.append({"name": seq, "nb_frames": nb_frames, "use_split": use_split})
-
-
-print "Save as pickle and txt.."
-# Save as pickle
-with open("../pkl/idx_info.pickle", "wb") as f:
-	pickle.dump(seq_info, f)
-
-with open("idx_info.txt", "w") as f:
-    f.write("# idx  nb_frames name\n")
-    for i, elem in enumerate(seq_info):
-        f.write("%d %d %s\n" % (i, elem['nb_frames'], elem['name'] ))
-		#f.write("%d %d %s %s\n" % (i, elem['nb_frames'], elem['use_split'], elem['name'] ))
+        seq_info = subject_seq_info(cmu_nb_frames)
+
+    print("Save as pickle and txt..")
+    # Save as pickle
+    with open("../pkl/idx_info.pickle", "wb") as f:
+        pickle.dump(seq_info, f, protocol=2)
 
+    with open("idx_info.txt", "w") as f:
+        if args.split == 'gait':
+            f.write("# idx  nb_frames name\n")
+            for i, elem in enumerate(seq_info):
+                f.write("%d %d %s\n" % (i, elem['nb_frames'], elem['name']))
+        else:
+            f.write("# idx  nb_frames use_split name\n")
+            for i, elem in enumerate(seq_info):
+                f.write("%d %d %s %s\n" % (i, elem['nb_frames'], elem['use_split'], elem['name']))
+    print("%d sequences" % len(seq_info))
@@ -1,22 +1,52 @@
+import sys
 import pickle
-import numpy as np
+import argparse
+
+sys.path.insert(0, "..")
+import config
+from job_plan import plan_jobs, shard_jobs, parse_shard, job_line, job_frames
+
+# Writes the jobs of a run (see ../job_plan.py), one line of job arguments per
+# job, for main_part1.py --queue or ../scheduler.py --jobs. Each node can write
+# its own share without any shared file:
+#
+#   python generate_job_list.py                                  # all the jobs of run_stride
+#   python generate_job_list.py --shard 3/8 --balance frames --output job_list_3.txt
+#   python generate_job_list.py --names 'ung_*' --directions forward backward --strides 50
 
 run_stride = [50, 30, 70]
 
-stepsize = 4
-clipsize = 100
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the job list of a run.')
+    parser.add_argument('--strides', type=int, nargs='+', default=run_stride,
+                        help='one run (runpass) per stride')
+    parser.add_argument('--directions', type=str, nargs='+', default=['forward'], choices=['forward', 'backward'])
+    parser.add_argument('--names', type=str, nargs='+',
+                        help='sequence names or patterns (e.g. ung_*), default: all')
+    parser.add_argument('--splits', type=str, nargs='+',
+                        help='use_split of the sequences (train, test, all), default: all')
+    parser.add_argument('--first_clip', action='store_true',
+                        help='only the first clip (ishape 0) of each sequence')
+    parser.add_argument('--shard', type=str,
+                        help='k/N: only the shard k (from 0) of N')
+    parser.add_argument('--balance', type=str, default='count', choices=['count', 'frames'],
+                        help='shards with the same number of jobs (round-robin) or of rendered frames')
+    parser.add_argument('--output', type=str, default="job_list.txt")
+    args = parser.parse_args()
 
-fout = open("job_list.txt", "w")
+    params = config.load_file('../config', 'SYNTH_DATA')
+    all_idx_info = pickle.load(open("../pkl/idx_info.pickle", 'rb'))
 
-all_idx_info = pickle.load(open("../pkl/idx_info.pickle", 'rb'))
-nb_idx = len(all_idx_info)
+    jobs = plan_jobs(all_idx_info, args.strides, args.directions, params['stepsize'], params['clipsize'],
+                     names=args.names, splits=args.splits, first_clip=args.first_clip)
+    if args.shard is not None:
+        k, n = parse_shard(args.shard)
+        jobs = shard_jobs(jobs, k, n, cost=job_frames if args.balance == 'frames' else None)
 
-for it_runpass, stride in enumerate(run_stride):
-	
-	for idx, idx_info in enumerate(all_idx_info):
-		nb_ishape = max(1, int(np.ceil((idx_info['nb_frames'] - (clipsize - stride))/stride)))
-		
-		for it_ishape in range(nb_ishape):
-			fout.write("--idx %d --ishape %d --stride %d\n" % (idx + it_runpass * nb_idx, it_ishape, stride))
-		#(nb)divmod(int(idx_info['nb_frames']), clipsize)
+    njobs = 0
+    with open(args.output, "w") as fout:
+        for job in jobs:
+            fout.write(job_line(job) + "\n")
+            njobs += 1
+    print("%d jobs written to %s" % (njobs, args.output))
@@ -1,32 +1,28 @@
-import numpy as np
+import sys
 import pickle
 
+sys.path.insert(0, "..")
+from smpl_store import npz_shapes
+
+# superseded by `python create_idx_info.py --split subject`
 
 # PARAMS
 stepsize = 1 # subsamping 120Hz to 30Hz
-smpl_data = np.load("../smpl_data/smpl_data.npz")
+smpl_data_path = "../smpl_data/smpl_data.npz"
 split_dir = "splits"
 
 split_test_filename = "001_test.txt"
 split_train_filename = "001_train.txt"
 
 
-print "Parsing cmu keys.."
-cmu_keys = []
-for seq in smpl_data.files:
-	if seq.startswith('pose_'):
-		cmu_keys.append(seq.replace('pose_', ''))
-
-#name = sorted(cmu_keys)[idx % len(cmu_keys)]
-
-cmu_keys.sort()
+print "Reading cmu keys and lengths from the npy headers.."
+# only the array headers are read, the pose data is never decompressed
+pose_shapes = npz_shapes(smpl_data_path, prefix='pose_')
+cmu_nb_frames = {}
+for key, (shape, crc, file_size) in pose_shapes.items():
+	cmu_nb_frames[key.replace('pose_', '', 1)] = shape[0]
 
-print "Loading cmu data.."
-cmu_parms = {}
-for seq in smpl_data.files:
-	if seq.startswith('pose_'):
-		cmu_parms[seq.replace('pose_', '')] = {'poses':smpl_data[seq],
-		                                      'trans':smpl_data[seq.replace('pose_','trans_')]}
+cmu_keys = sorted(cmu_nb_frames)
 
 
 print "Parsing splits.."
@@ -42,7 +38,7 @@ with open(split_dir + '/' + split_train_filename) as f:
 print "Create seq_info for every sequence (name, nb_frames, use_split).."
 seq_info = []
 for seq in cmu_keys:
-	nb_frames = len(cmu_parms[seq]['poses'])/float(stepsize)
+	nb_frames = cmu_nb_frames[seq]/float(stepsize)
 	
 	# -- possible seq names:
 	# ung_105_22  -> train/test
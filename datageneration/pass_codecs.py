@@ -0,0 +1,47 @@
+import numpy as np
+
+# Compact encoding of the passes decoded by main_part2, used with
+# pass_encoding = 'compact' in config (see clip_io.py):
+#   normal 'masked_float16' : float16 normals of the pixels with a non-zero
+#                             normal, the background is decoded as 0
+# The other passes are stored dense: savemat already compresses the constant
+# background of segm (uint8) and depth, and an encoding of their own does not
+# make the .mat files noticeably smaller.
+# Each encoder returns a dict of 1-D arrays {field: array} that can be saved as
+# separate .mat variables; the frame shape is stored once per pass.
+
+pass_codecs = {'normal': 'masked_float16'}
+
+
+# the mask is packed to 1 bit per pixel
+def pack_mask(mask):
+    return(np.packbits(mask.ravel()))
+
+
+def unpack_mask(packed, shape):
+    return(np.unpackbits(packed.ravel())[:int(np.prod(shape))].astype(bool).reshape(shape))
+
+
+# float16 values are saved as their uint16 bits (.mat files have no half type)
+def encode_masked_float16(mat):
+    mask = np.any(mat != 0, axis=-1)
+    return({'mask': pack_mask(mask), 'values': mat[mask].astype(np.float16).view(np.uint16).ravel()})
+
+
+def decode_masked_float16(fields, shape):
+    mask = unpack_mask(fields['mask'], shape[:-1])
+    mat = np.zeros(shape, dtype=np.float32)
+    mat[mask] = fields['values'].ravel().astype(np.uint16).view(np.float16).reshape(-1, shape[-1])
+    return(mat)
+
+
+encoders = {'masked_float16': encode_masked_float16}
+decoders = {'masked_float16': decode_masked_float16}
+
+
+def encode(k, mat):
+    return(encoders[pass_codecs[k]](mat))
+
+
+def decode(codec, fields, shape):
+    return(decoders[codec](fields, tuple(int(d) for d in shape)))
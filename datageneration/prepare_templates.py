@@ -0,0 +1,44 @@
+import sys
+import time
+import bpy
+
+sys.path.insert(0, ".")
+
+# Build the scene templates opened by main_part1, once per gender, so that
+# the jobs neither import the FBX nor create the segmentation materials.
+# The templates are rebuilt when the segmentation pickle, the FBX, sh.osl or
+# the render settings of config change (see scene_template.py).
+#
+#   blender -b -P prepare_templates.py --- [--gender female] [--force]
+
+
+def main():
+    import argparse
+    import config
+    import main_part1
+    from main_part1 import build_scene, create_composite_nodes
+    from scene_template import is_template_current, save_template
+
+    parser = argparse.ArgumentParser(description='Build the per-gender scene templates.')
+    parser.add_argument('--gender', type=str, choices=['female', 'male'],
+                        help='build only this gender (default: both)')
+    parser.add_argument('--force', action='store_true', help='rebuild up to date templates')
+    args = parser.parse_args(sys.argv[sys.argv.index("---") + 1:] if "---" in sys.argv else [])
+
+    main_part1.start_time = time.time()
+    params = config.load_file('config', 'SYNTH_DATA')
+    params['camera_distance'] = 11.0
+    # placeholder, the jobs set their vector blur factor in update_composite_nodes
+    params['vblur_factor'] = 0.5
+
+    for gender in ([args.gender] if args.gender else ['male', 'female']):
+        if is_template_current(params, gender) and not args.force:
+            print("%s template up to date" % gender)
+            continue
+        bpy.ops.wm.read_homefile()
+        scene, ob, obname, arm_ob, cam_ob, materials = build_scene(params, gender)
+        create_composite_nodes(scene.node_tree, params)
+        print("saved %s" % save_template(params, gender))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import sys
+import os
+import argparse
+from os.path import join
+import numpy as np
+
+sys.path.insert(0, ".")
+from camera import project
+
+# Python port of misc/3Dto2D: maps the joints3D and camLoc saved in _info.mat
+# files to pixels, for whole directories of clips at once. This re-derives 2D
+# labels for another render resolution or crop without rendering again. With a
+# crop, the joints outside the crop are flagged in a visibility mask (24, N).
+#
+#   python reproject.py --check /path/to/synthetic           # as main.m
+#   python reproject.py --size 640 360 --write /path/to/synthetic
+#   python reproject.py --crop 40 0 240 180 --write /path/to/synthetic
+
+info_suffix = '_info.mat'
+
+
+def find_info_files(dirs):
+    info_files = []
+    for directory in dirs:
+        for root, dirnames, filenames in os.walk(directory):
+            info_files.extend(join(root, f) for f in filenames if f.endswith(info_suffix))
+    return sorted(info_files)
+
+
+# only the fields needed for the projection are read from the .mat file
+def load_info(info_file):
+    import scipy.io
+    info = scipy.io.loadmat(info_file, variable_names=['joints2D', 'joints3D', 'camLoc'])
+    return(info_file, info)
+
+
+# joints2D (2, 24, N) of several clips projected in one batch
+# infos: list of dicts with joints3D (3, 24, N) and camLoc (3, 1)
+# crop: (x0, y0, width, height) of the crop in the full image, in pixels
+def reproject_infos(infos, render_size, crop=None):
+    nframes = [info['joints3D'].shape[-1] for info in infos]
+    joints3d = np.concatenate([np.transpose(info['joints3D'], (2, 1, 0)) for info in infos])
+    cam_locs = np.concatenate([np.tile(np.ravel(info['camLoc']), (n, 1)) for info, n in zip(infos, nframes)])
+    joints2d = project(joints3d, cam_locs, render_size)
+    if crop is not None:
+        joints2d -= np.asarray(crop[:2], dtype=np.float64)
+    joints2d = np.transpose(joints2d, (2, 1, 0)).astype(np.float32)
+    return(np.split(joints2d, np.cumsum(nframes)[:-1], axis=-1))
+
+
+# joints (24, N) inside an image of image_size (width, height), e.g. the crop size
+def visibility(joints2d, image_size):
+    inside = (joints2d >= 0) & (joints2d < np.asarray(image_size, dtype=np.float32)[:, None, None])
+    return(inside.all(axis=0).astype(np.uint8))
+
+
+def output_filename(info_file, render_size, crop):
+    tag = '%dx%d' % tuple(render_size)
+    if crop is not None:
+        tag += '_crop%d_%d_%dx%d' % tuple(crop)
+    return(info_file[:-len(info_suffix)] + '_joints2D_%s.mat' % tag)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproject joints3D of _info.mat files to pixels.')
+    parser.add_argument('dirs', nargs='+', help='directories searched recursively for *_info.mat')
+    parser.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help='render resolution, default resy x resx from config')
+    parser.add_argument('--crop', type=int, nargs=4, metavar=('X0', 'Y0', 'WIDTH', 'HEIGHT'),
+                        help='crop of the full image, the labels are given in crop pixels '
+                             'with a visibility mask of the joints inside the crop')
+    parser.add_argument('--check', action='store_true',
+                        help='assert that the projection matches the saved joints2D, as main.m')
+    parser.add_argument('--write', action='store_true',
+                        help='save <clip>_joints2D_<W>x<H>[_crop<X0>_<Y0>_<W>x<H>].mat next to each _info.mat')
+    parser.add_argument('--batch', type=int, default=1000, help='clips projected per batch')
+    parser.add_argument('--jobs', type=int, default=4, help='processes reading the .mat files')
+    args = parser.parse_args()
+
+    if args.size is not None:
+        render_size = tuple(args.size)
+    else:
+        import config
+        params = config.load_file('config', 'SYNTH_DATA')
+        render_size = (params['resy'], params['resx'])
+    crop = None if args.crop is None else tuple(args.crop)
+
+    info_files = find_info_files(args.dirs)
+    print("%d clips, render size %dx%d" % ((len(info_files),) + render_size))
+
+    from multiprocessing import Pool
+    import scipy.io
+    pool = Pool(args.jobs)
+    nmismatch = 0
+    for ibatch in range(0, len(info_files), args.batch):
+        batch = pool.map(load_info, info_files[ibatch:ibatch + args.batch])
+        joints2d = reproject_infos([info for _, info in batch], render_size, crop)
+        for (info_file, info), j2d in zip(batch, joints2d):
+            if args.check and not np.array_equal(j2d, info['joints2D']):
+                nmismatch += 1
+                print("MISMATCH %s: max diff %.1f px" % (info_file, np.abs(j2d - info['joints2D']).max()))
+            if args.write:
+                labels = {'joints2D': j2d}
+                if crop is not None:
+                    labels['visible'] = visibility(j2d, crop[2:])
+                scipy.io.savemat(output_filename(info_file, render_size, crop), labels, do_compression=True)
+        print("%d/%d clips" % (min(ibatch + args.batch, len(info_files)), len(info_files)))
+    pool.close()
+
+    if args.check:
+        print("%d clips do not match their joints2D" % nmismatch)
+        exit(1 if nmismatch > 0 else 0)
@@ -18,6 +18,8 @@ export PYTHONPATH=${BUNDLED_PYTHON}:${PYTHONPATH}
 export LD_LIBRARY_PATH=${FFMPEG_PATH}/lib:${X264_PATH}/lib:${LD_LIBRARY_PATH}
 export PATH=${FFMPEG_PATH}/bin:${PATH}
 
+# both directions are written to run0/<name> and renamed to <name>_f, <name>_b
+# (direction_folders = False in config; with True, use scheduler.py instead)
 subject_id=0
 for i in "${!array[@]}"
 do
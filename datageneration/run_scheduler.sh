@@ -0,0 +1,21 @@
+#!/bin/bash
+
+# SET PATHS HERE
+FFMPEG_PATH=/home/local/tools/ffmpeg/ffmpeg_build_sequoia_h264
+X264_PATH=/home/local/tools/ffmpeg/x264_build/
+PYTHON2_PATH=/usr/ # PYTHON 2
+BLENDER_PATH=/home/local/blender #tools/
+
+# BUNLED PYTHON
+BUNDLED_PYTHON=${BLENDER_PATH}/2.79/python
+export PYTHONPATH=${BUNDLED_PYTHON}/lib/python3.4:${BUNDLED_PYTHON}/lib/python3.4/site-packages
+export PYTHONPATH=${BUNDLED_PYTHON}:${PYTHONPATH}
+
+# FFMPEG
+export LD_LIBRARY_PATH=${FFMPEG_PATH}/lib:${X264_PATH}/lib:${LD_LIBRARY_PATH}
+export PATH=${FFMPEG_PATH}/bin:${PATH}
+
+# e.g. ./run_scheduler.sh --jobs misc/job_list.txt --blender_workers 4 --threads 4 --part2_workers 2
+#      ./run_scheduler.sh --names 02_01 05_01 --directions forward backward --first_clip
+# -E: the scheduler ignores the PYTHONPATH of Blender, which it passes on to the render processes
+${PYTHON2_PATH}/bin/python2.7 -E scheduler.py --blender ${BLENDER_PATH}/blender --python2 ${PYTHON2_PATH}/bin/python2.7 "$@"
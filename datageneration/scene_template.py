@@ -0,0 +1,68 @@
+import os
+import hashlib
+from os.path import join, exists
+
+# Per-gender scene templates: the .blend saved by prepare_templates.py right
+# after the scene setup of main_part1 (imported model, segmentation materials,
+# camera, render passes and compositor graph). A template is used only if its
+# stamp matches the current sources and config, otherwise the jobs build the
+# scene themselves.
+
+template_version = 2 # changes of the scene built by main_part1 that invalidate the templates
+segm_path = 'pkl/segm_per_v_overlap.pkl'
+sh_path = 'spher_harm/sh.osl'
+
+
+def fbx_path(params, gender):
+    return(join(params['smpl_data_folder'], 'basicModel_%s_lbs_10_207_0_v1.0.2.fbx' % gender[0]))
+
+
+def template_path(params, gender):
+    return(join(params['smpl_data_folder'], params['scene_template_dirname'], 'scene_%s.blend' % gender))
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return(sha1.hexdigest())
+
+
+# text identifying everything the template is built from
+def template_stamp(params, gender):
+    import bpy
+    lines = ['version %d' % template_version, 'blender %s' % bpy.app.version_string]
+    for path in (segm_path, fbx_path(params, gender), sh_path):
+        lines.append('%s %s' % (file_sha1(path), os.path.basename(path)))
+    for key in ('resy', 'resx', 'output_types', 'pass_encoding'):
+        lines.append('%s %r' % (key, params.get(key) if key != 'output_types' else sorted(params[key].items())))
+    return('\n'.join(lines) + '\n')
+
+
+def is_template_current(params, gender):
+    path = template_path(params, gender)
+    if not exists(path) or not exists(path + '.stamp'):
+        return(False)
+    with open(path + '.stamp') as f:
+        return(f.read() == template_stamp(params, gender))
+
+
+# save the current scene as the template of a gender, then its stamp
+def save_template(params, gender):
+    import bpy
+    path = template_path(params, gender)
+    if not exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = '%s.%d.tmp.blend' % (path[:-len('.blend')], os.getpid())
+    bpy.ops.wm.save_as_mainfile(filepath=tmp_path, copy=True)
+    os.rename(tmp_path, path)
+    with open(tmp_path + '.stamp', 'w') as f:
+        f.write(template_stamp(params, gender))
+    os.rename(tmp_path + '.stamp', path + '.stamp')
+    return(path)
+
+
+def open_template(params, gender):
+    import bpy
+    bpy.ops.wm.open_mainfile(filepath=template_path(params, gender))
@@ -0,0 +1,323 @@
+import sys
+import os
+import time
+import signal
+import json
+import subprocess
+import multiprocessing
+from os.path import join, exists, dirname
+from collections import deque
+from pickle import load
+from job_plan import job_args
+from clip_range import job_dirname
+
+# Local scheduler of the generation jobs, in place of the bash loops of
+# run_gait.sh: each job is rendered by Blender (main_part1.py), then converted
+# by main_part2.py (unless post_mode is not 'part2' in config), and with
+# --openpose its rgb video is annotated by OpenPose, with up to --blender_workers,
+# --part2_workers and --openpose_workers processes of each phase at a time.
+# A process only starts if the host has --min_free_mem GB available, and can be
+# capped with --mem_limit GB of address space; a process that runs longer than
+# the timeout of its phase is killed with its children and retried up to
+# --retries times. The jobs are one line of job arguments each, as in
+# misc/job_list.txt, or planned from pkl/idx_info.pickle (see job_plan.py):
+#
+#   python scheduler.py --jobs misc/job_list.txt --blender_workers 4 --threads 4 --part2_workers 2
+#   python scheduler.py --names 02_01 05_01 --directions forward backward --first_clip --openpose
+#   python scheduler.py --strides 50 30 70 --shard 3/8 --balance frames
+#
+# Jobs of the same clip (--idx, --ishape and --direction) share their tmp folder
+# and output files, they are never run at the same time. Both directions of a
+# clip are only run with direction_folders = True in config, which writes them to
+# their own folders (<name>_f, <name>_b, see clip_range.job_dirname); otherwise
+# they would overwrite each other in <name>.
+# Logs of every attempt are in --log_dir/<job>_<phase>_<attempt>.log, the lines of
+# the jobs that failed all their attempts are written to --log_dir/failed.txt.
+# The wall time of every process is appended to --timings (<log_dir>/timings.jsonl
+# by default), on which the cost model of cost_model.py is fitted at start: the
+# longest jobs are started first (--order longest), and --balance cost shards the
+# planned jobs by predicted time.
+
+phases = ('render', 'part2', 'openpose')
+
+
+def print_message(message):
+    print("[%s] %s" % (time.strftime('%H:%M:%S'), message))
+    sys.stdout.flush()
+
+
+def read_jobs(path):
+    with open(path) as f:
+        return([line.strip() for line in f if line.strip() != '' and not line.startswith('#')])
+
+
+# <output_path>/run<runpass>/<name>[_<d>]/<name>_c<ishape+1> of a job, as in main_part1
+def job_clip_prefix(line, idx_info, params):
+    args = job_args(line)
+    runpass, idx = divmod(int(args['--idx']), len(idx_info))
+    name = idx_info[idx]['name']
+    for dic in idx_info:
+        if dic['name'] == args.get('--name'):
+            name = dic['name']
+            break
+    output_path = join(params['output_path'], 'run%d' % runpass, job_dirname(name, args.get('--direction'), params))
+    return(join(output_path, name.replace(" ", "") + "_c%04d" % (int(args['--ishape']) + 1)))
+
+
+def free_memory_gb():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return(int(line.split()[1]) / 1024.**2)
+    return(float('inf'))
+
+
+class Job(object):
+    def __init__(self, ijob, line, features=None, predicted=None):
+        self.ijob = ijob
+        self.line = line
+        self.features = features
+        self.predicted = predicted
+        args = job_args(line)
+        self.clip = (args.get('--idx'), args.get('--ishape'), args.get('--direction'))
+        self.attempts = {phase: 0 for phase in phases}
+        self.status = 'pending'
+
+
+class Scheduler(object):
+    def __init__(self, commands, workers, timeouts, retries=1, min_free_mem=0., mem_limit=None,
+                 log_dir='scheduler_logs', status_interval=30., timings_path=None, log=print_message):
+        self.commands = commands # {phase: function(job) -> (argv, env, cwd)}
+        self.workers = workers
+        self.timeouts = timeouts
+        self.retries = retries
+        self.min_free_mem = min_free_mem
+        self.mem_limit = mem_limit
+        self.log_dir = log_dir
+        self.status_interval = status_interval
+        self.timings_path = timings_path
+        self.log = log
+        if not exists(log_dir):
+            os.makedirs(log_dir)
+
+    # the process is the leader of a new session so that a timeout kills Blender's children too
+    def start(self, job, phase):
+        argv, env, cwd = self.commands[phase](job)
+        job.attempts[phase] += 1
+        log_path = join(self.log_dir, '%06d_%s_%d.log' % (job.ijob, phase, job.attempts[phase]))
+        mem_limit = self.mem_limit
+
+        def preexec():
+            os.setsid()
+            if mem_limit is not None:
+                import resource
+                limit = int(mem_limit * 1024**3)
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        with open(log_path, 'w') as log_file:
+            log_file.write('%s\n' % ' '.join(argv))
+            log_file.flush()
+            proc = subprocess.Popen(argv, env=env, cwd=cwd, stdin=open(os.devnull), stdout=log_file,
+                                    stderr=subprocess.STDOUT, preexec_fn=preexec)
+        self.log("%s %06d started (attempt %d, pid %d): %s" % (phase, job.ijob, job.attempts[phase], proc.pid, job.line))
+        return(proc)
+
+    # one line of timings.jsonl per finished process (see cost_model.py)
+    def record_timing(self, job, phase, code, t0):
+        if self.timings_path is None:
+            return
+        log_path = join(self.log_dir, '%06d_%s_%d.log' % (job.ijob, phase, job.attempts[phase]))
+        with open(log_path) as f:
+            skipped = code == 0 and phase == 'render' and ', skipping' in f.read()
+        entry = {'job': job.line, 'phase': phase, 'attempt': job.attempts[phase], 'code': code,
+                 'seconds': time.time() - t0, 'start': t0, 'features': job.features, 'skipped': skipped}
+        if job.predicted is not None:
+            entry['predicted'] = job.predicted.get(phase)
+        with open(self.timings_path, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def can_start(self, nrunning):
+        # never wait for memory with nothing running, it would not free up
+        return(nrunning == 0 or free_memory_gb() >= self.min_free_mem)
+
+    def status(self, jobs, queues, running, start_time):
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        ndone = counts.get('done', 0)
+        elapsed = time.time() - start_time
+        eta = elapsed / ndone * (len(jobs) - ndone - counts.get('failed', 0)) if ndone > 0 else float('nan')
+        self.log("%d/%d done, %d failed | %s | %.0f s elapsed, ETA %.0f s, %.1f GB free"
+                 % (ndone, len(jobs), counts.get('failed', 0),
+                    ', '.join('%s: %d running %d queued' % (phase, len(running[phase]), len(queues[phase]))
+                              for phase in phases if phase in self.commands),
+                    elapsed, eta, free_memory_gb()))
+
+    # features, predicted: per line, for the timings (or None)
+    def run(self, lines, features=None, predicted=None):
+        jobs = [Job(ijob, line, features[ijob] if features is not None else None,
+                    predicted[ijob] if predicted is not None else None) for ijob, line in enumerate(lines)]
+        active = [phase for phase in phases if phase in self.commands]
+        queues = {phase: deque() for phase in active}
+        running = {phase: [] for phase in active}
+        queues[active[0]].extend(jobs)
+        start_time = time.time()
+        last_status = start_time
+        # job of each clip from its first start to its last phase
+        busy = {}
+
+        while any(len(queues[phase]) + len(running[phase]) > 0 for phase in active):
+            for iphase, phase in enumerate(active):
+                # finished and timed out processes
+                for job, proc, t0 in list(running[phase]):
+                    code = proc.poll()
+                    if code is None and self.timeouts.get(phase) and time.time() - t0 > self.timeouts[phase]:
+                        self.log("%s %06d timed out after %.0f s" % (phase, job.ijob, time.time() - t0))
+                        os.killpg(proc.pid, signal.SIGKILL)
+                        code = proc.wait()
+                    if code is None:
+                        continue
+                    running[phase].remove((job, proc, t0))
+                    self.record_timing(job, phase, code, t0)
+                    if code == 0:
+                        self.log("%s %06d done in %.0f s" % (phase, job.ijob, time.time() - t0))
+                        if iphase + 1 < len(active):
+                            queues[active[iphase + 1]].append(job)
+                        else:
+                            job.status = 'done'
+                            del busy[job.clip]
+                    elif job.attempts[phase] <= self.retries:
+                        self.log("%s %06d failed with %d, retrying" % (phase, job.ijob, code))
+                        queues[phase].append(job)
+                    else:
+                        self.log("%s %06d failed with %d after %d attempts" % (phase, job.ijob, code, job.attempts[phase]))
+                        job.status = 'failed'
+                        del busy[job.clip]
+
+                for job in list(queues[phase]):
+                    if len(running[phase]) >= self.workers[phase]:
+                        break
+                    if busy.get(job.clip, job) is not job:
+                        continue
+                    if not self.can_start(sum(len(procs) for procs in running.values())):
+                        break
+                    queues[phase].remove(job)
+                    busy[job.clip] = job
+                    job.status = phase
+                    running[phase].append((job, self.start(job, phase), time.time()))
+
+            if time.time() - last_status > self.status_interval:
+                self.status(jobs, queues, running, start_time)
+                last_status = time.time()
+            time.sleep(0.5)
+
+        self.status(jobs, queues, running, start_time)
+        failed = [job.line for job in jobs if job.status == 'failed']
+        with open(join(self.log_dir, 'failed.txt'), 'w') as f:
+            f.write(''.join('%s\n' % line for line in failed))
+        return(failed)
+
+
+def main():
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Run the generation jobs with a pool of Blender and part 2 processes.')
+    parser.add_argument('--jobs', type=str, help='file with one line of job arguments per job (default: from idx_info)')
+    parser.add_argument('--names', type=str, nargs='+', help='sequence names or patterns to plan jobs for (default: all)')
+    parser.add_argument('--splits', type=str, nargs='+', help='use_split of the sequences (default: all)')
+    parser.add_argument('--strides', type=int, nargs='+', default=[50])
+    parser.add_argument('--directions', type=str, nargs='+', default=['forward'], choices=['forward', 'backward'])
+    parser.add_argument('--first_clip', action='store_true', help='only the first clip (ishape 0) of each sequence')
+    parser.add_argument('--shard', type=str, help='k/N: only the shard k (from 0) of N of the planned jobs')
+    parser.add_argument('--balance', type=str, default='count', choices=['count', 'frames', 'cost'],
+                        help='shards with the same number of jobs (round-robin), of rendered frames or of predicted time')
+    parser.add_argument('--order', type=str, default='longest', choices=['longest', 'plan'],
+                        help='start the jobs of longest predicted time first, or in plan (job list) order')
+    parser.add_argument('--timings', type=str, help='timings of the jobs (default: <log_dir>/timings.jsonl)')
+    parser.add_argument('--script', type=str, default='main_part1.py', help='Blender script of the render phase')
+    parser.add_argument('--blender', type=str, default='/home/local/blender/blender')
+    parser.add_argument('--python2', type=str, default='/usr/bin/python2.7', help='python running main_part2.py')
+    parser.add_argument('--blender_workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='render threads of each Blender (-t)')
+    parser.add_argument('--part2_workers', type=int, default=1)
+    parser.add_argument('--openpose', action='store_true', help='annotate the rgb video of each clip with OpenPose')
+    parser.add_argument('--openpose_dir', type=str, default='/home/local/tools/openpose')
+    parser.add_argument('--openpose_workers', type=int, default=1)
+    parser.add_argument('--render_timeout', type=float, default=4*3600., help='seconds, 0 for none')
+    parser.add_argument('--part2_timeout', type=float, default=3600., help='seconds, 0 for none')
+    parser.add_argument('--openpose_timeout', type=float, default=3600., help='seconds, 0 for none')
+    parser.add_argument('--retries', type=int, default=1)
+    parser.add_argument('--min_free_mem', type=float, default=4., help='GB available to start a process')
+    parser.add_argument('--mem_limit', type=float, help='GB of address space of each process')
+    parser.add_argument('--log_dir', type=str, default='scheduler_logs')
+    parser.add_argument('--status_interval', type=float, default=30., help='seconds between progress summaries')
+    args = parser.parse_args()
+
+    params = config.load_file('config', 'SYNTH_DATA')
+    idx_info = load(open("pkl/idx_info.pickle", 'rb'))
+
+    commands = {'render': lambda job: ([args.blender, '-b', '-t', str(args.threads), '-P', args.script, '---'] + job.line.split(),
+                                       dict(os.environ), None)}
+    if params.get('post_mode', 'part2') == 'part2' and args.script == 'main_part1.py':
+        # as in run_gait.sh, without the PYTHONPATH of Blender's bundled python
+        commands['part2'] = lambda job: ([args.python2, 'main_part2.py', '---'] + job.line.split(),
+                                         dict(os.environ, PYTHONPATH=''), None)
+    if args.openpose:
+        # as in run_gait.sh, from the OpenPose folder (models/) into <clip folder>/openpose_annotation
+        def openpose_command(job):
+            clip_prefix = job_clip_prefix(job.line, idx_info, params)
+            annotation_path = join(dirname(clip_prefix), 'openpose_annotation')
+            if not exists(annotation_path):
+                os.makedirs(annotation_path)
+            return(['./build/examples/openpose/openpose.bin', '--video', clip_prefix + '.mp4',
+                    '--write_json', annotation_path + '/', '--display', '0', '--render_pose', '0',
+                    '--model_pose', 'BODY_25'], dict(os.environ), args.openpose_dir)
+        commands['openpose'] = openpose_command
+
+    # cost model of the timings of the previous runs
+    from cost_model import CostModel, read_timings, job_features, makespan
+    timings_path = args.timings if args.timings is not None else join(args.log_dir, 'timings.jsonl')
+    model = CostModel.fit(read_timings(timings_path) if exists(timings_path) else [])
+    print_message("Cost model (%s):\n%s" % (timings_path, model.describe()))
+
+    if args.jobs is not None:
+        lines = read_jobs(args.jobs)
+    else:
+        from job_plan import plan_jobs, shard_jobs, parse_shard, job_line, job_frames
+        jobs = plan_jobs(idx_info, args.strides, args.directions, params['stepsize'], params['clipsize'],
+                         names=args.names, splits=args.splits, first_clip=args.first_clip)
+        if args.shard is not None:
+            k, n = parse_shard(args.shard)
+            cost = {'count': None, 'frames': job_frames,
+                    'cost': lambda job: model.predict_job(job_features(job_line(job), idx_info, params), commands)}
+            jobs = shard_jobs(jobs, k, n, cost=cost[args.balance])
+        lines = [job_line(job) for job in jobs]
+    if not params.get('direction_folders', False) and len(set(job_args(line).get('--direction') for line in lines)) > 1:
+        parser.error('both directions of a clip would be written to run<k>/<name>, '
+                     'set direction_folders = True in config or run one direction at a time')
+
+    features = [job_features(line, idx_info, params) for line in lines]
+    predicted = [{phase: model.predict(f, phase) for phase in commands} for f in features]
+    if args.order == 'longest':
+        order = sorted(range(len(lines)), key=lambda i: -sum(predicted[i].values()))
+        lines, features, predicted = [[x[i] for i in order] for x in (lines, features, predicted)]
+    print_message("%d jobs" % len(lines))
+    if 'render' in model.coefs:
+        print_message("Predicted render makespan: %.1f h on %d Blender workers"
+                      % (makespan([p['render'] for p in predicted], args.blender_workers) / 3600., args.blender_workers))
+
+    ncpus = multiprocessing.cpu_count()
+    if args.blender_workers * args.threads > ncpus:
+        print_message("WARNING: %d Blender workers x %d threads on %d cpus" % (args.blender_workers, args.threads, ncpus))
+
+    scheduler = Scheduler(commands, {'render': args.blender_workers, 'part2': args.part2_workers, 'openpose': args.openpose_workers},
+                          {'render': args.render_timeout, 'part2': args.part2_timeout, 'openpose': args.openpose_timeout},
+                          retries=args.retries,
+                          min_free_mem=args.min_free_mem, mem_limit=args.mem_limit, log_dir=args.log_dir,
+                          status_interval=args.status_interval, timings_path=timings_path)
+    failed = scheduler.run(lines, features, predicted)
+    exit(1 if len(failed) > 0 else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import numpy as np
+
+# Material slots of the segmentation of create_segmentation in main_part1,
+# computed from the mesh arrays (foreach_get) instead of the edit mode operators.
+
+
+# material slot of each polygon, as given by selecting the vertex group of each part
+# in edit mode and assigning its slot (vertex_group_select + material_slot_assign):
+# a polygon gets the last part that contains all its vertices, slot 0 if there is none
+# loop_starts: (npolys,) first loop of each polygon, loop_verts: (nloops,) vertex of each loop
+def polygon_material_indices(loop_starts, loop_verts, nverts, vsegm, parts):
+    order = np.argsort(loop_starts)
+    indices = np.zeros(len(loop_starts), dtype=np.int32)
+    for islot, part in enumerate(parts):
+        in_part = np.zeros(nverts, dtype=bool)
+        in_part[vsegm[part]] = True
+        in_polygon = np.logical_and.reduceat(in_part[loop_verts], loop_starts[order])
+        indices[order[in_polygon]] = islot
+    return(indices)
@@ -0,0 +1,132 @@
+import sys
+from os.path import join
+import numpy as np
+
+sys.path.insert(0, ".")
+from smpl_math import batch_rodrigues
+from camera import project
+
+# Blender-free SMPL forward kinematics: the joint positions that get_bone_locs
+# reads from the posed armature, computed for all the frames of a clip at once.
+#
+# The armature is described by a rig exported once per gender from the FBX
+# (export_rig.py, saved as smpl_data/rig_<gender>.npz). Bones are indexed as
+# [root, bone_00, ..., bone_23] following part_match in main_part1:
+#   parents     (25,)        parent index, -1 for the root
+#   rest_rot    (25, 3, 3)   rotation of bone.matrix_local (armature space)
+#   rest_heads  (25, 3)      head of bone.matrix_local in the FBX rest pose
+#   locations   (25, 3)      pose_bone.location (only the pelvis is animated)
+#   matrix_world (4, 4)      arm_ob.matrix_world
+#   v_template  (R, 3)       basis shape key at the regression vertices
+#   shapedirs   (R, 3, S)    Shape%03d key offsets at the regression vertices
+#
+# usage (regenerate joints2D/joints3D of rendered clips, plain python):
+#   python smpl_fk.py [--write] <clip>_info.mat ...
+
+n_bones = 24
+
+
+def load_rig(path):
+    rig = np.load(path)
+    return({k: rig[k] for k in rig.files})
+
+
+# joint positions in rest pose for a body shape, as reset_joint_positions
+def regress_rest_joints(rig, shape, joint_regressor):
+    n_shapes = rig['shapedirs'].shape[-1]
+    verts = rig['v_template'] + rig['shapedirs'].dot(np.asarray(shape, dtype=np.float64)[:n_shapes])
+    return(np.asarray(joint_regressor.dot(verts)))
+
+
+def zrot_matrices(zrot, nframes):
+    zrot = np.broadcast_to(np.asarray(zrot, dtype=np.float64), (nframes,))
+    mats = np.zeros((nframes, 3, 3))
+    mats[:, 0, 0] = np.cos(zrot)
+    mats[:, 0, 1] = -np.sin(zrot)
+    mats[:, 1, 0] = np.sin(zrot)
+    mats[:, 1, 1] = np.cos(zrot)
+    mats[:, 2, 2] = 1.
+    return(mats)
+
+
+# world coordinates (N, 24, 3) of the bone heads for a clip
+# rest_joints: (24, 3) bone heads in rest pose (regress_rest_joints)
+# poses: (N, 72), trans: (N, 3), zrot: scalar or (N,) rotation of the root bone
+def forward_kinematics(rig, rest_joints, poses, trans, zrot):
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, n_bones, 3)
+    nframes = len(poses)
+
+    rest = np.tile(np.eye(4), (n_bones + 1, 1, 1))
+    rest[:, :3, :3] = rig['rest_rot']
+    rest[0, :3, 3] = rig['rest_heads'][0]
+    rest[1:, :3, 3] = rest_joints
+
+    # local transform of each bone: translation then rotation, as the pose channels
+    basis = np.tile(np.eye(4), (nframes, n_bones + 1, 1, 1))
+    basis[:, 0, :3, :3] = zrot_matrices(zrot, nframes)
+    basis[:, 1:, :3, :3] = batch_rodrigues(poses)
+    basis[:, :, :3, 3] = rig['locations']
+    basis[:, 1, :3, 3] = trans
+
+    # pose_mat = parent pose_mat * (parent rest)^-1 * rest * basis
+    pose_mats = np.empty_like(basis)
+    for ibone, iparent in enumerate(rig['parents']):
+        if iparent < 0:
+            pose_mats[:, ibone] = np.matmul(rest[ibone], basis[:, ibone])
+        else:
+            assert iparent < ibone, 'bones must be sorted parents first'
+            offset = np.linalg.inv(rest[iparent]).dot(rest[ibone])
+            pose_mats[:, ibone] = np.matmul(pose_mats[:, iparent], np.matmul(offset, basis[:, ibone]))
+
+    heads = pose_mats[:, 1:, :3, 3]
+    matrix_world = rig['matrix_world']
+    return(heads.dot(matrix_world[:3, :3].T) + matrix_world[:3, 3])
+
+
+# joints2D (N, 24, 2) in pixels and joints3D (N, 24, 3) in world coordinates
+# for a clip, with the values get_bone_locs returns after rendering each frame
+def clip_joints(rig, rest_joints, poses, trans, zrot, cam_loc, render_size):
+    joints3d = forward_kinematics(rig, rest_joints, poses, trans, zrot)
+    joints2d = project(joints3d, cam_loc, render_size)
+    return(joints2d, joints3d.astype(np.float32))
+
+
+# recompute the joints of a saved _info.mat (needs its trans and restShape fields)
+def info_joints(info, rigs, joint_regressor, render_size):
+    genders = {0: 'male', 1: 'female'}
+    rig = rigs[genders[int(np.ravel(info['gender'])[0])]]
+    rest_joints = regress_rest_joints(rig, np.ravel(info['restShape']), joint_regressor)
+    joints2d, joints3d = clip_joints(rig, rest_joints, np.asarray(info['pose']).T,
+                                     np.asarray(info['trans']).T, np.ravel(info['zrot']),
+                                     np.ravel(info['camLoc']), render_size)
+    return(joints2d.transpose(2, 1, 0).astype(np.float32), joints3d.transpose(2, 1, 0))
+
+
+if __name__ == '__main__':
+    import argparse
+    import scipy.io
+    import config
+    from smpl_store import open_smpl_data
+
+    parser = argparse.ArgumentParser(description='Recompute joints2D/joints3D of _info.mat files without Blender.')
+    parser.add_argument('--write', action='store_true',
+                        help='overwrite joints2D/joints3D in the files (default: only report the differences)')
+    parser.add_argument('info_files', nargs='+')
+    args = parser.parse_args()
+
+    params = config.load_file('config', 'SYNTH_DATA')
+    render_size = (params['resy'], params['resx'])
+    joint_regressor = open_smpl_data(params)['joint_regressor']
+    rigs = {gender: load_rig(join(params['smpl_data_folder'], 'rig_%s.npz' % gender))
+            for gender in ('male', 'female')}
+
+    for info_file in args.info_files:
+        info = scipy.io.loadmat(info_file)
+        joints2d, joints3d = info_joints(info, rigs, joint_regressor, render_size)
+        print("%s: max |joints2D| diff %.1f px, max |joints3D| diff %.2e" % (
+            info_file, np.abs(joints2d - info['joints2D']).max(), np.abs(joints3d - info['joints3D']).max()))
+        if args.write:
+            info = {k: v for k, v in info.items() if not k.startswith('__')}
+            info['joints2D'] = joints2d
+            info['joints3D'] = joints3d
+            scipy.io.savemat(info_file, info, do_compression=True)
@@ -0,0 +1,88 @@
+import numpy as np
+
+# Pose conversions of main_part1: Rodrigues and rodrigues2bshapes convert one
+# frame, the batch_ versions all the frames of a clip at once.
+
+
+# computes rotation matrix through Rodrigues formula as in cv2.Rodrigues
+# (the components of r are unpacked for the skew matrix, numpy >= 1.24 refuses
+# to build it from the (1,) rows of the (3, 1) vector)
+def Rodrigues(rotvec):
+    theta = np.linalg.norm(rotvec)
+    r = (rotvec/theta).reshape(3, 1) if theta > 0. else rotvec
+    cost = np.cos(theta)
+    rx, ry, rz = np.ravel(r)
+    mat = np.asarray([[0, -rz, ry],
+                      [rz, 0, -rx],
+                      [-ry, rx, 0]])
+    return(cost*np.eye(3) + (1-cost)*r.dot(r.T) + np.sin(theta)*mat)
+
+
+# transformation between pose and blendshapes
+def rodrigues2bshapes(pose):
+    rod_rots = np.asarray(pose).reshape(24, 3)
+    mat_rots = [Rodrigues(rod_rot) for rod_rot in rod_rots]
+
+    bshapes = np.concatenate([(mat_rot - np.eye(3)).ravel()
+                              for mat_rot in mat_rots[1:]])
+    return(mat_rots, bshapes)
+
+
+# computes rotation matrices through Rodrigues formula as Rodrigues
+# rotvecs: (..., 3) axis-angle vectors -> (..., 3, 3) rotation matrices
+def batch_rodrigues(rotvecs):
+    rotvecs = np.asarray(rotvecs, dtype=np.float64)
+    theta = np.linalg.norm(rotvecs, axis=-1)
+    # theta == 0 keeps the (zero) vector itself, which gives the identity
+    r = rotvecs / np.where(theta > 0., theta, 1.)[..., None]
+    cost = np.cos(theta)[..., None, None]
+    sint = np.sin(theta)[..., None, None]
+
+    rx, ry, rz = r[..., 0], r[..., 1], r[..., 2]
+    zeros = np.zeros_like(rx)
+    mat = np.stack([zeros, -rz, ry,
+                    rz, zeros, -rx,
+                    -ry, rx, zeros], axis=-1).reshape(r.shape[:-1] + (3, 3))
+    outer = r[..., :, None] * r[..., None, :]
+    return(cost*np.eye(3) + (1-cost)*outer + sint*mat)
+
+
+# rotation matrices to (w, x, y, z) quaternions with the same branches as
+# mathutils Matrix.to_quaternion, so the keyed values are the ones Blender computes
+# mats: (..., 3, 3) -> (..., 4)
+def rotmat2quat(mats):
+    mats = np.asarray(mats, dtype=np.float64)
+    m00, m01, m02 = mats[..., 0, 0], mats[..., 0, 1], mats[..., 0, 2]
+    m10, m11, m12 = mats[..., 1, 0], mats[..., 1, 1], mats[..., 1, 2]
+    m20, m21, m22 = mats[..., 2, 0], mats[..., 2, 1], mats[..., 2, 2]
+    quats = np.empty(mats.shape[:-2] + (4,))
+
+    tr = 0.25*(1. + m00 + m11 + m22)
+    is_tr = tr > 1e-4
+    is_x = ~is_tr & (m00 > m11) & (m00 > m22)
+    is_y = ~is_tr & ~is_x & (m11 > m22)
+    is_z = ~is_tr & ~is_x & ~is_y
+
+    # the sqrt arguments are clipped so that unused branches stay finite
+    s = np.sqrt(np.maximum(tr, 1e-12))
+    quats[is_tr] = np.stack([s, (m21 - m12)/(4*s), (m02 - m20)/(4*s), (m10 - m01)/(4*s)], axis=-1)[is_tr]
+    s = 2.*np.sqrt(np.maximum(1. + m00 - m11 - m22, 1e-12))
+    quats[is_x] = np.stack([(m21 - m12)/s, .25*s, (m01 + m10)/s, (m02 + m20)/s], axis=-1)[is_x]
+    s = 2.*np.sqrt(np.maximum(1. + m11 - m00 - m22, 1e-12))
+    quats[is_y] = np.stack([(m02 - m20)/s, (m01 + m10)/s, .25*s, (m12 + m21)/s], axis=-1)[is_y]
+    s = 2.*np.sqrt(np.maximum(1. + m22 - m00 - m11, 1e-12))
+    quats[is_z] = np.stack([(m10 - m01)/s, (m02 + m20)/s, (m12 + m21)/s, .25*s], axis=-1)[is_z]
+
+    return(quats / np.linalg.norm(quats, axis=-1)[..., None])
+
+
+# transformation between pose and blendshapes for a whole clip, as
+# rodrigues2bshapes applied to every frame
+# poses: (N, 72) -> rotation matrices (N, 24, 3, 3), quaternions (N, 24, 4)
+#                   and pose blendshape weights (N, 207)
+def batch_rodrigues2bshapes(poses):
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 24, 3)
+    mat_rots = batch_rodrigues(poses)
+    quats = rotmat2quat(mat_rots)
+    bshapes = (mat_rots[:, 1:] - np.eye(3)).reshape(len(poses), -1)
+    return(mat_rots, quats, bshapes)
@@ -0,0 +1,138 @@
+import sys
+import os
+import shutil
+import zipfile
+from os.path import join, exists, splitext
+import numpy as np
+
+# Indexed store of uncompressed .npy arrays converted once from smpl_data.npz.
+# Every array (pose_<name>, trans_<name>, maleshapes, femaleshapes,
+# regression_verts, joint_regressor, ...) is saved as its own <key>.npy file
+# so that a job opens only what it needs, memory-mapped and without copies.
+#
+# usage (one time, plain python):
+#   python smpl_store.py smpl_data/smpl_data.npz smpl_data/smpl_store
+
+INDEX_FILENAME = 'index.txt'
+
+
+def array_path(store_path, key):
+    return join(store_path, '%s.npy' % key)
+
+
+# convert the npz archive to a store directory, one array at a time so that
+# the whole 2.5 GB archive is never held in memory
+def convert(npz_path, store_path):
+    tmp_store_path = store_path.rstrip('/') + '.partial'
+    if exists(tmp_store_path):
+        shutil.rmtree(tmp_store_path)
+    os.makedirs(tmp_store_path)
+
+    smpl_data = np.load(npz_path)
+    keys = sorted(smpl_data.files)
+    with open(join(tmp_store_path, INDEX_FILENAME), 'w') as f:
+        f.write('# key\tdtype\tshape\n')
+        for ikey, key in enumerate(keys):
+            arr = smpl_data[key]
+            np.save(array_path(tmp_store_path, key), np.ascontiguousarray(arr))
+            f.write('%s\t%s\t%s\n' % (key, arr.dtype.str, ','.join(str(d) for d in arr.shape)))
+            if ikey % 500 == 0:
+                print("converted %d/%d arrays" % (ikey, len(keys)))
+
+    # only expose the store once it is complete
+    if exists(store_path):
+        shutil.rmtree(store_path)
+    os.rename(tmp_store_path, store_path)
+    print("converted %d arrays to %s" % (len(keys), store_path))
+
+
+# read-only view of a converted store, with the same access pattern as the
+# NpzFile returned by np.load (files, smpl_data[key], key in smpl_data)
+class SmplStore(object):
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._files = None
+
+    # the index is only parsed when the list of arrays is requested
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = []
+            with open(join(self.store_path, INDEX_FILENAME)) as f:
+                for line in f:
+                    if line.startswith('#'):
+                        continue
+                    self._files.append(line.rstrip('\n').split('\t')[0])
+        return self._files
+
+    def __contains__(self, key):
+        return exists(array_path(self.store_path, key))
+
+    # copy-on-write mapping: no data is read until it is touched, and in-place
+    # updates by the caller (e.g. noise added to a shape) never reach the file
+    def __getitem__(self, key):
+        path = array_path(self.store_path, key)
+        if not exists(path):
+            raise KeyError('%s is not in the store %s' % (key, self.store_path))
+        return np.load(path, mmap_mode='c')
+
+
+def store_path_from_params(params):
+    store_dirname = params.get('smpl_store_dirname')
+    if not store_dirname:
+        return None
+    return join(params['smpl_data_folder'], store_dirname)
+
+
+# open the body data: the converted store if it exists, the npz otherwise
+def open_smpl_data(params):
+    store_path = store_path_from_params(params)
+    if store_path is not None and exists(join(store_path, INDEX_FILENAME)):
+        return SmplStore(store_path)
+    return np.load(join(params['smpl_data_folder'], params['smpl_data_filename']))
+
+
+# direct lookup of one sequence, works for both the store and the npz
+def load_sequence(smpl_data, name):
+    return {'poses': smpl_data['pose_' + name],
+            'trans': smpl_data['trans_' + name]}
+
+
+# read the shape of every array in an npz from the .npy headers only: each
+# member is opened as a stream and only its first bytes are decompressed.
+# returns {key: (shape, crc, file_size)}; members whose (crc, file_size) match
+# the optional cache {key: (shape, crc, file_size)} are not opened at all
+def npz_shapes(npz_path, prefix='', cache=None):
+    shapes = {}
+    with zipfile.ZipFile(npz_path) as zf:
+        for info in zf.infolist():
+            if not info.filename.endswith('.npy'):
+                continue
+            key = info.filename[:-len('.npy')]
+            if not key.startswith(prefix):
+                continue
+            if cache is not None and key in cache and cache[key][1:] == (info.CRC, info.file_size):
+                shapes[key] = cache[key]
+                continue
+            fp = zf.open(info)
+            try:
+                version = np.lib.format.read_magic(fp)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+            finally:
+                fp.close()
+            shapes[key] = (shape, info.CRC, info.file_size)
+    return shapes
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: python smpl_store.py <smpl_data.npz> <store directory>")
+        exit(1)
+    npz_path, store_path = sys.argv[1:3]
+    if splitext(npz_path)[1] != '.npz':
+        print("ERROR: expected a .npz file, got %s" % npz_path)
+        exit(1)
+    convert(npz_path, store_path)
@@ -0,0 +1,5 @@
+import sys
+from os.path import dirname, realpath
+
+# the modules of datageneration are imported as in its scripts, from the folder itself
+sys.path.insert(0, dirname(dirname(realpath(__file__))))
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from clip_io import clip_writer, ClipReader, exr_passes
+from pass_codecs import encode, decode, pass_codecs
+
+
+# frames as decoded by main_part2: a foreground blob over the Cycles background
+def clip_frames(nframes=5, shape=(18, 32), seed=0):
+    rng = np.random.RandomState(seed)
+    frames = []
+    for iframe in range(nframes):
+        fg = np.zeros(shape, dtype=bool)
+        fg[4:14, 8 + iframe:20 + iframe] = True
+        normal = np.where(fg[..., None], rng.uniform(-1, 1, shape + (3,)), 0).astype(np.float32)
+        frames.append({'normal': normal,
+                       'gtflow': rng.normal(0, 1, shape + (2,)).astype(np.float32),
+                       'depth': np.where(fg, rng.uniform(4, 6, shape), 1e10).astype(np.float32),
+                       'segm': np.where(fg, rng.randint(1, 25, shape), 0).astype(np.uint8)})
+    return(frames)
+
+
+def write_clip(backend, clip_prefix, frames, encoding):
+    writer = clip_writer(backend, clip_prefix, len(frames), encoding)
+    for iframe, mats in enumerate(frames):
+        writer.write_frame(iframe, mats)
+    writer.close()
+
+
+def check_roundtrip(clip_prefix, frames, encoding):
+    reader = ClipReader(clip_prefix)
+    assert reader.passes() == list(exr_passes)
+    for k in exr_passes:
+        assert reader.nframes(k) == len(frames)
+        expected = np.stack([mats[k] for mats in frames])
+        if encoding == 'compact' and k == 'normal':
+            np.testing.assert_allclose(reader.frames(k), expected, atol=1e-3)
+            np.testing.assert_allclose(reader.frame(k, 2), expected[2], atol=1e-3)
+        else:
+            np.testing.assert_array_equal(reader.frames(k), expected)
+            np.testing.assert_array_equal(reader.frame(k, 2), expected[2])
+        assert reader.frame(k, 0).dtype == expected.dtype
+    reader.close()
+
+
+@pytest.mark.parametrize('encoding', ['dense', 'compact'])
+def test_mat_roundtrip(tmpdir, encoding):
+    clip_prefix = str(tmpdir.join('02_01_c0001'))
+    frames = clip_frames()
+    write_clip('mat', clip_prefix, frames, encoding)
+    check_roundtrip(clip_prefix, frames, encoding)
+
+
+@pytest.mark.parametrize('encoding', ['dense', 'compact'])
+def test_hdf5_roundtrip(tmpdir, encoding):
+    pytest.importorskip('h5py')
+    clip_prefix = str(tmpdir.join('02_01_c0001'))
+    frames = clip_frames()
+    write_clip('hdf5', clip_prefix, frames, encoding)
+    assert not tmpdir.join('02_01_c0001.h5.tmp').exists()
+    check_roundtrip(clip_prefix, frames, encoding)
+
+
+def test_missing_frame(tmpdir):
+    clip_prefix = str(tmpdir.join('02_01_c0001'))
+    write_clip('mat', clip_prefix, clip_frames(2), 'compact')
+    with pytest.raises(KeyError):
+        ClipReader(clip_prefix).frame('normal', 5)
+
+
+def test_unknown_backend_or_encoding(tmpdir):
+    with pytest.raises(ValueError):
+        clip_writer('npz', str(tmpdir.join('clip')), 1)
+    with pytest.raises(ValueError):
+        clip_writer('mat', str(tmpdir.join('clip')), 1, 'rle')
+
+
+def test_codec_roundtrip():
+    normal = clip_frames(1)[0]['normal']
+    for k in pass_codecs:
+        fields = encode(k, normal)
+        assert all(arr.ndim == 1 for arr in fields.values())
+        decoded = decode(pass_codecs[k], fields, normal.shape)
+        assert decoded.dtype == np.float32
+        np.testing.assert_array_equal(decoded, normal.astype(np.float16).astype(np.float32))
+        # the background normals are decoded as exact zeros
+        assert (decoded[np.all(normal == 0, axis=-1)] == 0).all()
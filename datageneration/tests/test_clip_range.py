@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from clip_range import sequence_cuts, cut_sequence, clip_range, clip_nframes, sequence_dirname, job_dirname
+
+
+# frames of a clip as main_part1 gets them: cut the sequence, then slice it
+def sliced_nframes(name, nb_frames, ishape, stepsize, stride, clipsize):
+    data = cut_sequence(name, {'poses': np.arange(nb_frames), 'trans': np.arange(nb_frames)})
+    fbegin = ishape*stepsize*stride
+    fend = min(ishape*stepsize*stride + stepsize*clipsize, len(data['poses']))
+    return(len(data['poses'][fbegin:fend:stepsize]))
+
+
+@pytest.mark.parametrize('name', sorted(sequence_cuts) + ['02_01', 'ung_1_01'])
+def test_clip_nframes_matches_the_cut_sequence(name):
+    for nb_frames in (150, 1203, 2999):
+        for stride in (30, 50, 70):
+            for ishape in range(12):
+                assert clip_nframes(name, nb_frames, ishape, 4, stride, 220) == \
+                    sliced_nframes(name, nb_frames, ishape, 4, stride, 220)
+
+
+def test_cut_sequence_keeps_poses_and_trans_aligned():
+    data = cut_sequence('ung_91_57', {'poses': np.arange(1000), 'trans': np.arange(1000) + 5})
+    assert len(data['poses']) == 500 and data['poses'][0] == 250
+    np.testing.assert_array_equal(data['trans'] - data['poses'], 5)
+
+
+def test_clip_range():
+    assert clip_range(1000, 0, 4, 50, 220) == (0, 880)
+    assert clip_range(1000, 2, 4, 50, 220) == (400, 1000)
+
+
+def test_sequence_dirname():
+    assert sequence_dirname('02 01') == '0201'
+    assert sequence_dirname('02_01', 'forward') == '02_01_f'
+    assert sequence_dirname('02_01', 'backward') == '02_01_b'
+
+
+def test_job_dirname():
+    assert job_dirname('02_01', 'backward', {}) == '02_01'
+    assert job_dirname('02_01', 'backward', {'direction_folders': False}) == '02_01'
+    assert job_dirname('02_01', 'backward', {'direction_folders': True}) == '02_01_b'
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from cost_model import CostModel, job_work, makespan
+
+
+def timing(frames, seconds, phase='render', code=0, **kwargs):
+    entry = {'phase': phase, 'code': code, 'seconds': seconds,
+             'features': {'frames': frames, 'passes': 4, 'pixels': 57600}}
+    entry.update(kwargs)
+    return(entry)
+
+
+def test_fit_recovers_the_linear_model():
+    timings = [timing(frames, 30. + 2.*job_work({'frames': frames, 'passes': 4, 'pixels': 57600}))
+               for frames in (20, 55, 40, 10)]
+    # failed, skipped and featureless processes are not fitted
+    timings += [timing(55, 5000., code=1), timing(55, 1., skipped=True), dict(timing(30, 1.), features=None)]
+    model = CostModel.fit(timings)
+    intercept, slope = model.coefs['render']
+    assert intercept == pytest.approx(30.)
+    assert slope == pytest.approx(2.)
+    assert model.ntimings['render'] == 4
+    features = {'frames': 30, 'passes': 4, 'pixels': 57600}
+    assert model.predict(features, 'render') == pytest.approx(30. + 2.*job_work(features))
+
+
+def test_unfitted_phase_costs_the_work():
+    model = CostModel.fit([timing(55, 100.), timing(55, 120.), timing(20, 10., phase='part2')])
+    # a single work value (render) or a single timing (part2) is not enough to fit
+    assert model.coefs == {}
+    features = {'frames': 55, 'passes': 4, 'pixels': 57600}
+    assert model.predict(features, 'render') == job_work(features)
+    assert 'not fitted' in model.describe()
+
+
+def test_no_dependence_on_the_work():
+    model = CostModel.fit([timing(20, 100.), timing(55, 90.), timing(40, 95.)])
+    intercept, slope = model.coefs['render']
+    assert slope > 0 and intercept >= 0
+
+
+def test_makespan():
+    assert makespan([5., 3., 2.], 1) == 10.
+    assert makespan([5., 3., 2.], 2) == 5.
+    assert makespan([2., 3., 5.], 2) == 7.
+    assert makespan([], 3) == 0.
+    np.testing.assert_allclose(makespan([1.] * 10, 4), 3.)
+    for workers in (0, -1):
+        with pytest.raises(ValueError):
+            makespan([5., 3.], workers)
@@ -0,0 +1,31 @@
+import threading
+
+from finalize import TaskGroup
+
+
+def test_one_worker_runs_the_tasks_in_order_in_the_calling_thread():
+    calls = []
+    group = TaskGroup(workers=1, log=lambda message: None)
+    for name in ('video', 'archive', 'info'):
+        group.add(name, lambda name=name: calls.append((name, threading.current_thread().name)))
+    codes = group.run()
+    assert codes == {'video': 0, 'archive': 0, 'info': 0}
+    assert calls == [(name, threading.current_thread().name) for name in ('video', 'archive', 'info')]
+
+
+def test_dependencies_and_exit_codes():
+    calls = []
+
+    def fail():
+        raise RuntimeError('failed task')
+
+    for workers in (1, 3):
+        del calls[:]
+        group = TaskGroup(workers=workers, log=lambda message: None)
+        group.add('rgb', lambda: calls.append('rgb'))
+        group.add('fail', fail)
+        group.add('code', lambda: 2)
+        group.add('archive', lambda: calls.append('archive'), deps=('rgb',))
+        codes = group.run()
+        assert codes == {'rgb': 0, 'fail': -1, 'code': 2, 'archive': 0}
+        assert calls.index('rgb') < calls.index('archive')
@@ -0,0 +1,68 @@
+import pytest
+
+from job_plan import plan_jobs, shard_jobs, parse_shard, job_line, job_args, job_frames, sequence_nb_ishape
+
+idx_info = [{'name': '02_01', 'nb_frames': 1200, 'use_split': 'train'},
+            {'name': 'ung_47_01', 'nb_frames': 600, 'use_split': 'test'},
+            {'name': 'ung_91_57', 'nb_frames': 3000, 'use_split': 'train'},
+            {'name': '10_04', 'nb_frames': 150, 'use_split': 'train'}]
+
+
+def all_jobs(**kwargs):
+    return(list(plan_jobs(idx_info, (50, 30), ('forward', 'backward'), 4, 220, **kwargs)))
+
+
+def test_plan_jobs():
+    jobs = all_jobs()
+    assert len(set(jobs)) == len(jobs)
+    assert all(job.nb_frames > 0 for job in jobs)
+    # idx: index of the sequence plus runpass * len(idx_info)
+    assert set(job.idx for job in jobs if job.stride == 30) == set(range(4, 8))
+    for job in jobs:
+        assert idx_info[job.idx % len(idx_info)]['name'] == job.name
+        assert job.ishape < sequence_nb_ishape(idx_info[job.idx % len(idx_info)]['nb_frames'], job.stride, 220)
+
+
+def test_filters_keep_the_jobs():
+    jobs = all_jobs()
+    assert all_jobs(names=['ung_*']) == [job for job in jobs if job.name.startswith('ung_')]
+    assert all_jobs(splits=['test']) == [job for job in jobs if job.name == 'ung_47_01']
+    assert all_jobs(first_clip=True) == [job for job in jobs if job.ishape == 0]
+
+
+def test_job_line():
+    job = all_jobs()[3]
+    args = job_args(job_line(job))
+    assert args == {'--idx': str(job.idx), '--name': job.name, '--ishape': str(job.ishape),
+                    '--stride': str(job.stride), '--subject_id': str(job.subject_id), '--direction': job.direction}
+
+
+def test_parse_shard():
+    assert parse_shard('3/8') == (3, 8)
+    for shard in ('8/8', '-1/8'):
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+@pytest.mark.parametrize('cost', [None, job_frames])
+def test_shards_partition_the_jobs(cost):
+    jobs = all_jobs()
+    shards = [list(shard_jobs(iter(jobs), k, 3, cost=cost)) for k in range(3)]
+    assert sorted(job for shard in shards for job in shard) == sorted(jobs)
+    for shard in shards:
+        # in plan order, and the same on every node
+        assert shard == sorted(shard, key=jobs.index)
+        assert shard == list(shard_jobs(iter(jobs), shards.index(shard), 3, cost=cost))
+    if cost is None:
+        assert shards[1] == jobs[1::3]
+    else:
+        loads = [sum(job_frames(job) for job in shard) for shard in shards]
+        assert max(loads) - min(loads) <= max(job_frames(job) for job in jobs)
+
+
+def test_filtering_directions_keeps_the_subject_ids():
+    jobs = all_jobs()
+    for directions in (('forward',), ('backward',)):
+        filtered = list(plan_jobs(idx_info, (50, 30), directions, 4, 220))
+        assert filtered == [job for job in jobs if job.direction in directions]
+    assert all(job.subject_id == 2*(job.idx % len(idx_info)) + (job.direction == 'backward') for job in jobs)
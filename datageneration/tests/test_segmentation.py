@@ -0,0 +1,54 @@
+import numpy as np
+
+from segmentation import polygon_material_indices
+
+
+# per-polygon version of the edit mode assignment: for each part, in slot order,
+# the polygons whose vertices are all in its vertex group are given its slot
+def polygon_material_indices_loop(polygons, vsegm, parts):
+    indices = [0] * len(polygons)
+    for islot, part in enumerate(parts):
+        selected = set(vsegm[part])
+        for ipoly, verts in enumerate(polygons):
+            if all(v in selected for v in verts):
+                indices[ipoly] = islot
+    return(np.array(indices, dtype=np.int32))
+
+
+# triangles and quads over nverts vertices, with their loops stored in a shuffled
+# polygon order as in a mesh edited after its creation
+def synthetic_mesh(npolys, nverts, rng):
+    polygons = [rng.choice(nverts, size=rng.choice([3, 4]), replace=False) for _ in range(npolys)]
+    loop_starts = np.empty(npolys, dtype=np.int32)
+    loop_verts = []
+    for ipoly in rng.permutation(npolys):
+        loop_starts[ipoly] = len(loop_verts)
+        loop_verts.extend(polygons[ipoly])
+    return(polygons, loop_starts, np.array(loop_verts, dtype=np.int32))
+
+
+def test_matches_per_polygon_assignment():
+    rng = np.random.RandomState(0)
+    nverts = 60
+    polygons, loop_starts, loop_verts = synthetic_mesh(200, nverts, rng)
+    # overlapping vertex groups (as segm_per_v_overlap.pkl), one empty, vertices in none
+    vsegm = {'head': list(range(0, 25)), 'leftArm': list(range(20, 45)), 'rightArm': list(range(40, 55)),
+             'spine': [], 'hips': list(rng.choice(nverts, 30, replace=False))}
+    parts = sorted(vsegm.keys())
+    indices = polygon_material_indices(loop_starts, loop_verts, nverts, vsegm, parts)
+    expected = polygon_material_indices_loop(polygons, vsegm, parts)
+    assert indices.dtype == np.int32
+    np.testing.assert_array_equal(indices, expected)
+    # the overlaps are resolved by the later slots, and some polygons are in no part
+    assert len(set(expected)) > 2 and (expected == 0).any()
+
+
+def test_polygon_in_no_part_keeps_slot_zero():
+    loop_starts = np.array([0, 3], dtype=np.int32)
+    loop_verts = np.array([0, 1, 2, 2, 3, 4], dtype=np.int32)
+    vsegm = {'a': [0, 1, 2], 'b': [3, 4]}
+    indices = polygon_material_indices(loop_starts, loop_verts, 5, vsegm, ['a', 'b'])
+    np.testing.assert_array_equal(indices, [0, 0])
+    vsegm['b'] = [2, 3, 4]
+    indices = polygon_material_indices(loop_starts, loop_verts, 5, vsegm, ['b', 'a'])
+    np.testing.assert_array_equal(indices, [1, 0])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from smpl_math import Rodrigues, rodrigues2bshapes, batch_rodrigues, batch_rodrigues2bshapes
+
+
+def quat2rotmat(q):
+    w, x, y, z = q
+    return(np.array([[1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)],
+                     [2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)],
+                     [2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)]]))
+
+
+def clip_poses(nframes=40, seed=0):
+    rng = np.random.RandomState(seed)
+    poses = rng.normal(0, .5, (nframes, 72))
+    poses[0] = 0.
+    poses[::7, 3:6] = 0.
+    poses[1::5, 6:9] = [1e-12, 0., 0.]
+    poses[2::5, 9:12] = [0., -1e-7, 1e-7]
+    poses[3::11, 12:15] = [np.pi - 1e-3, 0., 0.]
+    return(poses)
+
+
+@pytest.mark.parametrize('rotvec', [[0., 0., 0.], [1e-12, 0., 0.], [0., -1e-7, 1e-7], [1e-4, 2e-4, -3e-4],
+                                    [.3, -.2, .5], [np.pi - 1e-3, 0., 0.], [0., 2., -2.]])
+def test_batch_rodrigues_matches_rodrigues(rotvec):
+    rotvec = np.array(rotvec)
+    np.testing.assert_allclose(batch_rodrigues(rotvec), Rodrigues(rotvec), rtol=0, atol=1e-12)
+
+
+def test_zero_rotation_is_identity():
+    np.testing.assert_array_equal(batch_rodrigues(np.zeros((5, 3))), np.tile(np.eye(3), (5, 1, 1)))
+
+
+def test_batch_rodrigues2bshapes_matches_per_frame():
+    poses = clip_poses()
+    mat_rots, quats, bshapes = batch_rodrigues2bshapes(poses)
+    assert mat_rots.shape == (len(poses), 24, 3, 3)
+    assert quats.shape == (len(poses), 24, 4)
+    assert bshapes.shape == (len(poses), 207)
+    for iframe, pose in enumerate(poses):
+        ref_rots, ref_bshapes = rodrigues2bshapes(pose)
+        np.testing.assert_allclose(mat_rots[iframe], np.array(ref_rots), rtol=0, atol=1e-12)
+        np.testing.assert_allclose(bshapes[iframe], ref_bshapes, rtol=0, atol=1e-12)
+
+
+def test_quaternions_give_back_the_rotations():
+    poses = clip_poses()
+    mat_rots, quats, _ = batch_rodrigues2bshapes(poses)
+    np.testing.assert_allclose(np.linalg.norm(quats, axis=-1), 1., atol=1e-12)
+    for mat, quat in zip(mat_rots.reshape(-1, 3, 3), quats.reshape(-1, 4)):
+        np.testing.assert_allclose(quat2rotmat(quat), mat, atol=1e-9)
+    # the identity of the zero rotations is (1, 0, 0, 0), as Matrix.to_quaternion
+    np.testing.assert_array_equal(quats[0], np.tile([1., 0., 0., 0.], (24, 1)))
@@ -0,0 +1,70 @@
+import subprocess
+from os.path import join
+
+# Videos of a clip encoded while it renders: one ffmpeg process per video
+# (rgb, vblur, fg) is started before the first frame and each PNG is piped to
+# its stdin (image2pipe) as soon as the frame is written, so the encodes
+# overlap the rendering and run in parallel. Used by main_part1 with
+# stream_videos = True in config, otherwise finalize_clip encodes the PNGs of
+# the tmp folder once the clip is rendered.
+
+# extra ffmpeg arguments and filename suffix of each video, as in finalize_clip
+video_args = {'rgb': [], 'vblur': ['-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2'], 'fg': []}
+video_suffixes = {'rgb': '', 'vblur': '_vblur', 'fg': '_fg'}
+
+
+def print_message(message):
+    print(message)
+
+
+def video_path(output_path, name, ishape, k):
+    return('%s_c%04d.mp4' % (join(output_path, name.replace(' ', '') + video_suffixes[k]), (ishape + 1)))
+
+
+class VideoStream(object):
+    def __init__(self, path, extra_args=(), fps=25, log=print_message):
+        self.path = path
+        self.log = log
+        self.failed = False
+        cmd = ['ffmpeg', '-y', '-r', str(fps), '-f', 'image2pipe', '-c:v', 'png', '-i', '-',
+               '-c:v', 'h264', '-pix_fmt', 'yuv420p', '-crf', '23'] + list(extra_args) + [path]
+        log("Streaming video (%s)" % ' '.join(cmd))
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    # pipe one encoded frame; blocks while ffmpeg is behind
+    def write_file(self, png_path):
+        if self.failed:
+            return
+        try:
+            with open(png_path, 'rb') as f:
+                self.proc.stdin.write(f.read())
+        except (IOError, OSError) as e:
+            self.failed = True
+            self.log("WARNING: video stream %s stopped at %s (%s)" % (self.path, png_path, e))
+
+    # end of the stream, returns the exit code of ffmpeg
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        returncode = self.proc.wait()
+        if returncode != 0 or self.failed:
+            self.log("WARNING: ffmpeg exited with %d for %s" % (returncode, self.path))
+        return(returncode)
+
+
+# one stream per video of the clip: rgb, and vblur/fg if they are in output_types
+def open_clip_streams(output_path, name, ishape, output_types, log=print_message):
+    return({k: VideoStream(video_path(output_path, name, ishape, k), video_args[k], log=log)
+            for k in ('rgb', 'vblur', 'fg') if k == 'rgb' or output_types[k]})
+
+
+# frame_dirs: folder of the PNGs of each video
+def write_clip_frame(streams, frame_dirs, frame):
+    for k, stream in streams.items():
+        stream.write_file(join(frame_dirs[k], 'Image%04d.png' % frame))
+
+
+def close_clip_streams(streams):
+    return({k: stream.close() for k, stream in streams.items()})